@@ -16,16 +16,45 @@ Version: 1.1.0
 """
 
 import os
+import posixpath
 import sys
 import argparse
+import ast
+import asyncio
+import contextlib
+import gzip
+import io
 import json
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field, fields, asdict
 from typing import List, Dict, Optional, Tuple
 from pathlib import Path
-from collections import defaultdict
+from collections import defaultdict, deque
+from functools import lru_cache
 import time
 import fnmatch
+import re
+import struct
+import hashlib
+import mmap
+import heapq
+import select
+import shutil
+import subprocess
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from html import escape as html_escape
+
+try:
+    import sqlite3
+except ImportError:  # 部分精简版 Python 未编译 sqlite3
+    sqlite3 = None
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    zstd = None
 
 # ============================================================================
 # 版本信息
@@ -43,8 +72,10 @@ DEFAULT_CONFIG = {
     # 输出设置
     "output": {
         "dir": "codemetrics_output",      # 输出目录名
-        "formats": ["terminal", "json", "markdown", "html"],  # 输出格式
+        "formats": ["terminal", "json", "markdown", "html", "snapshot"],  # 输出格式
         "auto_open": False,              # 是否自动打开 HTML 报告
+        "json_compression": None,        # None / "gzip" / "zstd"（无 zstd 时退回 gzip）
+        "parallel": True,                # 多种报告格式在线程中并行生成
     },
     
     # 排除规则
@@ -72,6 +103,26 @@ DEFAULT_CONFIG = {
         ],
     },
     
+    # 增量扫描缓存
+    "cache": {
+        "enabled": True,
+        "filename": ".scan_cache.db",    # 位于输出目录下
+        "max_entries": 1000000,          # 超出后淘汰本次未出现的（已删除）文件
+    },
+    
+    # 扫描设置
+    "scan": {
+        "mmap_threshold_mb": 32,         # 不小于该大小的文件用 mmap 分块统计
+        "analyze": False,                # 计算圈复杂度并提取依赖（--analyze 开启，远慢于行数统计）
+        "analyze_max_kb": 512,           # 超过该大小的文件不计算圈复杂度、不提取依赖
+    },
+    
+    # 监视模式 (--watch)
+    "watch": {
+        "debounce_seconds": 1.0,         # 最后一次变化后静默多久才刷新报告
+        "poll_interval_seconds": 5.0,    # 无 inotify 时的轮询间隔
+    },
+    
     # COCOMO 设置
     "cocomo": {
         "project_type": "semi-detached",  # organic / semi-detached / embedded
@@ -338,6 +389,12 @@ class FileStats:
     code_lines: int
     comment_lines: int
     blank_lines: int
+    digest: str = ''        # 内容哈希 (Git blob SHA)，用于重复文件检测
+    functions: int = 0      # 函数数（仅支持圈复杂度分析的语言）
+    complexity: int = 0     # 各函数圈复杂度之和
+    max_complexity: int = 0 # 最复杂函数的圈复杂度
+    # 依赖记号（import / #include，见 analyze_source），只在扫描结果和缓存中携带，不进入 FileTable
+    imports: Tuple[str, ...] = field(default=(), repr=False)
 
 @dataclass
 class DirStats:
@@ -351,7 +408,37 @@ class DirStats:
     code_lines: int = 0
     comment_lines: int = 0
     blank_lines: int = 0
+    # 有 table 时只含子目录 DirStats（文件见 rows），否则为子目录 DirStats 和 FileStats
     children: List = field(default_factory=list)
+    # 文件行所在的列式存储；子树中的文件在表中连续存放，行号范围为 rows
+    table: Optional['FileTable'] = field(default=None, repr=False, compare=False)
+    rows: range = field(default=range(0), repr=False, compare=False)
+    # 仅根目录：组装目录树时同一遍累计的汇总（语言统计、文件索引、Top N、健康度）
+    summary: Optional['ScanSummary'] = field(default=None, repr=False, compare=False)
+    
+    def iter_children(self):
+        """
+        按顺序产出子目录和文件，文件行按需生成 FileStats 视图
+        
+        rows 中不属于任何子目录的行即本目录下的文件；子目录都含有文件，其行号
+        范围的起点就是它在文件之间的位置。
+        """
+        table = self.table
+        if table is None:
+            yield from self.children
+            return
+        row = self.rows.start
+        for child in self.children:
+            yield from table.iter_rows(range(row, child.rows.start))
+            yield child
+            row = child.rows.stop
+        yield from table.iter_rows(range(row, self.rows.stop))
+    
+    def iter_files(self):
+        """子树中的所有文件（按目录树顺序）"""
+        if self.table is not None:
+            return self.table.iter_rows(self.rows)
+        return iter_files(self)
 
 @dataclass  
 class LanguageStats:
@@ -367,8 +454,28 @@ class LanguageStats:
 # ============================================================================
 # 核心功能
 # ============================================================================
-def detect_language(file_path: str) -> str:
-    """检测文件的编程语言"""
+# 二进制探测时读取的文件头长度
+SNIFF_SIZE = 1024
+
+
+def read_first_line(data: bytes) -> str:
+    """从缓冲区中取出第一行（按通用换行符 \n / \r 切分）"""
+    end = len(data)
+    for sep in (b'\n', b'\r'):
+        idx = data.find(sep, 0, end)
+        if idx != -1:
+            end = idx
+    return data[:end].decode('utf-8', errors='ignore')
+
+
+def detect_language(file_path: str, head: Optional[bytes] = None) -> str:
+    """
+    检测文件的编程语言
+    
+    Args:
+        file_path: 文件路径
+        head: 已读取的文件开头内容，提供时不再打开文件
+    """
     name = os.path.basename(file_path)
     
     # 检查特殊文件名
@@ -381,98 +488,709 @@ def detect_language(file_path: str) -> str:
         return LANGUAGE_EXTENSIONS[ext]
     
     # 检查 shebang
-    try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            first_line = f.readline()
-            if first_line.startswith('#!'):
-                if 'python' in first_line:
-                    return 'Python'
-                elif 'bash' in first_line or 'sh' in first_line:
-                    return 'Shell'
-                elif 'ruby' in first_line:
-                    return 'Ruby'
-                elif 'perl' in first_line:
-                    return 'Perl'
-                elif 'node' in first_line:
-                    return 'JavaScript'
-    except:
-        pass
+    if head is None:
+        try:
+            with open(file_path, 'rb') as f:
+                head = f.readline()
+        except OSError:
+            return 'Unknown'
+    
+    first_line = read_first_line(head)
+    if first_line.startswith('#!'):
+        if 'python' in first_line:
+            return 'Python'
+        elif 'bash' in first_line or 'sh' in first_line:
+            return 'Shell'
+        elif 'ruby' in first_line:
+            return 'Ruby'
+        elif 'perl' in first_line:
+            return 'Perl'
+        elif 'node' in first_line:
+            return 'JavaScript'
     
     return 'Unknown'
 
 
-def count_lines(file_path: str, language: str) -> Tuple[int, int, int, int]:
+# 行内空白：str.strip() 会去掉的 ASCII 空白字符中除换行符以外的部分
+# （bytes.strip() 不含 \x1c-\x1f，因此 bytes 一律显式传入 _ASCII_SPACE）
+_INLINE_SPACE = b' \t\x0b\x0c\x1c\x1d\x1e\x1f'
+_ASCII_SPACE = _INLINE_SPACE + b'\r\n'
+
+# 删除行内空白后的空行：其后紧跟换行符或位于末尾的换行符
+_EMPTY_LINE = re.compile(rb'\n(?![^\n])')
+
+
+@lru_cache(maxsize=None)
+def _line_patterns(line_token: Optional[str], binary: bool):
     """
-    统计文件行数
+    逐行计数用的多行正则: (空行, 以行注释符开头的行)
     
-    Returns:
-        (total_lines, code_lines, comment_lines, blank_lines)
+    以每行前导的 \n 定位，空白与 str.strip() 一致；binary 为 True 时用于 bytes。
+    """
+    if binary:
+        space = rb'\n[ \t\x0b\x0c\x1c-\x1f]*'
+        token = re.escape(line_token.encode('ascii')) if line_token else None
+        blank = re.compile(space + rb'(?![^\n])')
+    else:
+        space = r'\n[^\S\n]*'
+        token = re.escape(line_token) if line_token else None
+        blank = re.compile(space + r'(?![^\n])')
+    return blank, re.compile(space + token) if token else None
+
+
+@lru_cache(maxsize=None)
+def _split_token_pattern(line_token: Optional[str]):
+    """
+    匹配被行内空白隔开的多字符行注释符（如 "/ /"）的 bytes 正则
+    
+    删除空白后会拼出新的行注释符，此时不能按删除空白后的内容计数；单字符
+    记号不会出现这种情况，返回 None。
     """
-    style = COMMENT_STYLES.get(language, DEFAULT_COMMENT_STYLE)
+    if not line_token or len(line_token) < 2:
+        return None
+    space = rb'[ \t\x0b\x0c\x1c-\x1f]'
+    chars = [re.escape(c.encode('ascii')) for c in line_token]
+    alternatives = [
+        b''.join((space + (b'+' if i == gap else b'*') if i else b'') + c for i, c in enumerate(chars))
+        for gap in range(1, len(chars))
+    ]
+    return re.compile(b'|'.join(alternatives))
+
+
+class LineClassifier:
+    """
+    行分类器（代码行 / 注释行 / 空行）
     
-    total = 0
-    code = 0
-    comment = 0
-    blank = 0
-    in_block_comment = False
+    行数、空行和以行注释符开头的行在整块内容上批量统计，不逐行循环：通常的
+    内容（见 _normalize_newlines）直接以 bytes 处理、无需解码，删除行内空白
+    （translate）后用 count() 和一个正则计数；其余内容解码为 str，用多行正则计数。
     
-    try:
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            for line in f:
-                total += 1
-                stripped = line.strip()
-                
-                # 空行
-                if not stripped:
-                    blank += 1
-                    continue
-                
-                # 块注释处理
-                if in_block_comment:
+    块注释的状态机只处理包含起始符的行：用 find() 依次定位起始符，逐行判断后
+    修正批量结果；进入块注释后直接定位结束符，其间各行整体改记为注释行。
+    起始符与结束符相同（Python 的 \"\"\"）时原判断不会进入块注释，结果与只按行注释
+    统计相同，不需要修正。统计结果与原逐行判断完全一致。
+    
+    平均每 DENSE_BLOCK_SPAN 字节（约 20 行）就有一个起始符时（如大量文档注释的 C
+    头文件），逐行修正比原来的逐行循环更慢，这类内容整体改用单遍逐行判断
+    （_feed_lines）。
+    
+    可多次调用 feed() 分块输入，块注释状态在各块之间延续。
+    """
+    
+    DENSE_BLOCK_SPAN = 640
+    
+    def __init__(self, language: str):
+        style = COMMENT_STYLES.get(language, DEFAULT_COMMENT_STYLE)
+        self.line_token = style['line'] or None
+        self.block_start = style['block_start'] or None
+        self.block_end = style['block_end'] or None
+        
+        self.total = 0
+        self.code = 0
+        self.comment = 0
+        self.blank = 0
+        self.in_block_comment = False
+    
+    def counts(self) -> Tuple[int, int, int, int]:
+        return self.total, self.code, self.comment, self.blank
+    
+    def _feed_lines(self, text):
+        """
+        单遍逐行统计（块注释起始符密集的内容）
+        
+        切分、strip 与空行计数整体完成，循环只遍历非空行；strip 后的行首尾都不是
+        空白，“注释前/后没有代码”直接比较分隔符的位置即可。
+        """
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')  # 见 _normalize_newlines：解码不会丢弃字节
+        stripped = list(map(str.strip, text.split('\n')))
+        if text.endswith('\n'):
+            stripped.pop()
+        blank = stripped.count('')
+        
+        line_token = self.line_token
+        block_start = self.block_start
+        block_end = self.block_end
+        end_len = len(block_end) if block_end else 0
+        in_block = self.in_block_comment
+        code = 0
+        comment = 0
+        lines = filter(None, stripped)
+        while True:
+            if in_block:
+                # 块注释内：直到包含结束符的行为止都是注释行
+                for s in lines:
                     comment += 1
-                    if style['block_end'] and style['block_end'] in stripped:
-                        in_block_comment = False
-                    continue
-                
-                # 检查块注释开始
-                if style['block_start'] and style['block_start'] in stripped:
-                    # 检查是否同行结束
-                    if style['block_end'] and style['block_end'] in stripped:
-                        # 同行开始和结束，如 /* comment */
-                        idx_start = stripped.find(style['block_start'])
-                        idx_end = stripped.find(style['block_end'])
-                        if idx_end > idx_start:
-                            # 检查块注释外是否有代码
-                            before = stripped[:idx_start].strip()
-                            after = stripped[idx_end + len(style['block_end']):].strip()
-                            if before or after:
-                                code += 1
-                            else:
-                                comment += 1
-                            continue
-                    else:
-                        in_block_comment = True
-                        # 检查块注释开始前是否有代码
-                        idx = stripped.find(style['block_start'])
-                        if stripped[:idx].strip():
-                            code += 1
+                    if block_end and block_end in s:
+                        in_block = False
+                        break
+                else:
+                    break
+            for s in lines:
+                if block_start in s:
+                    idx_start = s.find(block_start)
+                    idx_end = s.find(block_end) if block_end else -1
+                    if idx_end == -1:
+                        # 块注释开始，检查块注释开始前是否有代码
+                        in_block = True
+                        if idx_start == 0:
+                            comment += 1
                         else:
+                            code += 1
+                        break
+                    elif idx_end > idx_start:
+                        # 同行开始和结束，如 /* comment */，检查块注释外是否有代码
+                        if idx_start == 0 and idx_end + end_len == len(s):
                             comment += 1
-                        continue
-                
+                        else:
+                            code += 1
+                    elif line_token and s.startswith(line_token):
+                        comment += 1
+                    else:
+                        code += 1
                 # 行注释
-                if style['line'] and stripped.startswith(style['line']):
+                elif line_token and s.startswith(line_token):
                     comment += 1
-                    continue
-                
-                # 代码行
-                code += 1
-                
-    except Exception as e:
-        # 无法读取的文件
-        pass
+                else:
+                    code += 1
+            else:
+                break
+        
+        self.in_block_comment = in_block
+        self.total += len(stripped)
+        self.blank += blank
+        self.code += code
+        self.comment += comment
+    
+    def _line_counts(self, text) -> Tuple[int, int, int]:
+        """text 中的 (行数, 空行数, 以行注释符开头的行数)，每一行都以前导的换行符开始"""
+        binary = isinstance(text, bytes)
+        blank_re, comment_re = _line_patterns(self.line_token, binary)
+        return (text.count(b'\n' if binary else '\n'), len(blank_re.findall(text)),
+                len(comment_re.findall(text)) if comment_re else 0)
+    
+    def _squeezed_counts(self, text: bytes) -> Tuple[int, int, int]:
+        """
+        与 _line_counts(text) 相同，删除行内空白（translate）后用 count() 计数
+        
+        调用方须保证删除空白不会拼出新的行注释符（见 _split_token_pattern）。
+        """
+        squeezed = text.translate(None, _INLINE_SPACE)
+        lines = squeezed.count(b'\n')
+        blank = len(_EMPTY_LINE.findall(squeezed))
+        if not self.line_token:
+            return lines, blank, 0
+        return lines, blank, squeezed.count(b'\n' + self.line_token.encode('ascii'))
+    
+    def feed(self, text):
+        """
+        统计一段文本
+        
+        text 为 str，或不含非 ASCII 空白字符的合法 UTF-8 bytes，换行符须已统一为
+        \n（见 _normalize_newlines），且由完整的行组成（除最后一块外以换行结尾）。
+        """
+        if not text:
+            return
+        binary = isinstance(text, bytes)
+        nl = b'\n' if binary else '\n'
+        block_start = self.block_start
+        if block_start and block_start != self.block_end:
+            # 包含起始符的行较多时逐行修正的开销超过批量统计的收益，改为单遍逐行判断
+            token = block_start.encode('ascii') if binary else block_start
+            if text.count(token) * self.DENSE_BLOCK_SPAN > len(text):
+                self._feed_lines(text)
+                return
+        # 改为每行以换行符开头，便于按 "\n" + 记号计数
+        text = nl + (text[:-1] if text.endswith(nl) else text)
+        split_token = _split_token_pattern(self.line_token) if binary else None
+        if binary and (split_token is None or split_token.search(text) is None):
+            line_counts = self._squeezed_counts
+        else:
+            line_counts = self._line_counts
+        lines, blank, comment = line_counts(text)
+        if self.block_start and self.block_start != self.block_end:
+            comment += self._block_comments(text, line_counts)
+        
+        self.total += lines
+        self.blank += blank
+        self.comment += comment
+        self.code += lines - blank - comment
+    
+    def _block_comments(self, text, line_counts) -> int:
+        """
+        按块注释修正批量统计的注释行数，返回修正量
+        
+        批量统计时非空行只按是否以行注释符开头区分；这里按原逐行判断重新归类
+        包含起始符的行，块注释内部的各段拼接后用 line_counts 一次统计。
+        """
+        tokens = (self.line_token, self.block_start, self.block_end)
+        if isinstance(text, bytes):
+            nl, strip_chars = b'\n', _ASCII_SPACE
+            tokens = [t.encode('ascii') if t else None for t in tokens]
+        else:
+            nl, strip_chars = '\n', None
+        line_token, block_start, block_end = tokens
+        in_block = self.in_block_comment
+        if not in_block and block_start not in text:
+            return 0
+        
+        find = text.find
+        rfind = text.rfind
+        end_len = len(block_end) if block_end else 0
+        size = len(text)
+        verdicts = {}   # 包含起始符的行 -> (注释行数修正, 是否进入块注释)
+        inside = []     # 块注释内部的各段（每行以前导的换行符开始）
+        delta = 0
+        pos = 0         # 始终位于某一行前导的换行符处
+        while pos < size:
+            if in_block:
+                # 直到包含结束符的行（含）为止，非空行都是注释行
+                idx = find(block_end, pos) if block_end else -1
+                stop = find(nl, idx) if idx != -1 else -1
+                if stop == -1:
+                    stop = size
+                inside.append(text[pos:stop])
+                in_block = idx == -1
+                pos = stop
+                continue
+            
+            idx = find(block_start, pos)
+            if idx == -1:
+                break
+            pos = find(nl, idx)
+            if pos == -1:
+                pos = size
+            line = text[rfind(nl, 0, idx) + 1:pos]
+            verdict = verdicts.get(line)
+            if verdict is None:
+                s = line.strip(strip_chars)
+                counted = 1 if line_token and s.startswith(line_token) else 0
+                idx_start = s.find(block_start)
+                idx_end = s.find(block_end) if block_end else -1
+                if idx_end == -1:
+                    # 块注释开始，检查块注释开始前是否有代码
+                    verdict = (int(idx_start == 0) - counted, True)
+                elif idx_end > idx_start:
+                    # 同行开始和结束，如 /* comment */，检查块注释外是否有代码
+                    verdict = (int(idx_start == 0 and idx_end + end_len == len(s)) - counted, False)
+                else:
+                    # 结束符在前：与批量统计相同，按行注释判断
+                    verdict = (0, False)
+                verdicts[line] = verdict
+            delta += verdict[0]
+            in_block = verdict[1]
+        
+        self.in_block_comment = in_block
+        if inside:
+            # 这些行在批量统计中按行注释判断，实际上非空行都是注释行
+            lines, blank, comment = line_counts(nl[:0].join(inside))
+            delta += lines - blank - comment
+        return delta
+
+
+# str.strip() 会去掉的非 ASCII 空白字符（U+0085、U+00A0、U+1680、U+2000-U+200A、U+2028、
+# U+2029、U+202F、U+205F、U+3000）的 UTF-8 编码，按首字节分组：先用 find() 定位首字节
+# （memchr），出现时才用正则确认，避免在整个缓冲区上逐字符匹配
+_UNICODE_SPACE_UTF8 = (
+    (b'\xc2', re.compile(rb'\xc2[\x85\xa0]')),
+    (b'\xe1', re.compile(rb'\xe1\x9a\x80')),
+    (b'\xe2', re.compile(rb'\xe2(?:\x80[\x80-\x8a\xa8\xa9\xaf]|\x81\x9f)')),
+    (b'\xe3', re.compile(rb'\xe3\x80\x80')),
+)
+
+
+def _has_unicode_space(data: bytes) -> bool:
+    """合法 UTF-8 内容中是否有非 ASCII 空白字符"""
+    return any(data.find(lead) != -1 and pattern.search(data) is not None
+               for lead, pattern in _UNICODE_SPACE_UTF8)
+
+
+def _normalize_newlines(data: bytes):
+    """
+    统一换行符为 \n，返回可交给 LineClassifier.feed() 的内容
+    
+    纯 ASCII，或是合法 UTF-8 且不含非 ASCII 空白字符的内容保持为 bytes：解码
+    不会丢弃字节，按行切分和 strip() 的结果也与解码后相同。其余按 UTF-8 解码
+    （忽略错误）为 str。
+    """
+    if not data.isascii():
+        try:
+            text = data.decode('utf-8')
+            keep_bytes = not _has_unicode_space(data)
+        except UnicodeDecodeError:
+            text = data.decode('utf-8', errors='ignore')
+            keep_bytes = False
+        if not keep_bytes:
+            if '\r' in text:
+                text = text.replace('\r\n', '\n').replace('\r', '\n')
+            return text
+    if b'\r' in data:
+        data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    return data
+
+
+def count_lines_in_buffer(data: bytes, language: str) -> Tuple[int, int, int, int]:
+    """
+    统计内存缓冲区中的行数
+    
+    按 UTF-8 解码（忽略错误），换行规则与文本模式读取一致（\n、\r\n、\r）。
+    
+    Returns:
+        (total_lines, code_lines, comment_lines, blank_lines)
+    """
+    classifier = LineClassifier(language)
+    classifier.feed(_normalize_newlines(data))
+    return classifier.counts()
+
+
+# 不小于该大小的文件用 mmap 分块统计，避免整体读入和解码
+MMAP_THRESHOLD = 32 * 1024 * 1024
+# 分块统计时每块的大致大小
+LINE_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def set_mmap_threshold(size: int):
+    """设置使用 mmap 分块统计的文件大小阈值（字节，0 表示总是使用）"""
+    global MMAP_THRESHOLD
+    MMAP_THRESHOLD = size
+
+
+# 不大于该大小的文件计算圈复杂度并提取依赖，None 表示都不计算（默认）。解析的开销
+# 远高于行数统计，只在开启分析时进行，且跳过大文件（多为生成代码），结果记为 0 / 无依赖
+ANALYZE_MAX_SIZE: Optional[int] = None
+
+
+def set_analyze_max_size(size: Optional[int]):
+    """设置计算圈复杂度和提取依赖的文件大小上限（字节，None 表示不计算）"""
+    global ANALYZE_MAX_SIZE
+    ANALYZE_MAX_SIZE = size
+
+
+def _cr_boundary(buf, idx: int) -> int:
+    """
+    \r 处的块边界（边界前最后一个字节的位置），不可切分时返回 -1
+    
+    \r 之后紧跟 \n 时边界放在 \n 之后；紧跟非 ASCII 字节时不切分：它们可能是
+    解码时被忽略的无效字节，整体解码会把 \r + 无效字节 + \n 视为一个换行。
+    """
+    nxt = buf[idx + 1:idx + 2]
+    if nxt == b'\n':
+        return idx + 1
+    if nxt and nxt[0] >= 0x80:
+        return -1
+    return idx
+
+
+def _iter_line_chunks(buf, chunk_size: int = LINE_CHUNK_SIZE):
+    """
+    把缓冲区切成由完整行组成的块，产出 (start, end)
+    
+    块边界优先放在 \n 之后，没有 \n 时放在可切分的 \r 之后，因此各块分别
+    解码、统一换行符的结果与整体处理一致。单行超过块大小时整行作为一块。
+    """
+    size = len(buf)
+    start = 0
+    while start < size:
+        end = start + chunk_size
+        if end >= size:
+            end = size
+        else:
+            cut = buf.rfind(b'\n', start, end)
+            if cut == -1:
+                cr = buf.rfind(b'\r', start, end)
+                while cr != -1:
+                    cut = _cr_boundary(buf, cr)
+                    if cut != -1:
+                        break
+                    cr = buf.rfind(b'\r', start, cr)
+            if cut == -1:
+                # 超长的行：延伸到其后第一个可切分的换行符
+                nl = buf.find(b'\n', end)
+                cr = buf.find(b'\r', end)
+                while cr != -1 and (nl == -1 or cr < nl):
+                    cut = _cr_boundary(buf, cr)
+                    if cut != -1:
+                        break
+                    cr = buf.find(b'\r', cr + 1)
+                if cut == -1:
+                    cut = nl if nl != -1 else size - 1
+            end = cut + 1
+        yield start, end
+        start = end
+
+
+def count_lines_chunked(buf, language: str, hasher=None) -> Tuple[int, int, int, int]:
+    """
+    分块统计大缓冲区（通常是 mmap）的行数
+    
+    每次只解码一块（UTF-8，忽略错误）。块边界位于换行符之后，UTF-8 解码器
+    在 ASCII 字节处重新同步，因此结果与整体解码完全一致。buf 为 mmap 时，
+    处理过的页面随即从本进程释放，常驻内存只与块大小有关，与文件大小无关。
+    
+    Args:
+        buf: 支持切片和 find/rfind 的缓冲区（bytes 或 mmap）
+        language: 语言名称
+        hasher: 可选的哈希对象，顺带用各块内容更新
+    """
+    classifier = LineClassifier(language)
+    release = None
+    if isinstance(buf, mmap.mmap) and hasattr(mmap, 'MADV_DONTNEED'):
+        release = buf.madvise
+    released = 0
+    
+    for start, end in _iter_line_chunks(buf):
+        chunk = buf[start:end]
+        if hasher is not None:
+            hasher.update(chunk)
+        text = _normalize_newlines(chunk)
+        del chunk
+        classifier.feed(text)
+        
+        if release is not None:
+            drop = end - end % mmap.PAGESIZE
+            if drop > released:
+                release(mmap.MADV_DONTNEED, released, drop - released)
+                released = drop
+    
+    return classifier.counts()
+
+
+def map_file(f) -> Optional[mmap.mmap]:
+    """只读映射已打开的文件；空文件或不支持映射的文件返回 None"""
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (ValueError, OSError):
+        return None
+
+
+def count_lines(file_path: str, language: str, data: Optional[bytes] = None) -> Tuple[int, int, int, int]:
+    """
+    统计文件行数
+    
+    Args:
+        file_path: 文件路径
+        language: 语言名称
+        data: 已读取的文件内容，提供时不再打开文件
+    
+    Returns:
+        (total_lines, code_lines, comment_lines, blank_lines)
+    """
+    if data is None:
+        try:
+            with open(file_path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size >= MMAP_THRESHOLD:
+                    mapped = map_file(f)
+                    if mapped is not None:
+                        with mapped:
+                            return count_lines_chunked(mapped, language)
+                data = f.read()
+        except OSError:
+            # 无法读取的文件
+            return 0, 0, 0, 0
+    
+    return count_lines_in_buffer(data, language)
+
+
+# ============================================================================
+# 圈复杂度
+# ============================================================================
+# 使用 C 风格注释的语言（COMMENT_STYLES 中 // 与 /* */），按记号统计判定点
+COMPLEXITY_C_FAMILY = frozenset(
+    lang for lang, style in COMMENT_STYLES.items()
+    if style['line'] == '//' and style['block_start'] == '/*' and lang != 'SCSS'
+)
+COMPLEXITY_LANGUAGES = COMPLEXITY_C_FAMILY | {'Python'}
+
+# Python: 每个判定节点 +1（布尔运算按操作数个数、推导式另计其中的 if）
+_PY_FUNCTIONS = (ast.FunctionDef, ast.AsyncFunctionDef)
+_PY_BRANCHES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler,
+                ast.comprehension) + ((ast.match_case,) if hasattr(ast, 'match_case') else ())
+_PY_IMPORTS = (ast.Import, ast.ImportFrom)
+
+# C 家族: 判定关键字、引出函数体的关键字、其后括号不是参数表的控制关键字
+_C_DECISION_WORDS = frozenset({'if', 'for', 'foreach', 'while', 'case', 'catch', 'guard'})
+_C_FUNCTION_WORDS = frozenset({'func', 'fn', 'fun', 'function', 'def'})
+_C_CONTROL_WORDS = frozenset({'if', 'for', 'foreach', 'while', 'switch', 'catch', 'using',
+                              'lock', 'synchronized', 'with', 'return', 'sizeof'})
+
+
+def _python_import_names(node) -> List[str]:
+    """import 语句引用的模块名；from 导入记为 模块.名称（名称可能是子模块），相对导入保留前导点"""
+    if isinstance(node, ast.Import):
+        return [alias.name for alias in node.names]
+    base = '.' * (node.level or 0) + (node.module or '')
+    if node.module:
+        return [base if alias.name == '*' else f"{base}.{alias.name}" for alias in node.names]
+    return [base + alias.name for alias in node.names if alias.name != '*']
+
+
+def _python_analysis(text: str) -> Tuple[List[int], List[str]]:
+    """
+    用 ast 计算每个函数（含方法、嵌套函数）的圈复杂度，并在同一次遍历中收集 import，
+    语法错误时均返回空列表
+    """
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        return [], []
+    
+    functions = []
+    imports = []
+    stack = [(tree, None)]  # (节点, 所属函数在 functions 中的下标)
+    while stack:
+        node, owner = stack.pop()
+        for child in ast.iter_child_nodes(node):
+            child_owner = owner
+            if isinstance(child, _PY_FUNCTIONS):
+                functions.append(1)
+                child_owner = len(functions) - 1
+            elif isinstance(child, _PY_IMPORTS):
+                imports.extend(_python_import_names(child))
+                continue
+            elif owner is not None:
+                if isinstance(child, _PY_BRANCHES):
+                    functions[owner] += 1 + len(getattr(child, 'ifs', ()))
+                elif isinstance(child, ast.BoolOp):
+                    functions[owner] += len(child.values) - 1
+            stack.append((child, child_owner))
+    return functions, imports
+
+
+@lru_cache(maxsize=None)
+def _c_token_pattern(language: str):
+    """C 家族语言的记号正则：注释和字符串整体匹配（随后丢弃），其余只取关心的记号"""
+    style = COMMENT_STYLES[language]
+    ternary = r'|(?<!\?)\?(?![.?:)>,\]])' if language != 'Rust' else ''  # Rust 的 ? 是错误传播
+    return re.compile(
+        re.escape(style['line']) + r'[^\n]*|' +
+        re.escape(style['block_start']) + r'.*?' + re.escape(style['block_end']) + '|'
+        r'"(?:\\.|[^"\\\n])*"|'
+        r"'(?:\\.[^'\n]{0,8}|[^'\\\n])'|"
+        r'`(?:\\.|[^`\\])*`|'
+        r'[A-Za-z_$][\w$]*|&&|\|\||=>|[{}();,]' + ternary,
+        re.DOTALL,
+    )
+
+
+def _c_family_complexity(text: str, language: str) -> List[int]:
+    """
+    按记号统计 C 家族语言每个函数的圈复杂度（1 + 判定点数）
+    
+    函数体为紧跟参数表（其前不是 if/while 等控制关键字，所在语句也不以控制关键字
+    开始）、函数关键字（func/fn/fun/function）或 => 之后的 { ... }，在任意括号
+    深度都可以出现：作为参数传入的回调、lambda 与局部函数各自记为一个函数，
+    判定点计入最内层的函数。判定点为 if/for/while/case/catch、&& / || 与三元 ?。
+    """
+    functions = []
+    bodies = []             # 进行中的函数体：(所在的花括号深度, 在 functions 中的下标)
+    depth = 0
+    parens = []             # 未闭合的括号：其前是否为控制关键字
+    control = False         # 当前语句以控制关键字开始（Go 等条件不带括号的写法）
+    after_params = False    # 刚闭合参数表（其后可有 const/throws/返回类型等修饰）
+    keyword = False         # 已出现函数关键字
+    prev = ''
+    
+    for token in _c_token_pattern(language).findall(text):
+        first = token[0]
+        if first in '/"\'`':  # 注释、字符串
+            continue
+        if token == '(':
+            parens.append(prev in _C_CONTROL_WORDS)
+        elif token == ')':
+            if parens:
+                after_params = not parens.pop()
+        elif token == '{':
+            if keyword or prev == '=>' or (after_params and not control):
+                functions.append(1)
+                bodies.append((depth, len(functions) - 1))
+            depth += 1
+            after_params = keyword = control = False
+        elif token == '}':
+            if depth > 0:
+                depth -= 1
+            if bodies and bodies[-1][0] == depth:
+                bodies.pop()
+            after_params = keyword = control = False
+        elif token == ',':
+            after_params = False
+        elif token == ';':
+            if not parens:
+                after_params = keyword = control = False
+        elif token in _C_FUNCTION_WORDS:
+            keyword = True
+        elif token in _C_DECISION_WORDS or token == '&&' or token == '||' or first == '?':
+            if bodies:
+                functions[bodies[-1][1]] += 1
+            if first.isalpha():
+                control = True
+        elif token == 'switch':
+            control = True
+        prev = token
+    return functions
+
+
+# ============================================================================
+# 依赖提取
+# ============================================================================
+# 提取 import / #include 的语言 -> 依赖的解析方式
+DEPENDENCY_KINDS = {
+    'Python': 'python',
+    'C': 'c', 'C++': 'c', 'C/C++ Header': 'c', 'C++ Header': 'c',
+    'JavaScript': 'js', 'TypeScript': 'js', 'React JSX': 'js', 'React TSX': 'js',
+    'Go': 'go',
+}
+
+# 依赖记号: C 家族记为 '"name' / '<name'（保留引号类型），其余为原样的模块路径
+_IMPORT_PATTERNS = {
+    'c': re.compile(r'^[ \t]*#[ \t]*include[ \t]*([<"])([^>"\n]+)[>"]', re.MULTILINE),
+    'js': re.compile(r'(?:\bfrom|\bimport|\brequire)\s*\(?\s*([\'"])([^\'"\n]+)\1'),
+    'go': re.compile(r'\bimport\s*(?:\(([^)]*)\)|(?:[\w.]+\s+)?"([^"\n]+)")'),
+}
+_GO_IMPORT_PATH = re.compile(r'"([^"\n]+)"')
+
+
+def extract_imports(text: str, kind: str) -> List[str]:
+    """按正则提取 C/C++ #include、JS/TS import/require、Go import 的依赖记号"""
+    pattern = _IMPORT_PATTERNS[kind]
+    if kind == 'c':
+        return [quote + name.strip() for quote, name in pattern.findall(text)]
+    if kind == 'js':
+        return [name for _, name in pattern.findall(text)]
+    imports = []
+    for block, single in pattern.findall(text):
+        if block:
+            imports.extend(_GO_IMPORT_PATH.findall(block))
+        else:
+            imports.append(single)
+    return imports
+
+
+def analyze_source(data: bytes, language: str) -> Tuple[Tuple[int, int, int], Tuple[str, ...]]:
+    """
+    计算圈复杂度并提取依赖（与行数统计使用同一个已读入的缓冲区，只解码一次）
+    
+    Python 使用 ast（圈复杂度与 import 共用一次解析），C 家族语言
+    （COMPLEXITY_C_FAMILY）按记号统计判定点，DEPENDENCY_KINDS 中的语言按正则提取
+    依赖；其他语言以及超过 ANALYZE_MAX_SIZE 的内容返回全 0 和空元组。
     
-    return total, code, comment, blank
+    Returns:
+        ((函数数, 各函数圈复杂度之和, 最大圈复杂度), 去重后的依赖记号)
+    """
+    if ANALYZE_MAX_SIZE is None or len(data) > ANALYZE_MAX_SIZE:
+        return (0, 0, 0), ()
+    kind = DEPENDENCY_KINDS.get(language)
+    if kind is None and language not in COMPLEXITY_LANGUAGES:
+        return (0, 0, 0), ()
+    text = data.decode('utf-8', errors='ignore')
+    if language == 'Python':
+        functions, imports = _python_analysis(text)
+    else:
+        functions = _c_family_complexity(text, language) if language in COMPLEXITY_C_FAMILY else []
+        imports = extract_imports(text, kind) if kind is not None else ()
+    imports = tuple(dict.fromkeys(imports))
+    if not functions:
+        return (0, 0, 0), imports
+    return (len(functions), sum(functions), max(functions)), imports
 
 
 def get_file_size(file_path: str) -> int:
@@ -500,37 +1218,123 @@ def format_number(num: int) -> str:
     return f"{num:,}"
 
 
-def should_ignore(path: str, ignore_patterns: List[str]) -> bool:
-    """检查路径是否应该被忽略"""
-    name = os.path.basename(path)
-    
-    # 默认忽略
-    default_ignore = [
-        '.git', '.svn', '.hg', '.bzr',
-        '__pycache__', '.pytest_cache', '.mypy_cache',
-        'node_modules', 'bower_components',
-        '.idea', '.vscode', '.vs',
-        'venv', '.venv', 'env', '.env',
-        'build', 'dist', 'target', 'out',
-        '*.pyc', '*.pyo', '*.o', '*.obj', '*.ko',
-        '*.so', '*.dll', '*.dylib', '*.a', '*.lib',
-        '*.exe', '*.bin',
-        '*.jpg', '*.jpeg', '*.png', '*.gif', '*.ico',
-        '*.pdf', '*.doc', '*.docx',
-        '*.zip', '*.tar', '*.gz', '*.rar',
-    ]
+# 内置忽略规则（与配置文件中的 exclude.patterns 合并使用）
+DEFAULT_IGNORE_PATTERNS = [
+    '.git', '.svn', '.hg', '.bzr',
+    '__pycache__', '.pytest_cache', '.mypy_cache',
+    'node_modules', 'bower_components',
+    '.idea', '.vscode', '.vs',
+    'venv', '.venv', 'env', '.env',
+    'build', 'dist', 'target', 'out',
+    '*.pyc', '*.pyo', '*.o', '*.obj', '*.ko',
+    '*.so', '*.dll', '*.dylib', '*.a', '*.lib',
+    '*.exe', '*.bin',
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.ico',
+    '*.pdf', '*.doc', '*.docx',
+    '*.zip', '*.tar', '*.gz', '*.rar',
+]
+
+_GLOB_CHARS = frozenset('*?[')
+
+
+class IgnoreMatcher:
+    """
+    预编译的忽略规则匹配器
     
-    all_patterns = default_ignore + ignore_patterns
+    规则按类型分流，每次运行只编译一次：
+    - 不含通配符的名称 (如 node_modules) 放入集合精确匹配
+    - *.ext 形式的规则放入扩展名集合
+    - 其余名称规则合并为一个正则
+    - 含 / 的规则 (如 docs/*) 匹配相对路径，以 / 开头时锚定到扫描根目录
+    
+    匹配结果与逐条 fnmatch.fnmatch 一致（路径规则除外，旧实现只比较文件名）。
+    """
+    
+    def __init__(self, patterns: List[str]):
+        self.names = set()
+        self.extensions = set()
+        name_regexes = []
+        path_regexes = []
+        anchored_regexes = []
+        
+        for pattern in patterns:
+            pattern = os.path.normcase(pattern)
+            if '/' in pattern:
+                if pattern.startswith('/'):
+                    anchored_regexes.append(fnmatch.translate(pattern.lstrip('/')))
+                else:
+                    path_regexes.append(fnmatch.translate(pattern))
+            elif not _GLOB_CHARS.intersection(pattern):
+                self.names.add(pattern)
+            elif pattern.startswith('*.') and not _GLOB_CHARS.intersection(pattern[1:]):
+                self.extensions.add(pattern[1:])
+            else:
+                name_regexes.append(fnmatch.translate(pattern))
+        
+        self._name_re = re.compile('|'.join(name_regexes)) if name_regexes else None
+        self._path_re = re.compile('(?:^|/)(?:' + '|'.join(path_regexes) + ')') if path_regexes else None
+        self._anchored_re = re.compile('|'.join(anchored_regexes)) if anchored_regexes else None
     
-    for pattern in all_patterns:
-        if fnmatch.fnmatch(name, pattern):
+    def match(self, name: str, rel_path: str = '') -> bool:
+        """
+        检查条目是否应被忽略
+        
+        Args:
+            name: 文件/目录名
+            rel_path: 相对扫描根目录的路径，用于匹配含 / 的规则
+        """
+        name = os.path.normcase(name)
+        if name in self.names:
+            return True
+        
+        if self.extensions:
+            idx = name.find('.')
+            while idx != -1:
+                if name[idx:] in self.extensions:
+                    return True
+                idx = name.find('.', idx + 1)
+        
+        if self._name_re is not None and self._name_re.match(name):
             return True
+        
+        if rel_path and (self._path_re is not None or self._anchored_re is not None):
+            rel_path = os.path.normcase(rel_path).replace(os.sep, '/')
+            if self._path_re is not None and self._path_re.search(rel_path):
+                return True
+            if self._anchored_re is not None and self._anchored_re.match(rel_path):
+                return True
+        
+        return False
+
+
+@lru_cache(maxsize=16)
+def get_ignore_matcher(ignore_patterns: Tuple[str, ...]) -> IgnoreMatcher:
+    """获取（缓存的）内置规则 + 指定规则的匹配器"""
+    return IgnoreMatcher(DEFAULT_IGNORE_PATTERNS + list(ignore_patterns))
+
+
+def should_ignore(path: str, ignore_patterns: List[str], root: Optional[str] = None) -> bool:
+    """
+    检查路径是否应该被忽略
     
-    return False
+    Args:
+        path: 文件/目录路径
+        ignore_patterns: 额外的忽略模式
+        root: 扫描根目录，含 / 的规则相对它匹配；未指定时直接匹配 path
+    """
+    matcher = get_ignore_matcher(tuple(ignore_patterns))
+    rel_path = os.path.relpath(path, root) if root else path
+    return matcher.match(os.path.basename(path), rel_path)
 
 
-def is_text_file(file_path: str) -> bool:
-    """检查是否是文本文件"""
+def is_text_file(file_path: str, head: Optional[bytes] = None) -> bool:
+    """
+    检查是否是文本文件
+    
+    Args:
+        file_path: 文件路径
+        head: 已读取的文件开头内容，提供时不再打开文件
+    """
     # 通过扩展名快速判断
     ext = os.path.splitext(file_path)[1].lower()
     if ext in LANGUAGE_EXTENSIONS:
@@ -541,27 +1345,72 @@ def is_text_file(file_path: str) -> bool:
         return True
     
     # 尝试读取
-    try:
-        with open(file_path, 'rb') as f:
-            chunk = f.read(1024)
-            if b'\x00' in chunk:  # 二进制文件
-                return False
-        return True
-    except:
-        return False
+    if head is None:
+        try:
+            with open(file_path, 'rb') as f:
+                head = f.read(SNIFF_SIZE)
+        except OSError:
+            return False
+    
+    return b'\x00' not in head[:SNIFF_SIZE]  # 含 NUL 视为二进制文件
 
 
-def scan_file(file_path: str) -> Optional[FileStats]:
-    """扫描单个文件"""
-    if not is_text_file(file_path):
-        return None
+# 本次运行内按 (内容哈希, 语言) 记录的行数统计、圈复杂度与依赖。进程池中每个
+# 工作进程各有一份，不同进程处理的相同内容仍会各统计一次（--git 模式在分发前
+# 已按 blob 哈希去重）；超过 COUNT_MEMO_MAX 条时淘汰最早的记录，--watch 等
+# 长时间运行的进程内存不会随修改次数增长
+_COUNT_MEMO = {}
+COUNT_MEMO_MAX = 65536
+
+
+def content_digest(data: bytes) -> str:
+    """计算内容哈希，与 Git blob 对象 ID (SHA-1) 相同"""
+    h = hashlib.sha1(b'blob %d\x00' % len(data))
+    h.update(data)
+    return h.hexdigest()
+
+
+def reset_count_memo():
+    """清空按内容哈希记录的行数统计（每次扫描开始时调用）"""
+    _COUNT_MEMO.clear()
+
+
+def _remember_counts(key: Tuple[str, str], value: Tuple) -> Tuple:
+    """记录一个内容的统计结果，超出容量时淘汰最早的记录"""
+    if len(_COUNT_MEMO) >= COUNT_MEMO_MAX:
+        try:
+            del _COUNT_MEMO[next(iter(_COUNT_MEMO))]
+        except (KeyError, RuntimeError, StopIteration):
+            pass  # 线程池中其他线程同时在淘汰
+    _COUNT_MEMO[key] = value
+    return value
+
+
+def _scan_mapped(file_path: str, mapped: mmap.mmap, language: str) -> Optional[FileStats]:
+    """
+    扫描已映射的大文件：一次遍历同时计算内容哈希和行数，不整体读入内存
     
-    language = detect_language(file_path)
+    圈复杂度和依赖提取需要整个文件的文本，这类文件不计算（记为 0 / 无依赖）。
+    """
+    steps = getattr(_FILE_STEPS, 'current', None)
     if language == 'Unknown':
-        return None
-    
-    size = get_file_size(file_path)
-    total, code, comment, blank = count_lines(file_path, language)
+        start = _step_clock(steps)
+        if not is_text_file(file_path, mapped[:SNIFF_SIZE]):
+            return None
+        language = detect_language(file_path, mapped)
+        _record_step(steps, 'detect', start)
+        if language == 'Unknown':
+            return None
+    
+    size = len(mapped)
+    hasher = hashlib.sha1(b'blob %d\x00' % size)
+    start = _step_clock(steps)
+    # 哈希与行统计在同一遍中完成，耗时记为行统计
+    counts = count_lines_chunked(mapped, language, hasher)
+    _record_step(steps, 'count', start)
+    digest = hasher.hexdigest()
+    _remember_counts((digest, language), (counts, (0, 0, 0), ()))
+    total, code, comment, blank = counts
     
     return FileStats(
         path=file_path,
@@ -572,242 +1421,2986 @@ def scan_file(file_path: str) -> Optional[FileStats]:
         code_lines=code,
         comment_lines=comment,
         blank_lines=blank,
+        digest=digest,
     )
 
 
-def scan_directory(dir_path: str, ignore_patterns: List[str] = None) -> DirStats:
-    """递归扫描目录"""
-    if ignore_patterns is None:
-        ignore_patterns = []
+def scan_file(file_path: str) -> Optional[FileStats]:
+    """
+    扫描单个文件
     
-    dir_stats = DirStats(
-        path=dir_path,
-        name=os.path.basename(dir_path) or dir_path,
-    )
+    每个文件只打开一次：fstat 获取大小，读取内容后在同一缓冲区上完成
+    二进制判断、shebang 识别、行数统计、圈复杂度计算和依赖提取。内容完全相同的文件只统计一次
+    （按进程记录，见 _COUNT_MEMO）。
+    不小于 MMAP_THRESHOLD 的文件改用 mmap 分块统计。
+    """
+    # 开启 --profile 时记录各步骤耗时（见 profile_scan_file），否则为 None
+    steps = getattr(_FILE_STEPS, 'current', None)
     
-    try:
-        entries = sorted(os.listdir(dir_path))
-    except PermissionError:
-        return dir_stats
+    # 文件名/扩展名可识别时无需读取内容即可确定语言
+    start = _step_clock(steps)
+    language = detect_language(file_path, b'')
+    _record_step(steps, 'detect', start)
     
-    for entry in entries:
-        entry_path = os.path.join(dir_path, entry)
-        
-        if should_ignore(entry_path, ignore_patterns):
-            continue
-        
-        if os.path.isdir(entry_path):
-            # 递归扫描子目录
-            sub_stats = scan_directory(entry_path, ignore_patterns)
-            if sub_stats.file_count > 0:  # 只保留有文件的目录
-                dir_stats.children.append(sub_stats)
-                dir_stats.dir_count += 1 + sub_stats.dir_count
-                dir_stats.file_count += sub_stats.file_count
-                dir_stats.total_size += sub_stats.total_size
-                dir_stats.total_lines += sub_stats.total_lines
-                dir_stats.code_lines += sub_stats.code_lines
-                dir_stats.comment_lines += sub_stats.comment_lines
-                dir_stats.blank_lines += sub_stats.blank_lines
-        else:
-            # 扫描文件
-            file_stats = scan_file(entry_path)
-            if file_stats:
-                dir_stats.children.append(file_stats)
-                dir_stats.file_count += 1
-                dir_stats.total_size += file_stats.size
-                dir_stats.total_lines += file_stats.total_lines
-                dir_stats.code_lines += file_stats.code_lines
-                dir_stats.comment_lines += file_stats.comment_lines
-                dir_stats.blank_lines += file_stats.blank_lines
+    try:
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size >= MMAP_THRESHOLD:
+                mapped = map_file(f)
+                if mapped is not None:
+                    with mapped:
+                        return _scan_mapped(file_path, mapped, language)
+            if language != 'Unknown':
+                data = f.read()
+            else:
+                head = f.read(SNIFF_SIZE)
+                start = _step_clock(steps)
+                if not is_text_file(file_path, head):
+                    return None
+                _record_step(steps, 'detect', start)
+                
+                # 首行超出探测长度时读完再识别 shebang
+                first_line_done = len(head) < SNIFF_SIZE or b'\n' in head or b'\r' in head
+                data = head if first_line_done else head + f.read()
+                start = _step_clock(steps)
+                language = detect_language(file_path, data)
+                _record_step(steps, 'detect', start)
+                if language == 'Unknown':
+                    return None
+                if first_line_done:
+                    data = head + f.read()
+    except OSError:
+        if language == 'Unknown':
+            return None
+        # 无法读取的文件仍计入大小
+        size = get_file_size(file_path)
+        return FileStats(file_path, os.path.basename(file_path), language, size, 0, 0, 0, 0)
+    
+    start = _step_clock(steps)
+    digest = content_digest(data)
+    _record_step(steps, 'hash', start)
+    key = (digest, language)
+    memo = _COUNT_MEMO.get(key)
+    if memo is None:
+        start = _step_clock(steps)
+        counts = count_lines_in_buffer(data, language)
+        start = _record_step(steps, 'count', start)
+        analysis = analyze_source(data, language)
+        _record_step(steps, 'analyze', start)
+        memo = _remember_counts(key, (counts,) + analysis)
+    (total, code, comment, blank), (functions, complexity, max_complexity), imports = memo
     
-    return dir_stats
+    return FileStats(
+        path=file_path,
+        name=os.path.basename(file_path),
+        language=language,
+        size=size,
+        total_lines=total,
+        code_lines=code,
+        comment_lines=comment,
+        blank_lines=blank,
+        digest=digest,
+        functions=functions,
+        complexity=complexity,
+        max_complexity=max_complexity,
+        imports=imports,
+    )
 
 
-def collect_by_language(dir_stats: DirStats) -> Dict[str, LanguageStats]:
-    """按语言收集统计"""
-    lang_stats = defaultdict(lambda: LanguageStats(language=''))
-    
-    def collect(node):
-        if isinstance(node, FileStats):
-            lang = node.language
-            if not lang_stats[lang].language:
-                lang_stats[lang].language = lang
-            lang_stats[lang].file_count += 1
-            lang_stats[lang].total_lines += node.total_lines
-            lang_stats[lang].code_lines += node.code_lines
-            lang_stats[lang].comment_lines += node.comment_lines
-            lang_stats[lang].blank_lines += node.blank_lines
-            lang_stats[lang].total_size += node.size
-        elif isinstance(node, DirStats):
-            for child in node.children:
-                collect(child)
-    
-    collect(dir_stats)
-    return dict(lang_stats)
+def _dir_key(path: str, entry: Optional[os.DirEntry] = None) -> Optional[Tuple[int, int]]:
+    """获取目录的 (st_dev, st_ino)，用于检测符号链接环"""
+    try:
+        st = entry.stat() if entry is not None else os.stat(path)
+        if st.st_ino == 0:
+            # Windows 下 DirEntry.stat() 不填充 st_ino/st_dev
+            st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def _sorted_entries(dir_path: str) -> List[os.DirEntry]:
+    """按名称排序列出目录项，无法读取的目录视为空目录"""
+    try:
+        with os.scandir(dir_path) as it:
+            return sorted(it, key=lambda e: e.name)
+    except OSError:
+        return []
+
+
+# 目录遍历事件
+WALK_ENTER = 'enter'
+WALK_FILE = 'file'
+WALK_EXIT = 'exit'
+
+
+def _entry_kind(entry: os.DirEntry, rel_dir: str, matcher: IgnoreMatcher,
+                follow_symlinks: bool) -> Optional[Tuple[str, bool]]:
+    """判断目录项：被忽略时返回 None，否则返回 (相对路径, 是否为目录)"""
+    rel_path = rel_dir + '/' + entry.name if rel_dir else entry.name
+    
+    if matcher.match(entry.name, rel_path):
+        return None
+    
+    if not follow_symlinks and entry.is_symlink():
+        return None
+    
+    try:
+        is_dir = entry.is_dir()
+    except OSError:
+        is_dir = False
+    return rel_path, is_dir
+
+
+def iter_walk(dir_path: str, matcher: IgnoreMatcher, follow_symlinks: bool = True,
+              rel_root: str = ''):
+    """
+    遍历目录结构（不读取文件内容），按排序顺序产出 (事件, 路径)
+    
+    事件为 WALK_ENTER (进入目录)、WALK_FILE (文件)、WALK_EXIT (离开目录)。
+    基于 os.scandir 复用目录项缓存的类型信息，使用显式栈而非递归，目录深度不受
+    Python 递归深度限制；内存占用只与目录深度及各层目录项数有关。
+    
+    follow_symlinks 为 False 时跳过所有符号链接；为 True 时跟随符号链接，并通过
+    祖先目录的 (st_dev, st_ino) 检测链接环。
+    
+    只遍历子目录时，rel_root 为该子目录相对扫描根目录的路径（以 / 分隔），使含 /
+    的排除规则按扫描根目录匹配。
+    """
+    root_key = _dir_key(dir_path)
+    active = {root_key}  # 当前路径上的祖先目录
+    stack = [(dir_path, iter(_sorted_entries(dir_path)), rel_root, root_key)]
+    yield WALK_ENTER, dir_path
+    
+    while stack:
+        path, entries, rel_dir, key = stack[-1]
+        
+        for entry in entries:
+            kind = _entry_kind(entry, rel_dir, matcher, follow_symlinks)
+            if kind is None:
+                continue
+            rel_path, is_dir = kind
+            
+            if is_dir:
+                child_key = _dir_key(entry.path, entry)
+                if child_key is not None and child_key in active:
+                    continue  # 符号链接环
+                active.add(child_key)
+                stack.append((entry.path, iter(_sorted_entries(entry.path)), rel_path, child_key))
+                yield WALK_ENTER, entry.path
+                break
+            
+            yield WALK_FILE, entry.path
+        else:
+            stack.pop()
+            active.discard(key)
+            yield WALK_EXIT, path
+
+
+def _create_executor(jobs: int, pool: str = 'process'):
+    """创建进程池或线程池；平台不支持多进程（如缺少 sem_open）时退回线程池"""
+    if pool == 'process':
+        try:
+            # 工作进程在 spawn 启动方式下不继承运行时设置
+            return ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                                       initargs=(MMAP_THRESHOLD, ANALYZE_MAX_SIZE))
+        except (OSError, NotImplementedError):
+            pass
+    return ThreadPoolExecutor(max_workers=jobs)
+
+
+# 进程池中每个任务统计的文件数，减少进程间通信的次数
+SCAN_BATCH_SIZE = 16
+
+
+def _scan_batch(scanner, paths: List[str]) -> List:
+    """在工作进程（或线程）中依次扫描一批文件"""
+    return [scanner(path) for path in paths]
+
+
+def _iter_scan_events(events, jobs: int = 1, pool: str = 'process', lookup=None, store=None):
+    """
+    扫描遍历事件流中的文件，按原顺序产出 (事件, 路径, FileStats 或 None)
+    
+    lookup(path) 返回 (命中, 结果)，命中的文件不再扫描、直接产出结果；扫描得到的
+    结果在产出前交给 store(path, stats)（如写入缓存）。并行时只保留有限的在途任务
+    窗口，不会一次性提交全部文件；进程池按 SCAN_BATCH_SIZE 个文件一批提交。
+    """
+    scanner = _file_scanner()
+    if jobs <= 1:
+        for event, path in events:
+            stats = None
+            if event == WALK_FILE:
+                hit = False
+                if lookup is not None:
+                    hit, stats = lookup(path)
+                if not hit:
+                    stats = _scan_result(scanner(path))
+                    if store is not None:
+                        store(path, stats)
+            yield event, path, stats
+        return
+    
+    with _create_executor(jobs, pool) as executor:
+        batch_size = SCAN_BATCH_SIZE if isinstance(executor, ProcessPoolExecutor) else 1
+        limit = jobs * max(16, 4 * batch_size)
+        # 窗口项为 (事件, 路径, 批次, 结果)：批次为 None 时结果已确定，否则结果是
+        # 批内下标；批次为 [路径列表, future]，凑满或轮到出队时才提交
+        window = deque()
+        batch = None
+        
+        def take():
+            nonlocal batch
+            event, path, job, stats = window.popleft()
+            if job is not None:
+                if job[1] is None:
+                    job[1] = executor.submit(_scan_batch, scanner, job[0])
+                    batch = None
+                stats = _scan_result(job[1].result()[stats])
+                if store is not None:
+                    store(path, stats)
+            return event, path, stats
+        
+        for event, path in events:
+            job = None
+            stats = None
+            if event == WALK_FILE:
+                hit = False
+                if lookup is not None:
+                    hit, stats = lookup(path)
+                if not hit:
+                    if batch is None:
+                        batch = [[], None]
+                    job = batch
+                    stats = len(job[0])
+                    job[0].append(path)
+                    if len(job[0]) >= batch_size:
+                        job[1] = executor.submit(_scan_batch, scanner, job[0])
+                        batch = None
+            window.append((event, path, job, stats))
+            while window and (window[0][2] is None or len(window) > limit):
+                yield take()
+        
+        while window:
+            yield take()
+
+
+def _add_to_parent(parent: DirStats, child):
+    """把子目录或文件加入父目录并累加统计"""
+    parent.children.append(child)
+    _accumulate(parent, child)
+
+
+def _accumulate(parent: DirStats, child):
+    """把子目录或文件的统计累加到父目录（不记录子项）"""
+    if isinstance(child, DirStats):
+        parent.dir_count += 1 + child.dir_count
+        parent.file_count += child.file_count
+        parent.total_size += child.total_size
+    else:
+        parent.file_count += 1
+        parent.total_size += child.size
+    parent.total_lines += child.total_lines
+    parent.code_lines += child.code_lines
+    parent.comment_lines += child.comment_lines
+    parent.blank_lines += child.blank_lines
+
+
+def _new_dir_stats(dir_path: str, table: Optional['FileTable'] = None) -> DirStats:
+    return DirStats(
+        path=dir_path,
+        name=os.path.basename(dir_path) or dir_path,
+        table=table,
+        rows=range(len(table), len(table)) if table is not None else range(0),
+    )
+
+
+def _build_dir_stats(scan_events, top_n: int = 10) -> DirStats:
+    """
+    根据按遍历顺序产出的扫描事件 (事件, 路径, FileStats 或 None) 组装 DirStats 树
+    
+    文件到达即写入列式存储并累加到当前目录，随后丢弃 FileStats；目录只记录子目录
+    和自己的行号范围。同一遍中按目录树顺序累计 ScanSummary（排名堆保留 top_n 个），
+    挂在返回的根目录上。
+    """
+    summary = ScanSummary(top_n)
+    table = summary.files
+    add_to_summary = summary.add
+    stack = []
+    root = None
+    
+    for event, path, file_stats in scan_events:
+        if event == WALK_FILE:
+            if file_stats:
+                add_to_summary(file_stats)
+                _accumulate(stack[-1], file_stats)
+        elif event == WALK_ENTER:
+            stack.append(_new_dir_stats(path, table))
+        else:
+            dir_stats = stack.pop()
+            dir_stats.rows = range(dir_stats.rows.start, len(table))
+            if not stack:
+                root = dir_stats
+            elif dir_stats.file_count > 0:  # 只保留有文件的目录
+                _add_to_parent(stack[-1], dir_stats)
+    
+    root.summary = summary
+    return root
+
+
+def scan_directory(dir_path: str, ignore_patterns: List[str] = None,
+                   jobs: int = 1, pool: str = 'process', cache: 'ScanCache' = None,
+                   follow_symlinks: bool = True, top_n: int = 10) -> DirStats:
+    """
+    扫描目录
+    
+    边遍历边（串行或并行）统计文件，结果按排序顺序到达后直接写入列式存储、组装
+    DirStats 树，不保留全部文件的 FileStats。并行与串行扫描得到的结果完全一致。
+    
+    Args:
+        dir_path: 要扫描的目录
+        ignore_patterns: 额外的忽略模式
+        jobs: 并行任务数，<= 1 时串行扫描
+        pool: 并行方式，'process' (进程池) 或 'thread' (线程池)
+        cache: 增量扫描缓存，未变化的文件直接使用缓存结果
+        follow_symlinks: 是否跟随符号链接（跟随时自动跳过链接环）
+        top_n: 扫描时为各排序键保留的 Top N 文件数
+    """
+    if ignore_patterns is None:
+        ignore_patterns = []
+    
+    reset_count_memo()
+    matcher = _profile_matcher(get_ignore_matcher(tuple(ignore_patterns)))
+    events = iter_walk(dir_path, matcher, follow_symlinks)
+    lookup = store = None
+    if cache is not None:
+        lookup, store = cache.lookup, cache.store
+    
+    with profile_phase('scan'):
+        return _build_dir_stats(_iter_scan_events(events, jobs, pool, lookup, store), top_n)
+
+
+def iter_files(dir_stats: DirStats):
+    """按目录树顺序遍历所有文件（显式栈，非递归）"""
+    stack = [dir_stats.iter_children()]
+    while stack:
+        for node in stack[-1]:
+            if isinstance(node, DirStats):
+                stack.append(node.iter_children())
+                break
+            yield node
+        else:
+            stack.pop()
+
+
+class FileTable:
+    """
+    列式文件存储
+    
+    每个文件占一行，不再为每个文件保留一个 FileStats 对象：目录前缀驻留在目录
+    表中、语言驻留在语言表中，按 id 引用；文件名和内容哈希分别连续存放在
+    bytearray 中；大小和各类行数存放在 array('q') 列中。按行号访问时才生成
+    FileStats 视图，供现有的打印和报告函数使用。
+    
+    各列也可以是 memoryview（如从 mmap 的快照文件直接映射，见 Snapshot），此时只读。
+    """
+    
+    # 定长列及其 array 类型码（快照文件按此顺序逐列存放）
+    COLUMNS = (
+        ('dir_ids', 'I'), ('lang_ids', 'H'), ('sizes', 'q'), ('total_lines', 'q'),
+        ('code_lines', 'q'), ('comment_lines', 'q'), ('blank_lines', 'q'),
+        ('_name_ends', 'q'), ('_digest_ends', 'q'),
+        ('functions', 'I'), ('complexity', 'I'), ('max_complexity', 'I'),
+    )
+    # 变长字节列（按 _name_ends / _digest_ends 切分）
+    BLOBS = ('_names', '_digests')
+    
+    def __init__(self):
+        self.dirs: List[str] = []        # 目录前缀（含末尾分隔符）
+        self.languages: List[str] = []
+        self._dir_ids: Dict[str, int] = {}
+        self._lang_ids: Dict[str, int] = {}
+        self.dir_ids = array('I')
+        self.lang_ids = array('H')
+        self.sizes = array('q')
+        self.total_lines = array('q')
+        self.code_lines = array('q')
+        self.comment_lines = array('q')
+        self.blank_lines = array('q')
+        self._names = bytearray()
+        self._name_ends = array('q')
+        self._digests = bytearray()
+        self._digest_ends = array('q')
+        self.functions = array('I')
+        self.complexity = array('I')
+        self.max_complexity = array('I')
+    
+    def __len__(self) -> int:
+        return len(self.sizes)
+    
+    def _intern(self, table: List[str], ids: Dict[str, int], value: str) -> int:
+        i = ids.get(value)
+        if i is None:
+            i = ids[value] = len(table)
+            table.append(value)
+        return i
+    
+    def append(self, f: FileStats) -> int:
+        """追加一个文件（f.name 必须是 f.path 的末尾部分），返回行号"""
+        if not f.path.endswith(f.name):
+            raise ValueError(f'文件名与路径不一致: {f.path!r} / {f.name!r}')
+        self.dir_ids.append(self._intern(self.dirs, self._dir_ids, f.path[:len(f.path) - len(f.name)]))
+        self.lang_ids.append(self._intern(self.languages, self._lang_ids, f.language))
+        self.sizes.append(f.size)
+        self.total_lines.append(f.total_lines)
+        self.code_lines.append(f.code_lines)
+        self.comment_lines.append(f.comment_lines)
+        self.blank_lines.append(f.blank_lines)
+        self._names += f.name.encode('utf-8', 'surrogateescape')
+        self._name_ends.append(len(self._names))
+        self._digests += bytes.fromhex(f.digest)
+        self._digest_ends.append(len(self._digests))
+        self.functions.append(f.functions)
+        self.complexity.append(f.complexity)
+        self.max_complexity.append(f.max_complexity)
+        return len(self.sizes) - 1
+    
+    def __getitem__(self, i: int) -> FileStats:
+        if i < 0:
+            i += len(self.sizes)
+        name_ends = self._name_ends
+        digest_ends = self._digest_ends
+        name = str(self._names[name_ends[i - 1] if i else 0:name_ends[i]], 'utf-8', 'surrogateescape')
+        return FileStats(
+            self.dirs[self.dir_ids[i]] + name, name, self.languages[self.lang_ids[i]],
+            self.sizes[i], self.total_lines[i], self.code_lines[i], self.comment_lines[i],
+            self.blank_lines[i], self._digests[digest_ends[i - 1] if i else 0:digest_ends[i]].hex(),
+            self.functions[i], self.complexity[i], self.max_complexity[i],
+        )
+    
+    def iter_digests(self):
+        """按行产出内容哈希（原始字节，未记录时为空）"""
+        data = self._digests
+        start = 0
+        for end in self._digest_ends:
+            yield data[start:end]
+            start = end
+    
+    def iter_rows(self, rows: range):
+        for i in rows:
+            yield self[i]
+    
+    def __iter__(self):
+        return self.iter_rows(range(len(self)))
+
+
+# 文件排名键：键名 -> (取值函数, 显示名称)
+RANK_KEYS = {
+    'code': (lambda f: f.code_lines, 'code lines'),
+    'size': (lambda f: f.size, 'size'),
+    'comment-ratio': (lambda f: f.comment_lines / f.code_lines if f.code_lines else 0.0, 'comment ratio'),
+    'blank-ratio': (lambda f: f.blank_lines / f.total_lines if f.total_lines else 0.0, 'blank ratio'),
+}
+
+
+class Ranking:
+    """
+    按多个排序键同时保留 Top N 文件（每个键一个有界小顶堆）
+    
+    扫描时逐文件加入，每个文件 O(K log N)；取值相同的文件按加入顺序排名，结果与
+    对全部文件按该键稳定降序排序后取前 N 个一致。
+    """
+    
+    def __init__(self, n: int, keys=tuple(RANK_KEYS)):
+        self.n = n
+        self._heaps = [(key, RANK_KEYS[key][0], []) for key in keys]
+        self._seq = 0
+    
+    def add(self, f: FileStats):
+        seq = -self._seq
+        self._seq += 1
+        n = self.n
+        for _, value_of, heap in self._heaps:
+            item = (value_of(f), seq, f)
+            if len(heap) < n:
+                heapq.heappush(heap, item)
+            elif n > 0 and item[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, item)
+    
+    def has(self, key: str) -> bool:
+        return any(k == key for k, _, _ in self._heaps)
+    
+    def top(self, key: str = 'code', n: Optional[int] = None) -> List[FileStats]:
+        """按 key 排名的前 n 个文件（n 不超过 self.n）"""
+        heap = next(h for k, _, h in self._heaps if k == key)
+        ranked = [item[2] for item in sorted(heap, key=lambda x: (x[0], x[1]), reverse=True)]
+        return ranked if n is None else ranked[:n]
+
+
+class ScanSummary:
+    """
+    扫描结果的汇总结构：语言统计、按目录树顺序排列的文件索引、Top N 文件堆、
+    健康度计数、各文件的依赖记号（路径 -> imports，供构建依赖关系图）
+    
+    扫描器在组装目录树的同一遍中逐文件累计，报告输出直接使用，不再重复遍历
+    目录树。流式模式不保留文件索引和依赖 (keep_files=False)。
+    """
+    
+    TOP_N = 10
+    
+    def __init__(self, top_n: int = TOP_N, keep_files: bool = True):
+        self.languages: Dict[str, LanguageStats] = {}
+        self.files: Optional[FileTable] = FileTable() if keep_files else None
+        self.ranking = Ranking(top_n)
+        self.health = HealthTracker()
+        self.imports: Dict[str, Tuple[str, ...]] = {}
+    
+    def add(self, f: FileStats) -> Optional[int]:
+        """累计一个文件，返回其在文件索引中的行号"""
+        ls = self.languages.get(f.language)
+        if ls is None:
+            ls = self.languages[f.language] = LanguageStats(language=f.language)
+        ls.file_count += 1
+        ls.total_lines += f.total_lines
+        ls.code_lines += f.code_lines
+        ls.comment_lines += f.comment_lines
+        ls.blank_lines += f.blank_lines
+        ls.total_size += f.size
+        self.ranking.add(f)
+        self.health.add(f)
+        if self.files is not None:
+            if f.imports:
+                self.imports[f.path] = f.imports
+            return self.files.append(f)
+        return None
+    
+    def top_files(self, n: int, key: str = 'code') -> List[FileStats]:
+        """
+        按 key（RANK_KEYS 中的键）排名的前 n 个文件，与稳定排序后取前 n 个一致
+        
+        n 不超过扫描时的堆大小时直接取堆中结果，否则对文件索引做一次
+        O(N log n) 的 nlargest。
+        """
+        if (n <= self.ranking.n and self.ranking.has(key)) or self.files is None:
+            return self.ranking.top(key, n)
+        return heapq.nlargest(n, self.files, key=RANK_KEYS[key][0])
+
+
+def scan_summary(dir_stats: DirStats) -> ScanSummary:
+    """返回扫描时累计的汇总；对没有汇总的目录树（如手工构建）遍历一次补建"""
+    if dir_stats.summary is None:
+        summary = ScanSummary()
+        for f in iter_files(dir_stats):
+            summary.add(f)
+        dir_stats.summary = summary
+    return dir_stats.summary
+
+
+def collect_by_language(dir_stats: DirStats) -> Dict[str, LanguageStats]:
+    """按语言收集统计"""
+    return scan_summary(dir_stats).languages
+
+
+def collect_all_files(dir_stats: DirStats) -> FileTable:
+    """收集所有文件（按目录树顺序的列式存储，按下标或迭代得到 FileStats）"""
+    return scan_summary(dir_stats).files
+
+
+class DirIndex:
+    """
+    目录树的可增量更新索引
+    
+    把目录树中的文件行展开为 FileStats 对象（不再引用 FileTable，依赖记号从汇总中
+    取回），建立路径 -> 目录节点 / 文件的索引、父节点链接和每个目录的名称 -> 子项
+    索引。apply_file_change() 只沿祖先链更新目录汇总和语言统计（O(深度)），并按需
+    创建或裁剪目录节点：与 scan_directory 一致，不含文件的目录不出现在树中。子项的
+    增删只更新名称索引（O(1)），变化过的目录在 sort_children() 时才重新排列
+    children，供渲染使用。
+    
+    变化后根目录的 summary 置空，需要 Top N、健康度等时由 scan_summary 遍历全部
+    文件补建，代价为 O(文件数)：排名和健康度示例按目录树顺序决定先后，删除或修改
+    排名中的文件后需要其余全部文件才能补位，无法只按变化的文件增量维护。--watch
+    每次刷新本来就要重写列出全部文件的 latest.* 报告，补建与之同阶；不保存报告
+    (--no-save) 时只读取目录汇总，不会补建。
+    """
+    
+    def __init__(self, root: DirStats):
+        summary = scan_summary(root)
+        self.languages = {k: LanguageStats(**asdict(v)) for k, v in summary.languages.items()}
+        self.root = root
+        self.dirs: Dict[str, DirStats] = {}
+        self.files: Dict[str, FileStats] = {}
+        self.parents: Dict[str, DirStats] = {}  # 文件或目录路径 -> 父目录节点
+        self.entries: Dict[str, Dict[str, object]] = {}  # 目录路径 -> {名称: 子目录或文件}
+        self._unsorted: Dict[str, DirStats] = {}  # children 待重新排列的目录
+        
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            node.children = list(node.iter_children())
+            node.table = None
+            node.rows = range(0)
+            self.dirs[node.path] = node
+            self.entries[node.path] = {child.name: child for child in node.children}
+            for child in node.children:
+                self.parents[child.path] = node
+                if isinstance(child, DirStats):
+                    stack.append(child)
+                else:
+                    # FileTable 视图不含依赖记号，从汇总中取回
+                    child.imports = summary.imports.get(child.path, child.imports)
+                    self.files[child.path] = child
+        root.summary = None
+    
+    def _ancestors(self, node: DirStats):
+        """node 及其所有祖先目录（沿父节点链接向上）"""
+        while node is not None:
+            yield node
+            node = self.parents.get(node.path)
+    
+    def _bubble(self, node: DirStats, sign: int, f: FileStats):
+        """把文件 f 的统计以 sign (+1/-1) 累加到 node 及其祖先目录和语言汇总"""
+        for d in self._ancestors(node):
+            d.file_count += sign
+            d.total_size += sign * f.size
+            d.total_lines += sign * f.total_lines
+            d.code_lines += sign * f.code_lines
+            d.comment_lines += sign * f.comment_lines
+            d.blank_lines += sign * f.blank_lines
+        
+        ls = self.languages.get(f.language)
+        if ls is None:
+            ls = self.languages[f.language] = LanguageStats(language=f.language)
+        ls.file_count += sign
+        ls.total_size += sign * f.size
+        ls.total_lines += sign * f.total_lines
+        ls.code_lines += sign * f.code_lines
+        ls.comment_lines += sign * f.comment_lines
+        ls.blank_lines += sign * f.blank_lines
+        if ls.file_count == 0:
+            del self.languages[f.language]
+    
+    def _insert(self, parent: DirStats, child):
+        self.entries[parent.path][child.name] = child
+        self._unsorted[parent.path] = parent
+        self.parents[child.path] = parent
+        if isinstance(child, DirStats):
+            self.entries[child.path] = {}
+    
+    def _remove(self, parent: DirStats, child):
+        del self.entries[parent.path][child.name]
+        self._unsorted[parent.path] = parent
+        del self.parents[child.path]
+        if isinstance(child, DirStats):
+            del self.entries[child.path]
+            self._unsorted.pop(child.path, None)
+    
+    def sort_children(self):
+        """按名称重新排列变化过的目录的 children（与扫描时的排序一致），渲染前调用"""
+        for path, node in self._unsorted.items():
+            entries = self.entries[path]
+            node.children = [entries[name] for name in sorted(entries)]
+        self._unsorted.clear()
+    
+    def _dir_node(self, dir_path: str) -> DirStats:
+        """返回 dir_path 的目录节点，不存在时连同缺失的上级目录一并创建"""
+        missing = []
+        path = dir_path
+        while path not in self.dirs:
+            parent_path = os.path.dirname(path)
+            if parent_path == path:
+                raise ValueError(f"路径不在目录树中: {dir_path}")
+            missing.append(path)
+            path = parent_path
+        
+        parent = self.dirs[path]
+        for d in self._ancestors(parent):
+            d.dir_count += len(missing)
+        for depth, path in enumerate(reversed(missing)):
+            node = DirStats(path=path, name=os.path.basename(path),
+                            dir_count=len(missing) - 1 - depth)
+            self._insert(parent, node)
+            self.dirs[path] = node
+            parent = node
+        return parent
+    
+    def _prune(self, node: DirStats):
+        """自 node 向上移除不再含有文件的目录（根目录保留）"""
+        while node is not self.root and node.file_count == 0:
+            parent = self.parents[node.path]
+            self._remove(parent, node)
+            del self.dirs[node.path]
+            for d in self._ancestors(parent):
+                d.dir_count -= 1 + node.dir_count
+            node = parent
+    
+    def apply_file_change(self, path: str, old_stats: Optional[FileStats],
+                          new_stats: Optional[FileStats]):
+        """
+        应用一个文件的变化：old_stats 为 None 表示新增，new_stats 为 None 表示删除
+        
+        old_stats 必须与索引中的状态一致（文件已在树中时须等于索引中的记录，不在
+        树中时为 None），否则抛出 ValueError。汇总中减去的始终是索引中的记录。
+        新增或删除的子项在调用 sort_children() 后才反映到父目录的 children 中。
+        """
+        if old_stats != self.files.get(path):
+            raise ValueError(f"文件状态与索引不一致: {path}")
+        if old_stats is None and new_stats is None:
+            return
+        
+        if old_stats is None:
+            parent = self._dir_node(os.path.dirname(path))
+            self.files[path] = new_stats
+            self._insert(parent, new_stats)
+            self._bubble(parent, 1, new_stats)
+        else:
+            parent = self.parents[path]
+            current = self.files[path]
+            self._bubble(parent, -1, current)
+            if new_stats is None:
+                del self.files[path]
+                self._remove(parent, current)
+                self._prune(parent)
+            else:
+                # 原地更新，父目录中的位置不变
+                for fld in fields(FileStats):
+                    setattr(current, fld.name, getattr(new_stats, fld.name))
+                self._bubble(parent, 1, current)
+        self.root.summary = None
+
+
+def calculate_cocomo(code_lines: int, project_type: str = 'semi-detached') -> Dict:
+    """计算 COCOMO 估算"""
+    if code_lines == 0:
+        return {
+            'kloc': 0,
+            'person_months': 0,
+            'duration_months': 0,
+            'team_size': 0,
+            'cost_usd': 0,
+            'cost_cny': 0,
+            'project_type': project_type,
+        }
+    
+    kloc = code_lines / 1000
+    params = COCOMO_PARAMS.get(project_type, COCOMO_PARAMS['semi-detached'])
+    
+    person_months = params['a'] * (kloc ** params['b'])
+    duration_months = params['c'] * (person_months ** params['d'])
+    team_size = person_months / duration_months if duration_months > 0 else 0
+    
+    return {
+        'kloc': round(kloc, 2),
+        'person_months': round(person_months, 1),
+        'duration_months': round(duration_months, 1),
+        'team_size': round(team_size, 1),
+        'cost_usd': int(person_months * COST_PER_PERSON_MONTH_USD),
+        'cost_cny': int(person_months * COST_PER_PERSON_MONTH_CNY),
+        'project_type': project_type,
+        'project_type_desc': params['desc'],
+    }
+
+
+class HealthTracker:
+    """
+    逐文件累计大文件、低注释文件、圈复杂度等健康度指标
+    
+    只保留计数和前 5 个示例文件，可在流式扫描中边扫描边累计。
+    """
+    
+    SAMPLE_SIZE = 5
+    COMPLEXITY_THRESHOLD = 10  # 最复杂函数超过该值的文件计为高复杂度文件
+    
+    def __init__(self, files=()):
+        self.large_count = 0
+        self.large_files = []
+        self.low_comment_count = 0
+        self.low_comment_files = []
+        self.functions = 0
+        self.complexity = 0
+        self.complex_count = 0
+        self.complex_files = []
+        for f in files:
+            self.add(f)
+    
+    def add(self, f: FileStats):
+        if f.code_lines > 800:
+            self.large_count += 1
+            if len(self.large_files) < self.SAMPLE_SIZE:
+                self.large_files.append({'path': f.path, 'lines': f.code_lines})
+        
+        if f.code_lines > 100 and f.comment_lines / f.code_lines < 0.05:
+            self.low_comment_count += 1
+            if len(self.low_comment_files) < self.SAMPLE_SIZE:
+                self.low_comment_files.append(
+                    {'path': f.path, 'ratio': round(f.comment_lines / f.code_lines * 100, 1)})
+        
+        self.functions += f.functions
+        self.complexity += f.complexity
+        if f.max_complexity > self.COMPLEXITY_THRESHOLD:
+            self.complex_count += 1
+            if len(self.complex_files) < self.SAMPLE_SIZE:
+                self.complex_files.append({'path': f.path, 'max_complexity': f.max_complexity})
+    
+    def metrics(self) -> Dict:
+        metrics = {
+            'large_files': {
+                'value': self.large_count,
+                'unit': '个',
+                'status': 'warning' if self.large_count else 'good',
+                'desc': '大文件 (>800行代码)',
+                'files': list(self.large_files),
+            },
+            'low_comment_files': {
+                'value': self.low_comment_count,
+                'unit': '个',
+                'status': 'warning' if self.low_comment_count else 'good',
+                'desc': '低注释文件 (<5%注释)',
+                'files': list(self.low_comment_files),
+            },
+        }
+        
+        # 圈复杂度（只有包含可分析语言的函数时才输出）
+        if self.functions > 0:
+            avg = self.complexity / self.functions
+            metrics['avg_complexity'] = {
+                'value': round(avg, 1),
+                'unit': '',
+                'status': 'good' if avg <= 5 else 'warning' if avg <= 10 else 'bad',
+                'desc': f'平均圈复杂度 ({self.functions:,} 个函数，建议 ≤5)',
+            }
+            metrics['complex_files'] = {
+                'value': self.complex_count,
+                'unit': '个',
+                'status': 'warning' if self.complex_count else 'good',
+                'desc': f'高复杂度文件 (函数圈复杂度 >{self.COMPLEXITY_THRESHOLD})',
+                'files': list(self.complex_files),
+            }
+        return metrics
+
+
+def calculate_health(dir_stats: DirStats, all_files) -> Dict:
+    """
+    计算代码健康度指标
+    
+    Args:
+        dir_stats: 根目录统计
+        all_files: 文件列表（任意可迭代对象），或已累计好的 HealthTracker
+    """
+    metrics = {}
+    
+    # 注释率
+    if dir_stats.code_lines > 0:
+        ratio = dir_stats.comment_lines / dir_stats.code_lines
+        metrics['comment_ratio'] = {
+            'value': round(ratio * 100, 1),
+            'unit': '%',
+            'status': 'good' if 0.15 <= ratio <= 0.30 else 
+                      'warning' if 0.10 <= ratio <= 0.40 else 'bad',
+            'desc': '注释率 (建议 15-30%)',
+        }
+    
+    # 平均文件行数
+    if dir_stats.file_count > 0:
+        avg = dir_stats.total_lines / dir_stats.file_count
+        metrics['avg_file_lines'] = {
+            'value': int(avg),
+            'unit': '行',
+            'status': 'good' if 100 <= avg <= 500 else
+                      'warning' if 50 <= avg <= 800 else 'bad',
+            'desc': '平均文件行数 (建议 100-500)',
+        }
+    
+    # 代码密度
+    if dir_stats.total_lines > 0:
+        density = dir_stats.code_lines / dir_stats.total_lines
+        metrics['code_density'] = {
+            'value': round(density * 100, 1),
+            'unit': '%',
+            'status': 'info',
+            'desc': '代码密度 (代码行/总行)',
+        }
+    
+    # 大文件 / 低注释文件
+    tracker = all_files if isinstance(all_files, HealthTracker) else HealthTracker(all_files)
+    metrics.update(tracker.metrics())
+    
+    return metrics
+
+
+def find_duplicates(all_files, top_n: int = 10) -> Dict:
+    """
+    按内容哈希查找重复文件
+    
+    每组重复文件保留一份，其余副本计为可节省的字节数和行数；空文件不计入。
+    
+    Returns:
+        {'groups', 'files', 'bytes_saved', 'lines_saved', 'top': 按节省字节数排序的前 N 组}
+    """
+    groups = defaultdict(list)
+    if isinstance(all_files, FileTable):
+        # 列式存储：只比较哈希列，重复的行才生成 FileStats
+        sizes = all_files.sizes
+        for i, digest in enumerate(all_files.iter_digests()):
+            if digest and sizes[i] > 0:
+                groups[bytes(digest)].append(i)
+        groups = {key: [all_files[i] for i in rows] for key, rows in groups.items() if len(rows) > 1}
+    else:
+        for f in all_files:
+            if f.digest and f.size > 0:
+                groups[f.digest].append(f)
+    
+    dup_groups = []
+    for files in groups.values():
+        if len(files) > 1:
+            copies = len(files) - 1
+            dup_groups.append({
+                'digest': files[0].digest,
+                'count': len(files),
+                'size': files[0].size,
+                'lines': files[0].total_lines,
+                'bytes_saved': files[0].size * copies,
+                'lines_saved': files[0].total_lines * copies,
+                'paths': [f.path for f in files],
+            })
+    
+    dup_groups.sort(key=lambda g: g['bytes_saved'], reverse=True)
+    
+    return {
+        'groups': len(dup_groups),
+        'files': sum(g['count'] - 1 for g in dup_groups),
+        'bytes_saved': sum(g['bytes_saved'] for g in dup_groups),
+        'lines_saved': sum(g['lines_saved'] for g in dup_groups),
+        'top': dup_groups[:top_n],
+    }
+
+
+# 依赖关系图中 JS/TS 相对导入依次尝试的后缀（与打包工具的解析顺序一致）
+_JS_RESOLVE_SUFFIXES = ('', '.ts', '.tsx', '.js', '.jsx', '.mjs', '.cjs',
+                        '/index.ts', '/index.tsx', '/index.js', '/index.jsx')
+# 每个环最多列出的模块数
+CYCLE_MEMBERS_LIMIT = 20
+# Python 标准库的顶层模块名（3.10+），依赖关系图中总是视为外部依赖
+_PYTHON_STDLIB = frozenset(getattr(sys, 'stdlib_module_names', ()))
+
+
+def _closest_module(candidates: List[str], rel: str) -> str:
+    """多个模块同名时，取与导入方共同目录前缀最长的一个"""
+    if len(candidates) == 1:
+        return candidates[0]
+    parts = rel.split('/')
+    
+    def shared(candidate):
+        n = 0
+        for a, b in zip(candidate.split('/'), parts):
+            if a != b:
+                break
+            n += 1
+        return n
+    return max(candidates, key=shared)
+
+
+def _go_module_path(root: str, rel_dir: str, memo: Dict[str, Optional[Tuple[str, str]]]):
+    """rel_dir 所在 Go 模块的 (模块根相对路径, module 路径)：向上查找 go.mod，找不到时为 None"""
+    if rel_dir in memo:
+        return memo[rel_dir]
+    result = None
+    try:
+        with open(os.path.join(root, rel_dir, 'go.mod'), encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                words = line.split()
+                if len(words) >= 2 and words[0] == 'module':
+                    result = (rel_dir, words[1].strip('"'))
+                    break
+    except OSError:
+        pass
+    if result is None and rel_dir:
+        result = _go_module_path(root, posixpath.dirname(rel_dir), memo)
+    memo[rel_dir] = result
+    return result
+
+
+def _find_cycles(graph: Dict[str, List[str]]) -> List[List[str]]:
+    """Tarjan 强连通分量（显式栈，非递归），返回含两个及以上模块的分量"""
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    cycles = []
+    for start in graph:
+        if start in index:
+            continue
+        index[start] = low[start] = len(index)
+        stack.append(start)
+        on_stack.add(start)
+        work = [(start, iter(graph[start]))]
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph.get(succ, ()))))
+                    break
+                if succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    if len(component) > 1:
+                        cycles.append(component)
+    return cycles
+
+
+def build_dependency_graph(root: str, all_files, imports: Dict[str, Tuple[str, ...]],
+                           top_n: int = 10) -> Dict:
+    """
+    由扫描时提取的依赖记号构建模块级依赖关系图
+    
+    模块为 DEPENDENCY_KINDS 中语言的文件（相对 root 的路径）；Go 以包（目录）为
+    模块。依赖记号解析为项目内的模块：C/C++ 的 "..." 先相对当前目录，之后与
+    <...> 一样只在可能的包含目录（导入方所在目录及其各级上级目录、名为 include
+    的目录）下查找；Python 绝对导入只在包根（root 和顶层包的上级目录，即不含
+    __init__.py 的目录）以及导入方所在的非包目录下查找，标准库模块名总是视为外部
+    依赖，相对导入按包目录解析；JS/TS 只解析相对路径；Go 按 go.mod 的 module
+    路径解析，没有 go.mod 时按至少两级的路径后缀匹配。同名候选取与导入方目录
+    最接近的一个；无法解析的（标准库、第三方包）计入 unresolved。
+    
+    Returns:
+        {'modules', 'edges', 'unresolved', 'cycles', 'top_fan_in', 'top_fan_out',
+         'directories': 按目录汇总（目录间 fan-in/fan-out、内部依赖数）,
+         'directory_edges': 边数最多的目录间依赖, 'graph': 模块 -> 依赖的模块列表}
+    """
+    prefix = os.path.join(root, '')
+    kinds = {}      # 文件相对路径 -> 解析方式
+    node_of = {}    # 文件相对路径 -> 模块
+    include_dirs = set()            # 名为 include 的目录（C/C++ <...> 的包含目录）
+    go_packages = {}                # Go 包目录 -> 导入路径（无 go.mod 时为 None）
+    go_modules = {}
+    for f in all_files:
+        kind = DEPENDENCY_KINDS.get(f.language)
+        if kind is None or not f.path.startswith(prefix):
+            continue
+        rel = f.path[len(prefix):].replace(os.sep, '/')
+        kinds[rel] = kind
+        if kind == 'go':
+            rel_dir = posixpath.dirname(rel)
+            node_of[rel] = rel_dir or '.'
+            if rel_dir not in go_packages:
+                module = _go_module_path(root, rel_dir, go_modules)
+                if module is not None:
+                    sub = rel_dir[len(module[0]):].lstrip('/')
+                    go_packages[rel_dir] = f"{module[1]}/{sub}" if sub else module[1]
+                else:
+                    go_packages[rel_dir] = None
+        else:
+            node_of[rel] = rel
+            if kind == 'c':
+                parts = rel.split('/')
+                for i, part in enumerate(parts[:-1]):
+                    if part == 'include':
+                        include_dirs.add('/'.join(parts[:i + 1]))
+    
+    # Python 包（含 __init__.py 的目录）与包根：root 和顶层包的上级目录。模块按
+    # 相对包根的路径索引，不在包根下的文件只能被同目录的脚本导入
+    py_packages = {posixpath.dirname(rel) for rel, kind in kinds.items()
+                   if kind == 'python' and posixpath.basename(rel) == '__init__.py'}
+    py_roots = {''}
+    for package in py_packages:
+        parent = posixpath.dirname(package)
+        if parent not in py_packages:
+            py_roots.add(parent)
+    py_modules = defaultdict(list)  # 相对包根的路径 -> 文件模块
+    for rel, kind in kinds.items():
+        if kind != 'python':
+            continue
+        top = posixpath.dirname(rel)
+        while top and top in py_packages:
+            top = posixpath.dirname(top)
+        if top in py_roots:
+            py_modules[rel[len(top) + 1:] if top else rel].append(rel)
+    
+    # Go 包的导入路径；无 go.mod 的包以 项目目录名/相对路径 参与后缀匹配
+    go_imports = {}
+    go_suffix = defaultdict(list)
+    root_name = os.path.basename(os.path.normpath(root))
+    for rel_dir, import_path in go_packages.items():
+        node = rel_dir or '.'
+        if import_path is not None:
+            go_imports[import_path] = node
+        else:
+            parts = ([root_name] if root_name else []) + (rel_dir.split('/') if rel_dir else [])
+            for i in range(len(parts) - 1):
+                go_suffix['/'.join(parts[i:])].append(node)
+    
+    def resolve(rel: str, kind: str, spec: str) -> Optional[str]:
+        base = posixpath.dirname(rel)
+        if kind == 'c':
+            name = posixpath.normpath(spec[1:])
+            if spec[0] == '"':
+                candidate = posixpath.normpath(posixpath.join(base, name))
+                if candidate in node_of:
+                    return candidate
+            if name.startswith('../'):
+                return None
+            dirs = include_dirs | {''}
+            d = base
+            while d:
+                dirs.add(d)
+                d = posixpath.dirname(d)
+            candidates = [c for c in (posixpath.join(d, name) for d in sorted(dirs)) if c in node_of]
+            return _closest_module(candidates, rel) if candidates else None
+        if kind == 'js':
+            if not (spec.startswith('./') or spec.startswith('../') or spec in ('.', '..')):
+                return None
+            stem = posixpath.normpath(posixpath.join(base, spec))
+            for suffix in _JS_RESOLVE_SUFFIXES:
+                if stem + suffix in node_of:
+                    return stem + suffix
+            return None
+        if kind == 'go':
+            if spec in go_imports:
+                return go_imports[spec]
+            parts = spec.split('/')
+            for i in range(len(parts) - 1):
+                candidates = go_suffix.get('/'.join(parts[i:]))
+                if candidates:
+                    return _closest_module(candidates, rel)
+            return None
+        # Python: a.b.c 依次尝试 a/b/c、a/b、a（from a.b import c 中 c 可能只是名称）
+        level = len(spec) - len(spec.lstrip('.'))
+        parts = spec[level:].split('.') if spec[level:] else []
+        if level:
+            for _ in range(level - 1):
+                base = posixpath.dirname(base)
+            for k in range(len(parts), -1, -1):
+                stem = posixpath.join(base, *parts[:k])
+                for candidate in ((stem + '.py', stem + '/__init__.py') if k else
+                                  (posixpath.join(base, '__init__.py'),)):
+                    if candidate in node_of:
+                        return candidate
+            return None
+        if not parts or parts[0] in _PYTHON_STDLIB:
+            return None
+        for k in range(len(parts), 0, -1):
+            stem = '/'.join(parts[:k])
+            for candidate in (stem + '.py', stem + '/__init__.py'):
+                # 脚本所在目录（非包目录）优先，与 sys.path[0] 一致
+                if base not in py_packages:
+                    local = posixpath.join(base, candidate)
+                    if local in node_of:
+                        return local
+                if candidate in py_modules:
+                    return _closest_module(py_modules[candidate], rel)
+        return None
+    
+    graph = defaultdict(set)
+    unresolved = 0
+    for path, specs in imports.items():
+        if not path.startswith(prefix):
+            continue
+        rel = path[len(prefix):].replace(os.sep, '/')
+        kind = kinds.get(rel)
+        if kind is None:
+            continue
+        source = node_of[rel]
+        for spec in specs:
+            target = resolve(rel, kind, spec)
+            if target is None:
+                unresolved += 1
+            elif target != source:
+                graph[source].add(target)
+    graph = {node: sorted(targets) for node, targets in sorted(graph.items())}
+    
+    fan_in = defaultdict(int)
+    for targets in graph.values():
+        for target in targets:
+            fan_in[target] += 1
+    modules = set(node_of.values())
+    
+    def module_row(node):
+        return {'module': node, 'fan_in': fan_in.get(node, 0), 'fan_out': len(graph.get(node, ()))}
+    
+    top_fan_in = sorted(fan_in, key=lambda n: (-fan_in[n], n))[:top_n]
+    top_fan_out = sorted(graph, key=lambda n: (-len(graph[n]), n))[:top_n]
+    
+    cycles = _find_cycles(graph)
+    cycles.sort(key=len, reverse=True)
+    
+    # 按目录汇总：Go 包即目录，其余模块取所在目录
+    def dir_of(node):
+        if kinds.get(node, 'go') == 'go':
+            return node
+        return posixpath.dirname(node) or '.'
+    
+    dir_modules = defaultdict(int)
+    for node in modules:
+        dir_modules[dir_of(node)] += 1
+    dir_edges = defaultdict(int)
+    internal = defaultdict(int)
+    for source, targets in graph.items():
+        source_dir = dir_of(source)
+        for target in targets:
+            target_dir = dir_of(target)
+            if target_dir == source_dir:
+                internal[source_dir] += 1
+            else:
+                dir_edges[(source_dir, target_dir)] += 1
+    dir_fan_in = defaultdict(int)
+    dir_fan_out = defaultdict(int)
+    for source_dir, target_dir in dir_edges:
+        dir_fan_out[source_dir] += 1
+        dir_fan_in[target_dir] += 1
+    directories = [
+        {'path': d, 'modules': count, 'internal_edges': internal.get(d, 0),
+         'fan_in': dir_fan_in.get(d, 0), 'fan_out': dir_fan_out.get(d, 0)}
+        for d, count in dir_modules.items()
+    ]
+    directories.sort(key=lambda d: (-(d['fan_in'] + d['fan_out']), d['path']))
+    
+    return {
+        'modules': len(modules),
+        'edges': sum(len(targets) for targets in graph.values()),
+        'unresolved': unresolved,
+        'cycles': {
+            'count': len(cycles),
+            'modules': sum(len(c) for c in cycles),
+            'top': [{'size': len(c), 'modules': sorted(c)[:CYCLE_MEMBERS_LIMIT]} for c in cycles[:top_n]],
+        },
+        'top_fan_in': [module_row(n) for n in top_fan_in],
+        'top_fan_out': [module_row(n) for n in top_fan_out],
+        'directories': directories,
+        'directory_edges': [
+            {'from': a, 'to': b, 'edges': n}
+            for (a, b), n in sorted(dir_edges.items(), key=lambda item: (-item[1], item[0]))[:top_n]
+        ],
+        'graph': graph,
+    }
+
+
+# ============================================================================
+# 流式扫描
+# ============================================================================
+def write_ndjson(out, record: Dict):
+    """写入一条 NDJSON 记录"""
+    out.write(json.dumps(record, ensure_ascii=False))
+    out.write('\n')
+
+
+def _dir_record(dir_stats: DirStats) -> Dict:
+    return {
+        'type': 'directory',
+        'path': dir_stats.path,
+        'name': dir_stats.name,
+        'file_count': dir_stats.file_count,
+        'dir_count': dir_stats.dir_count,
+        'total_size': dir_stats.total_size,
+        'total_lines': dir_stats.total_lines,
+        'code_lines': dir_stats.code_lines,
+        'comment_lines': dir_stats.comment_lines,
+        'blank_lines': dir_stats.blank_lines,
+    }
+
+
+def stream_scan(dir_path: str, out, ignore_patterns: List[str] = None,
+                jobs: int = 1, pool: str = 'process', follow_symlinks: bool = True,
+                top_n: int = 10, top_by: str = 'code') -> Tuple[DirStats, Dict[str, LanguageStats], HealthTracker, List[FileStats]]:
+    """
+    流式扫描目录
+    
+    每扫描完一个文件就写出一条 NDJSON 记录，离开目录时写出目录汇总记录，
+    最后写出各语言汇总记录。不构建目录树，只保留目录栈上的累加器、语言汇总、
+    健康度计数和 Top N 文件，内存占用与文件总数无关。
+    
+    Returns:
+        (根目录汇总（不含 children）, 语言统计, 健康度累计, Top N 文件)
+    """
+    if ignore_patterns is None:
+        ignore_patterns = []
+    
+    reset_count_memo()
+    matcher = _profile_matcher(get_ignore_matcher(tuple(ignore_patterns)))
+    events = iter_walk(dir_path, matcher, follow_symlinks)
+    
+    summary = ScanSummary(top_n, keep_files=False)
+    stack = []
+    root = None
+    
+    for event, path, file_stats in _iter_scan_events(events, jobs, pool):
+        if event == WALK_FILE:
+            if file_stats is None:
+                continue
+            # 字段与 JSON 报告中的文件节点相同（不含依赖记号，见 _FILE_JSON_FIELDS）
+            record = {key: getattr(file_stats, key) for key in _FILE_JSON_FIELDS}
+            record['type'] = 'file'
+            write_ndjson(out, record)
+            
+            _accumulate(stack[-1], file_stats)
+            summary.add(file_stats)
+        elif event == WALK_ENTER:
+            stack.append(_new_dir_stats(path))
+        else:
+            dir_stats = stack.pop()
+            if not stack:
+                root = dir_stats
+                write_ndjson(out, _dir_record(dir_stats))
+            elif dir_stats.file_count > 0:  # 只保留有文件的目录
+                write_ndjson(out, _dir_record(dir_stats))
+                _accumulate(stack[-1], dir_stats)
+    
+    for ls in summary.languages.values():
+        record = asdict(ls)
+        record['type'] = 'language'
+        write_ndjson(out, record)
+    
+    return root, summary.languages, summary.health, summary.top_files(top_n, top_by)
+
+
+# ============================================================================
+# 增量扫描缓存
+# ============================================================================
+# 影响扫描结果的配置节；输出格式、COCOMO、监视间隔等只影响报告或运行方式
+FINGERPRINT_SECTIONS = ('exclude', 'scan')
+
+
+def config_fingerprint(config: Dict, ignore_patterns: List[str]) -> str:
+    """
+    计算配置指纹：只包含影响扫描结果的配置节、排除规则和版本
+    
+    指纹变化时扫描缓存随之失效，diff 命令据此提示两次扫描的规则不同；修改输出
+    格式等无关设置不会清空缓存。
+    """
+    payload = json.dumps({
+        'version': __version__,
+        'config': {key: config.get(key) for key in FINGERPRINT_SECTIONS},
+        'ignore_patterns': ignore_patterns,
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class ScanCache:
+    """
+    基于 SQLite 的增量扫描缓存
+    
+    以 (path, mtime_ns, size, inode) 判断文件是否变化，未变化的文件直接返回
+    缓存的 FileStats（包括被判定为二进制/未知语言而跳过的文件）。依赖记号随
+    文件一同缓存（换行分隔），即按文件失效的依赖边索引：只有变化的文件需要
+    重新解析，依赖关系图由缓存的记号直接构建。
+    
+    写入每 COMMIT_INTERVAL 条提交一次，扫描中途中断（Ctrl+C、异常）时已统计的
+    结果不会丢失。
+    """
+    
+    SCHEMA_VERSION = 4
+    COMMIT_INTERVAL = 1000
+    
+    def __init__(self, db_path: str, fingerprint: str, max_entries: int = 1000000):
+        self.db_path = db_path
+        self.fingerprint = fingerprint
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._updates = {}
+        self._seen = set()
+        self._uncommitted = 0
+        
+        self._conn = sqlite3.connect(db_path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+        if row is None or row[0] != str(self.SCHEMA_VERSION):
+            # 表结构已变化，重建缓存
+            self._conn.execute("DROP TABLE IF EXISTS files")
+            self._conn.execute("DROP TABLE IF EXISTS blobs")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema', ?)",
+                               (str(self.SCHEMA_VERSION),))
+        
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, inode INTEGER, "
+            "language TEXT, total_lines INTEGER, code_lines INTEGER, "
+            "comment_lines INTEGER, blank_lines INTEGER, digest TEXT, "
+            "functions INTEGER, complexity INTEGER, max_complexity INTEGER, imports TEXT)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "sha TEXT, language TEXT, total_lines INTEGER, code_lines INTEGER, "
+            "comment_lines INTEGER, blank_lines INTEGER, "
+            "functions INTEGER, complexity INTEGER, max_complexity INTEGER, imports TEXT, "
+            "PRIMARY KEY (sha, language))"
+        )
+        
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != fingerprint:
+            # 规则已变化，旧结果全部作废
+            self._conn.execute("DELETE FROM files")
+            self._conn.execute("DELETE FROM blobs")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)",
+                               (fingerprint,))
+            self._conn.commit()
+        
+        for row in self._conn.execute("SELECT * FROM files"):
+            self._entries[row[0]] = row[1:]
+    
+    @staticmethod
+    def stat_key(path: str) -> Optional[Tuple[int, int, int]]:
+        """文件的 (mtime_ns, size, inode)，无法访问时返回 None"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+    
+    def lookup(self, path: str, key: Optional[Tuple[int, int, int]] = None) -> Tuple[bool, Optional[FileStats]]:
+        """
+        查询缓存
+        
+        Args:
+            path: 文件路径
+            key: 已获取的 stat_key(path)，未提供时在此处 stat
+        
+        Returns:
+            (是否命中, FileStats 或 None)
+        """
+        self._seen.add(path)
+        if key is None:
+            key = self.stat_key(path)
+        entry = self._entries.get(path)
+        
+        if key is None or entry is None or tuple(entry[:3]) != key:
+            self.misses += 1
+            self._updates[path] = key
+            return False, None
+        
+        self.hits += 1
+        language = entry[3]
+        if language is None:
+            return True, None
+        
+        return True, FileStats(
+            path=path,
+            name=os.path.basename(path),
+            language=language,
+            size=entry[1],
+            total_lines=entry[4],
+            code_lines=entry[5],
+            comment_lines=entry[6],
+            blank_lines=entry[7],
+            digest=entry[8] or '',
+            functions=entry[9],
+            complexity=entry[10],
+            max_complexity=entry[11],
+            imports=tuple(entry[12].split('\n')) if entry[12] else (),
+        )
+    
+    def store(self, path: str, stats: Optional[FileStats]):
+        """记录文件的扫描结果（None 表示文件被跳过）"""
+        key = self._updates.pop(path, None) or self.stat_key(path)
+        if key is None:
+            return
+        
+        if stats is None:
+            entry = key + (None, 0, 0, 0, 0, '', 0, 0, 0, '')
+        else:
+            entry = key + (stats.language, stats.total_lines, stats.code_lines,
+                           stats.comment_lines, stats.blank_lines, stats.digest,
+                           stats.functions, stats.complexity, stats.max_complexity,
+                           '\n'.join(stats.imports))
+        self._entries[path] = entry
+        self._conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (path,) + entry)
+        self._written()
+    
+    def lookup_blob(self, sha: str, language: str, analyzed: bool = True) -> Optional[Tuple]:
+        """
+        按 Git blob 哈希查询行数统计、圈复杂度与依赖记号
+        (total, code, comment, blank, functions, complexity, max_complexity, imports)
+        
+        analyzed 为 True 时只返回已计算圈复杂度和依赖的记录；只需要行数时（--history）
+        传入 False，未分析的记录中这些值为 0 / 空。
+        """
+        row = self._conn.execute(
+            "SELECT total_lines, code_lines, comment_lines, blank_lines, "
+            "functions, complexity, max_complexity, imports FROM blobs "
+            "WHERE sha = ? AND language = ?", (sha, language)).fetchone()
+        if row is None or (analyzed and row[4] is None):
+            return None
+        return row[:4] + tuple(v or 0 for v in row[4:7]) + (tuple(row[7].split('\n')) if row[7] else (),)
+    
+    def store_blob(self, sha: str, language: str, counts: Tuple, analyzed: bool = True):
+        """
+        记录 Git blob 的行数统计、圈复杂度与依赖记号（顺序同 lookup_blob）
+        
+        analyzed 为 False 时只记录行数，圈复杂度和依赖留空（NULL），--git 扫描
+        查询时视为未命中，重新统计后覆盖。
+        """
+        extra = tuple(counts[4:7]) + ('\n'.join(counts[7]),) if analyzed else (None,) * 4
+        self._conn.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (sha, language) + tuple(counts[:4]) + extra)
+        self._written()
+    
+    def _written(self):
+        """累计未提交的写入，达到 COMMIT_INTERVAL 时提交"""
+        self._uncommitted += 1
+        if self._uncommitted >= self.COMMIT_INTERVAL:
+            self._conn.commit()
+            self._uncommitted = 0
+    
+    def close(self, complete: bool = True):
+        """
+        写入缓存并关闭
+        
+        Args:
+            complete: 本次扫描是否完整结束；只有完整扫描才能判断哪些文件已删除，
+                      此时超出容量才淘汰本次扫描未出现的文件
+        """
+        if complete and len(self._entries) > self.max_entries:
+            stale = [(path,) for path in self._entries if path not in self._seen]
+            self._conn.executemany("DELETE FROM files WHERE path = ?", stale)
+        row = self._conn.execute("SELECT COUNT(*) FROM blobs").fetchone()
+        if row[0] > self.max_entries:
+            # blob 与路径无关，无法判断是否仍被引用，超出容量时整体清空
+            self._conn.execute("DELETE FROM blobs")
+        self._conn.commit()
+        self._conn.close()
+
+
+def open_scan_cache(output_dir: str, config: Dict, ignore_patterns: List[str]) -> Optional[ScanCache]:
+    """打开输出目录下的扫描缓存，不可用时返回 None"""
+    cache_config = config.get('cache', {})
+    if sqlite3 is None or not cache_config.get('enabled', True):
+        return None
+    
+    db_path = os.path.join(output_dir, cache_config.get('filename', '.scan_cache.db'))
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        return ScanCache(db_path, config_fingerprint(config, ignore_patterns),
+                         cache_config.get('max_entries', 1000000))
+    except (OSError, sqlite3.Error) as e:
+        print(f"⚠️ 扫描缓存不可用: {e}")
+        return None
+
+
+# ============================================================================
+# 二进制快照
+# ============================================================================
+# 快照文件布局（整数均为小端，列数据为本机字节序，元数据中记录）:
+#   文件头  magic(8) 格式版本(u32) 保留(u32) 元数据偏移(u64) 元数据长度(u64)
+#   数据段  FileTable 各列、目录前缀表、目录树汇总，每段按 8 字节对齐
+#   元数据  UTF-8 JSON: 版本、时间戳、根目录、配置指纹、语言汇总、各数据段位置
+SNAPSHOT_MAGIC = b'CMSNAP\x00\x01'
+SNAPSHOT_VERSION = 2  # 2: 文件表新增圈复杂度列
+_SNAPSHOT_HEADER = struct.Struct('<8sIIQQ')
+
+# 目录树汇总每个目录保存的字段（快照中按目录展平为一个 array('q')）
+SNAPSHOT_DIR_FIELDS = ('file_count', 'dir_count', 'total_size', 'total_lines',
+                       'code_lines', 'comment_lines', 'blank_lines')
+
+
+def _pack_strings(values) -> Tuple[bytearray, array]:
+    """把字符串连续编码到一个 bytearray 中，返回 (数据, 每项结束位置)"""
+    data = bytearray()
+    ends = array('q')
+    for value in values:
+        data += value.encode('utf-8', 'surrogateescape')
+        ends.append(len(data))
+    return data, ends
+
+
+def _unpack_strings(data, ends) -> List[str]:
+    values = []
+    start = 0
+    for end in ends:
+        values.append(str(data[start:end], 'utf-8', 'surrogateescape'))
+        start = end
+    return values
+
+
+def write_snapshot(out, dir_stats: DirStats, meta: Dict = None):
+    """
+    把扫描结果写成二进制快照（out 为可 seek 的二进制文件对象）
+    
+    包含列式文件表（各列原样写出，不逐行序列化）、语言汇总、每个目录的汇总
+    （路径相对根目录，不同位置检出的同一仓库也能对比），以及 meta 中的
+    配置指纹、扫描耗时等附加信息。
+    """
+    summary = scan_summary(dir_stats)
+    table = summary.files
+    
+    # 目录树汇总（显式栈，前序）
+    dir_paths = []
+    dir_totals = array('q')
+    stack = [(dir_stats, '.')]
+    while stack:
+        node, rel_path = stack.pop()
+        dir_paths.append(rel_path)
+        dir_totals.extend(getattr(node, key) for key in SNAPSHOT_DIR_FIELDS)
+        for child in reversed(node.children):
+            if isinstance(child, DirStats):
+                stack.append((child, child.name if rel_path == '.' else f"{rel_path}/{child.name}"))
+    
+    sections = [(name, getattr(table, name), typecode) for name, typecode in FileTable.COLUMNS]
+    sections += [(name, getattr(table, name), 'B') for name in FileTable.BLOBS]
+    dirs, dir_ends = _pack_strings(table.dirs)
+    paths, path_ends = _pack_strings(dir_paths)
+    sections += [('dirs', dirs, 'B'), ('dir_ends', dir_ends, 'q'),
+                 ('dir_paths', paths, 'B'), ('dir_path_ends', path_ends, 'q'),
+                 ('dir_totals', dir_totals, 'q')]
+    
+    out.write(b'\0' * _SNAPSHOT_HEADER.size)
+    offset = _SNAPSHOT_HEADER.size
+    layout = {}
+    for name, data, typecode in sections:
+        pad = -offset % 8
+        out.write(b'\0' * pad)
+        offset += pad
+        length = len(data) * (data.itemsize if isinstance(data, array) else 1)
+        out.write(data)
+        layout[name] = [offset, length, typecode]
+        offset += length
+    
+    info = {
+        'version': __version__,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'root': dir_stats.path,
+        'name': dir_stats.name,
+        'byteorder': sys.byteorder,
+        'files': len(table),
+        'languages': table.languages,
+        'by_language': {k: asdict(v) for k, v in summary.languages.items()},
+        'sections': layout,
+    }
+    info.update(meta or {})
+    payload = json.dumps(info, ensure_ascii=False).encode('utf-8')
+    out.write(payload)
+    out.seek(0)
+    out.write(_SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, 0, offset, len(payload)))
+    out.seek(0, os.SEEK_END)
+
+
+class Snapshot:
+    """
+    以 mmap 方式打开的二进制快照
+    
+    文件表各列直接映射为 memoryview，不复制、不解析，打开耗时与文件数基本无关；
+    files 为只读的 FileTable，按行号访问时才生成 FileStats 视图。
+    快照与当前机器字节序不同时各列复制一份并转换字节序。
+    
+    用完后调用 close()（或用 with 语句）释放各列的 memoryview 并关闭映射，之后
+    files 不可再访问。
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._views = []  # 映射上创建的 memoryview，close() 时先于映射释放
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._load()
+        except BaseException:
+            self.close()
+            raise
+    
+    def _load(self):
+        path = self.path
+        try:
+            magic, version, _, meta_offset, meta_length = _SNAPSHOT_HEADER.unpack_from(self._mm, 0)
+        except struct.error:
+            raise ValueError(f"不是 CodeMetrics 快照文件: {path}")
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"不是 CodeMetrics 快照文件: {path}")
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"不支持的快照格式版本 {version}: {path}")
+        self.meta = json.loads(self._mm[meta_offset:meta_offset + meta_length].decode('utf-8'))
+        self._buffer = memoryview(self._mm)
+        self._views.append(self._buffer)
+        
+        table = FileTable.__new__(FileTable)
+        for name, _ in FileTable.COLUMNS:
+            setattr(table, name, self._section(name))
+        for name in FileTable.BLOBS:
+            setattr(table, name, self._section(name))
+        table.dirs = _unpack_strings(self._section('dirs'), self._section('dir_ends'))
+        table.languages = list(self.meta['languages'])
+        self.files = table
+        
+        self.languages = {k: LanguageStats(**v) for k, v in self.meta['by_language'].items()}
+    
+    def _section(self, name: str):
+        offset, length, typecode = self.meta['sections'][name]
+        view = self._buffer[offset:offset + length]
+        self._views.append(view)
+        if typecode == 'B':
+            return view
+        if self.meta.get('byteorder', sys.byteorder) == sys.byteorder:
+            view = view.cast(typecode)
+            self._views.append(view)
+            return view
+        column = array(typecode, view.tobytes())
+        column.byteswap()
+        return column
+    
+    def close(self):
+        """释放各列的 memoryview（后创建的先释放），再关闭映射；可重复调用"""
+        while self._views:
+            self._views.pop().release()
+        self._mm.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def directories(self) -> Dict[str, Tuple[int, ...]]:
+        """相对路径 -> 目录汇总（字段顺序见 SNAPSHOT_DIR_FIELDS）"""
+        paths = _unpack_strings(self._section('dir_paths'), self._section('dir_path_ends'))
+        totals = self._section('dir_totals')
+        width = len(SNAPSHOT_DIR_FIELDS)
+        return {path: tuple(totals[i * width:(i + 1) * width]) for i, path in enumerate(paths)}
+
+
+# 快照对比的字段
+SNAPSHOT_DIFF_FIELDS = ('file_count', 'code_lines', 'comment_lines', 'blank_lines', 'total_lines', 'total_size')
+
+
+def _snapshot_delta(old: Optional[Dict], new: Optional[Dict]) -> Dict[str, List[int]]:
+    """各字段的 [旧值, 新值]（不存在的一侧为 0）"""
+    return {key: [old.get(key, 0) if old else 0, new.get(key, 0) if new else 0]
+            for key in SNAPSHOT_DIFF_FIELDS}
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> Dict:
+    """
+    对比两个快照，不重新扫描
+    
+    Returns:
+        {'old'/'new': 快照信息, 'config_changed': 配置指纹（见 config_fingerprint）是否不同,
+         'totals': 根目录各字段 [旧, 新],
+         'languages' / 'directories': 有变化的语言 / 目录（相对路径）-> 各字段 [旧, 新]}
+    """
+    def info(snap):
+        return {key: snap.meta.get(key) for key in ('root', 'created', 'version', 'fingerprint', 'scan_seconds')}
+    
+    def changed(delta):
+        return any(a != b for a, b in delta.values())
+    
+    languages = {}
+    for lang in sorted(set(old.languages) | set(new.languages)):
+        a = old.languages.get(lang)
+        b = new.languages.get(lang)
+        delta = _snapshot_delta(asdict(a) if a else None, asdict(b) if b else None)
+        if changed(delta):
+            languages[lang] = delta
+    
+    old_dirs = old.directories()
+    new_dirs = new.directories()
+    directories = {}
+    for path in sorted(set(old_dirs) | set(new_dirs)):
+        a = old_dirs.get(path)
+        b = new_dirs.get(path)
+        delta = _snapshot_delta(dict(zip(SNAPSHOT_DIR_FIELDS, a)) if a else None,
+                                dict(zip(SNAPSHOT_DIR_FIELDS, b)) if b else None)
+        if changed(delta):
+            directories[path] = delta
+    
+    root_old = old_dirs.get('.')
+    root_new = new_dirs.get('.')
+    old_fp = old.meta.get('fingerprint')
+    new_fp = new.meta.get('fingerprint')
+    return {
+        'old': info(old),
+        'new': info(new),
+        'config_changed': bool(old_fp and new_fp and old_fp != new_fp),
+        'totals': _snapshot_delta(dict(zip(SNAPSHOT_DIR_FIELDS, root_old)) if root_old else None,
+                                  dict(zip(SNAPSHOT_DIR_FIELDS, root_new)) if root_new else None),
+        'languages': languages,
+        'directories': directories,
+    }
+
+
+# ============================================================================
+# 监视模式 (--watch)
+# ============================================================================
+# inotify 事件（<sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+_INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+def _is_ignored_path(root: str, path: str, matcher: IgnoreMatcher, follow_symlinks: bool = True) -> bool:
+    """按遍历时的规则判断 root 下的 path（或其任一上级目录）是否被排除"""
+    rel = os.path.relpath(path, root)
+    if rel == '.':
+        return False
+    if rel == '..' or rel.startswith('..' + os.sep):
+        return True
+    rel_path = ''
+    for name in rel.split(os.sep):
+        rel_path = rel_path + '/' + name if rel_path else name
+        if matcher.match(name, rel_path):
+            return True
+    return not follow_symlinks and os.path.islink(path)
+
+
+class InotifyWatcher:
+    """
+    基于 inotify 的目录监视（通过 ctypes 调用 libc，仅 Linux）
+    
+    为目录树中每个未被排除的目录添加监视，新建的子目录自动加入。跟随符号链接时
+    同一目录可能经多条路径出现在目录树中（同一个 wd），事件按每条路径各报告一次。
+    wait() 阻塞在 select 上，没有变化时不占用 CPU。
+    """
+    
+    name = 'inotify'
+    MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE |
+            IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+    
+    def __init__(self, root: str, matcher: IgnoreMatcher, follow_symlinks: bool = True):
+        import ctypes
+        import ctypes.util
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._get_errno = ctypes.get_errno
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            errno = self._get_errno()
+            raise OSError(errno, f"inotify_init1: {os.strerror(errno)}")
+        self.root = root
+        self.matcher = matcher
+        self.follow_symlinks = follow_symlinks
+        self._dirs: Dict[int, List[str]] = {}  # wd -> 目录路径
+        try:
+            self._watch_tree(root)
+        except OSError:
+            self.close()
+            raise
+    
+    def _watch_tree(self, path: str):
+        rel_root = '' if path == self.root else os.path.relpath(path, self.root).replace(os.sep, '/')
+        for event, dir_path in iter_walk(path, self.matcher, self.follow_symlinks, rel_root):
+            if event == WALK_ENTER:
+                wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dir_path), self.MASK)
+                if wd < 0:
+                    errno = self._get_errno()
+                    raise OSError(errno, f"inotify_add_watch {dir_path}: {os.strerror(errno)}")
+                paths = self._dirs.setdefault(wd, [])
+                if dir_path not in paths:
+                    paths.append(dir_path)
+    
+    def wait(self, timeout: Optional[float]) -> Optional[set]:
+        """
+        等待变化，最多 timeout 秒（None 表示一直等待）
+        
+        返回变化的文件/目录路径集合（超时为空集合）；事件队列溢出时返回 None，
+        调用方应重新全量扫描。
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _INOTIFY_EVENT.unpack_from(data, offset)
+                name = data[offset + _INOTIFY_EVENT.size:offset + _INOTIFY_EVENT.size + length].rstrip(b'\0')
+                offset += _INOTIFY_EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                dir_paths = self._dirs.get(wd)
+                if dir_paths is None:
+                    continue
+                if mask & IN_IGNORED:
+                    del self._dirs[wd]
+                    continue
+                for dir_path in list(dir_paths):
+                    path = os.path.join(dir_path, os.fsdecode(name)) if name else dir_path
+                    if _is_ignored_path(self.root, path, self.matcher, self.follow_symlinks):
+                        continue
+                    if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                        try:
+                            self._watch_tree(path)
+                        except OSError as e:
+                            print(color(f"⚠️ 无法监视新目录: {e}", Colors.YELLOW), file=sys.stderr)
+                    changed.add(path)
+        return changed
+    
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """
+    轮询方式的目录监视（inotify 不可用时的退路）
+    
+    每隔 interval 秒遍历一次目录树并 stat 文件（不读取内容），与上一次的
+    (mtime_ns, 大小, inode) 比较得到变化的文件。
+    """
+    
+    name = 'polling'
+    
+    def __init__(self, root: str, matcher: IgnoreMatcher, follow_symlinks: bool = True,
+                 interval: float = 5.0):
+        self.root = root
+        self.matcher = matcher
+        self.follow_symlinks = follow_symlinks
+        self.interval = interval
+        self._state = self._stat_tree()
+        self._next_poll = time.monotonic() + interval
+    
+    def _stat_tree(self) -> Dict[str, Optional[Tuple[int, int, int]]]:
+        return {path: ScanCache.stat_key(path)
+                for event, path in iter_walk(self.root, self.matcher, self.follow_symlinks)
+                if event == WALK_FILE}
+    
+    def wait(self, timeout: Optional[float]) -> Optional[set]:
+        """等待到下一次轮询（或 timeout 到期），返回变化的文件路径集合"""
+        now = time.monotonic()
+        delay = self._next_poll - now
+        if timeout is not None and timeout < delay:
+            time.sleep(max(0.0, timeout))
+            return set()
+        time.sleep(max(0.0, delay))
+        self._next_poll = time.monotonic() + self.interval
+        state = self._stat_tree()
+        old = self._state
+        self._state = state
+        changed = {path for path, key in state.items() if old.get(path) != key}
+        changed.update(path for path in old if path not in state)
+        return changed
+    
+    def close(self):
+        pass
+
+
+def create_watcher(root: str, matcher: IgnoreMatcher, follow_symlinks: bool = True,
+                   poll_interval: float = 5.0):
+    """优先使用 inotify，不可用（非 Linux、监视数量超出上限等）时退回轮询"""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root, matcher, follow_symlinks)
+        except (OSError, AttributeError) as e:
+            print(color(f"⚠️ inotify 不可用 ({e})，改用轮询", Colors.YELLOW), file=sys.stderr)
+    return PollingWatcher(root, matcher, follow_symlinks, poll_interval)
+
+
+class LiveScan(DirIndex):
+    """
+    --watch 模式的内存模型：在 DirIndex 上按监视到的路径重新统计文件
+    
+    新建或移入的目录遍历其中的文件逐个加入，删除或移出的目录逐个移除其中的文件，
+    目录节点由 DirIndex 按需创建和裁剪。
+    """
+    
+    def __init__(self, root: DirStats, matcher: IgnoreMatcher, follow_symlinks: bool = True):
+        super().__init__(root)
+        self.matcher = matcher
+        self.follow_symlinks = follow_symlinks
+        self._scanner = _file_scanner()
+    
+    def _rescan(self, path: str) -> bool:
+        old = self.files.get(path)
+        new = _scan_result(self._scanner(path)) if os.path.isfile(path) else None
+        if old == new:
+            return False
+        self.apply_file_change(path, old, new)
+        return True
+    
+    def apply(self, paths) -> int:
+        """重新统计变化的路径（文件或目录），返回实际变化的文件数"""
+        root = self.root.path
+        changed = 0
+        for path in sorted(paths):
+            if _is_ignored_path(root, path, self.matcher, self.follow_symlinks):
+                continue
+            if os.path.isdir(path):
+                rel_root = os.path.relpath(path, root).replace(os.sep, '/')
+                targets = [p for event, p in iter_walk(path, self.matcher, self.follow_symlinks, rel_root)
+                           if event == WALK_FILE]
+            elif path in self.dirs:
+                targets = [f.path for f in self.dirs[path].iter_files()]
+            else:
+                targets = [path]
+            for target in targets:
+                changed += self._rescan(target)
+        self.sort_children()
+        return changed
+
+
+# ============================================================================
+# Git 仓库支持
+# ============================================================================
+@dataclass
+class GitIndexEntry:
+    """Git 索引 (.git/index) 中的一条记录"""
+    path: str
+    mtime_s: int
+    mtime_ns: int
+    ino: int
+    mode: int
+    size: int
+    sha: str
+
+
+def find_git_dir(path: str) -> Optional[Tuple[str, str]]:
+    """
+    向上查找 Git 仓库
+    
+    Returns:
+        (工作区根目录, .git 目录)，不在仓库中时返回 None
+    """
+    path = os.path.abspath(path)
+    while True:
+        dot_git = os.path.join(path, '.git')
+        if os.path.isdir(dot_git):
+            return path, dot_git
+        if os.path.isfile(dot_git):
+            # 子模块 / worktree: .git 文件内容为 "gitdir: <路径>"
+            try:
+                with open(dot_git, 'r', encoding='utf-8') as f:
+                    line = f.readline().strip()
+            except OSError:
+                return None
+            if line.startswith('gitdir:'):
+                git_dir = line[len('gitdir:'):].strip()
+                return path, os.path.normpath(os.path.join(path, git_dir))
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _git_hash_size(git_dir: str) -> int:
+    """对象哈希长度：SHA-1 为 20 字节，objectformat = sha256 时为 32 字节"""
+    candidates = [os.path.join(git_dir, 'config')]
+    commondir = os.path.join(git_dir, 'commondir')
+    if os.path.isfile(commondir):
+        with open(commondir, 'r', encoding='utf-8') as f:
+            candidates.append(os.path.join(git_dir, f.read().strip(), 'config'))
+    for config_path in candidates:
+        try:
+            with open(config_path, 'r', encoding='utf-8', errors='ignore') as f:
+                for line in f:
+                    key, _, value = line.partition('=')
+                    if key.strip().lower() == 'objectformat' and value.strip().lower() == 'sha256':
+                        return 32
+        except OSError:
+            continue
+    return 20
+
+
+def read_git_index(git_dir: str) -> List[GitIndexEntry]:
+    """
+    直接解析 .git/index (版本 2/3/4)，返回已跟踪的普通文件
+    
+    跳过子模块、符号链接以及合并冲突中的非 0 阶段记录，不依赖 git 命令。
+    """
+    with open(os.path.join(git_dir, 'index'), 'rb') as f:
+        data = f.read()
+    
+    if data[:4] != b'DIRC':
+        raise ValueError('不是有效的 Git 索引文件')
+    version, count = struct.unpack('>II', data[4:12])
+    if version not in (2, 3, 4):
+        raise ValueError(f'不支持的 Git 索引版本: {version}')
+    
+    hash_size = _git_hash_size(git_dir)
+    fixed = struct.Struct('>10I')
+    entries = []
+    offset = 12
+    prev_name = b''
+    
+    for _ in range(count):
+        start = offset
+        (_ctime_s, _ctime_ns, mtime_s, mtime_ns, _dev, ino,
+         mode, _uid, _gid, size) = fixed.unpack_from(data, offset)
+        offset += fixed.size
+        sha = data[offset:offset + hash_size].hex()
+        offset += hash_size
+        flags, = struct.unpack_from('>H', data, offset)
+        offset += 2
+        if version >= 3 and flags & 0x4000:
+            offset += 2  # 扩展标志
+        
+        if version == 4:
+            # 路径前缀压缩: 变长整数 (去掉上一路径末尾的字节数) + NUL 结尾的后缀
+            byte = data[offset]
+            offset += 1
+            strip = byte & 0x7f
+            while byte & 0x80:
+                byte = data[offset]
+                offset += 1
+                strip = ((strip + 1) << 7) | (byte & 0x7f)
+            end = data.index(b'\x00', offset)
+            name = prev_name[:len(prev_name) - strip] + data[offset:end]
+            offset = end + 1
+        else:
+            end = data.index(b'\x00', offset)
+            name = data[offset:end]
+            # 记录按 8 字节对齐，至少包含一个 NUL
+            offset = start + ((end - start + 8) & ~7)
+        prev_name = name
+        
+        stage = (flags >> 12) & 0x3
+        if stage != 0 or (mode & 0o170000) != 0o100000:
+            continue
+        
+        entries.append(GitIndexEntry(
+            path=name.decode('utf-8', errors='surrogateescape'),
+            mtime_s=mtime_s,
+            mtime_ns=mtime_ns,
+            ino=ino,
+            mode=mode,
+            size=size,
+            sha=sha,
+        ))
+    
+    return entries
+
+
+def _git_entry_clean(entry: GitIndexEntry, st: os.stat_result, index_mtime: float) -> bool:
+    """工作区文件的 stat 与索引记录一致时，索引中的 blob 哈希即为当前内容的哈希"""
+    mask = 0xFFFFFFFF
+    if (st.st_size & mask) != entry.size or (int(st.st_mtime) & mask) != entry.mtime_s:
+        return False
+    if entry.mtime_ns and (st.st_mtime_ns % 1000000000) != entry.mtime_ns:
+        return False
+    if entry.ino and (st.st_ino & mask) != entry.ino:
+        return False
+    # racy-git: 索引写入时文件仍可能在同一时刻被修改
+    return entry.mtime_s < int(index_mtime)
+
+
+def scan_git_tree(dir_path: str, ignore_patterns: List[str] = None,
+                  jobs: int = 1, pool: str = 'process', cache: 'ScanCache' = None,
+                  top_n: int = 10) -> DirStats:
+    """
+    只扫描 Git 已跟踪的文件
+    
+    文件列表直接读取 .git/index，未跟踪文件（包括被 .gitignore 忽略的文件）自然
+    不会被扫描；排除规则仍然生效。工作区未修改的文件按 blob 哈希缓存行数统计，
+    内容相同的文件（多份拷贝、不同分支/分叉中的同一文件）只统计一次。
+    
+    Raises:
+        ValueError: 目录不在 Git 仓库中或索引无法解析
+    """
+    if ignore_patterns is None:
+        ignore_patterns = []
+    
+    found = find_git_dir(dir_path)
+    if found is None:
+        raise ValueError(f'不是 Git 仓库: {dir_path}')
+    repo_root, git_dir = found
+    
+    index_path = os.path.join(git_dir, 'index')
+    try:
+        index_mtime = os.stat(index_path).st_mtime
+        with profile_phase('git index'):
+            entries = read_git_index(git_dir)
+    except (OSError, struct.error) as e:
+        raise ValueError(f'无法读取 Git 索引: {e}')
+    
+    reset_count_memo()
+    prefix = os.path.relpath(os.path.abspath(dir_path), repo_root).replace(os.sep, '/')
+    prefix = '' if prefix == '.' else prefix + '/'
+    matcher = _profile_matcher(get_ignore_matcher(tuple(ignore_patterns)))
+    
+    # 按路径组装目录树（与目录遍历一样按名称排序）
+    root = {}
+    ignored_dirs = set()
+    for entry in entries:
+        if not entry.path.startswith(prefix):
+            continue
+        rel_path = entry.path[len(prefix):]
+        parts = rel_path.split('/')
+        node = root
+        rel_dir = ''
+        skip = False
+        for part in parts[:-1]:
+            rel_dir = rel_dir + '/' + part if rel_dir else part
+            if rel_dir in ignored_dirs:
+                skip = True
+                break
+            if matcher.match(part, rel_dir):
+                ignored_dirs.add(rel_dir)
+                skip = True
+                break
+            node = node.setdefault(part, {})
+        if skip or matcher.match(parts[-1], rel_path):
+            continue
+        node[parts[-1]] = entry
+    
+    # 相同 blob 只统计一次：(blob 哈希, 语言) 的第一个文件统计完成后记入 blob_counts，
+    # 其余文件（duplicates）按顺序在其后产出，此时直接复制统计结果
+    entries_by_path = {}  # 已产出、尚未查询的文件：路径 -> 索引项
+    blob_counts = {}
+    firsts = {}       # 在途的第一个文件：路径 -> blob 键
+    scanning = set()  # firsts 中的 blob 键
+    duplicates = {}   # 路径 -> (blob 键, 文件大小)
+    
+    def events():
+        """按名称顺序遍历组装好的目录树，产出与 iter_walk 相同的遍历事件"""
+        stack = [(dir_path, iter(sorted(root)), root)]
+        yield WALK_ENTER, dir_path
+        while stack:
+            path, names, children = stack[-1]
+            for name in names:
+                child = children[name]
+                child_path = os.path.join(path, name)
+                if isinstance(child, dict):
+                    stack.append((child_path, iter(sorted(child)), child))
+                    yield WALK_ENTER, child_path
+                    break
+                entries_by_path[child_path] = child
+                yield WALK_FILE, child_path
+            else:
+                stack.pop()
+                yield WALK_EXIT, path
+    
+    def record_blob(key, stats: Optional[FileStats]):
+        if stats is None:
+            return
+        counts = blob_counts[key] = (
+            stats.total_lines, stats.code_lines, stats.comment_lines, stats.blank_lines,
+            stats.functions, stats.complexity, stats.max_complexity, stats.imports)
+        if cache is not None:
+            cache.store_blob(key[0], key[1], counts)
+    
+    def lookup(path):
+        entry = entries_by_path.pop(path)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return True, None  # 已从工作区删除
+        
+        language = detect_language(path, b'')
+        if language == 'Unknown' or not _git_entry_clean(entry, st, index_mtime):
+            return cache.lookup(path) if cache is not None else (False, None)
+        
+        key = (entry.sha, language)
+        counts = blob_counts.get(key)
+        if counts is None and cache is not None:
+            counts = cache.lookup_blob(entry.sha, language)
+            if counts is not None:
+                blob_counts[key] = counts
+        if counts is not None:
+            return True, FileStats(path, os.path.basename(path), language, st.st_size, *counts[:4],
+                                   entry.sha, *counts[4:])
+        if key in scanning:
+            duplicates[path] = (key, st.st_size)
+            return True, None
+        
+        hit, stats = cache.lookup(path) if cache is not None else (False, None)
+        if hit:
+            record_blob(key, stats)
+        else:
+            firsts[path] = key
+            scanning.add(key)
+        return hit, stats
+    
+    def store(path, stats: Optional[FileStats]):
+        if cache is not None:
+            cache.store(path, stats)
+        key = firsts.pop(path, None)
+        if key is not None:
+            scanning.discard(key)
+            record_blob(key, stats)
+    
+    def scan_events():
+        for event, path, stats in _iter_scan_events(events(), jobs, pool, lookup, store):
+            if path in duplicates:
+                key, size = duplicates.pop(path)
+                counts = blob_counts.get(key)
+                if counts is not None:
+                    stats = FileStats(path, os.path.basename(path), key[1], size, *counts[:4],
+                                      key[0], *counts[4:])
+            yield event, path, stats
+    
+    with profile_phase('scan'):
+        return _build_dir_stats(scan_events(), top_n)
+
+
+# ============================================================================
+# Git 历史分析 (--history)
+# ============================================================================
+# 每个并行任务统计的 blob 数（每个任务启动一个 git cat-file 进程）
+HISTORY_BLOB_CHUNK = 512
+
+
+def _iter_git_log(repo_root: str, rev: str = 'HEAD', pathspec: str = ''):
+    """
+    从旧到新逐个产出第一父提交链上的提交: (提交哈希, 提交时间, 变化列表)
+    
+    基于 git log --raw -z 流式解析，变化为 (仓库相对路径, 旧 blob, 新 blob)，不存在
+    或不是普通文件（子模块、符号链接）的一侧为 None。合并提交按与第一个父提交的
+    差异计算，重命名拆分为删除 + 新增。
+    
+    Raises:
+        ValueError: git 命令不可用或执行失败
+    """
+    cmd = ['git', '-C', repo_root, 'log', '-z', '--raw', '--no-renames', '--no-abbrev',
+           '-m', '--first-parent', '--reverse', '--format=%H %ct', rev, '--']
+    if pathspec:
+        cmd.append(pathspec)
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise ValueError(f'无法执行 git: {e}')
+    
+    def tokens():
+        rest = b''
+        while True:
+            chunk = proc.stdout.read(1 << 20)
+            if not chunk:
+                break
+            parts = (rest + chunk).split(b'\x00')
+            rest = parts.pop()
+            yield from parts
+        if rest:
+            yield rest
+    
+    commit = None
+    it = tokens()
+    with proc:
+        for token in it:
+            token = token.lstrip(b'\n')
+            if token.startswith(b':'):
+                # :旧模式 新模式 旧哈希 新哈希 状态\0路径
+                old_mode, new_mode, old_sha, new_sha, _ = token[1:].split(b' ', 4)
+                path = next(it).decode('utf-8', errors='surrogateescape')
+                commit[2].append((
+                    path,
+                    old_sha.decode() if old_mode.startswith(b'100') else None,
+                    new_sha.decode() if new_mode.startswith(b'100') else None,
+                ))
+            elif token:
+                if commit is not None:
+                    yield commit
+                sha, timestamp = token.split(b' ')
+                commit = (sha.decode(), int(timestamp), [])
+        if commit is not None:
+            yield commit
+        error = proc.stderr.read().decode('utf-8', errors='replace').strip()
+    if proc.returncode != 0:
+        raise ValueError(f'git log 执行失败: {error}')
 
 
-def collect_all_files(dir_stats: DirStats) -> List[FileStats]:
-    """收集所有文件"""
-    files = []
+def _count_git_blobs(repo_root: str, items: List[Tuple[str, str, str]]) -> List[Optional[Tuple]]:
+    """
+    统计一批 blob 的行数（可在工作进程中执行），通过一个 git cat-file --batch 进程读取内容
     
-    def collect(node):
-        if isinstance(node, FileStats):
-            files.append(node)
-        elif isinstance(node, DirStats):
-            for child in node.children:
-                collect(child)
+    items 为 (blob 哈希, 按文件名识别的语言, 文件名)；语言为 Unknown 时与 scan_file
+    一样检查二进制并按 shebang 识别。返回 (语言, (total, code, comment, blank,
+    functions, complexity, max_complexity, imports))，二进制或无法识别的 blob 为 None。
+    只统计行数，不计算圈复杂度、不提取依赖（记为 0 / 空）。
+    """
+    results = []
+    proc = subprocess.Popen(['git', '-C', repo_root, 'cat-file', '--batch'],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    with proc:
+        for sha, language, name in items:
+            proc.stdin.write(sha.encode() + b'\n')
+            proc.stdin.flush()
+            header = proc.stdout.readline().split()
+            if len(header) != 3 or header[1] != b'blob':
+                results.append(None)  # 对象缺失（如浅克隆）
+                continue
+            data = proc.stdout.read(int(header[2]))
+            proc.stdout.read(1)  # 内容后的换行
+            if language == 'Unknown':
+                if not is_text_file(name, data[:SNIFF_SIZE]):
+                    results.append(None)
+                    continue
+                language = detect_language(name, data)
+                if language == 'Unknown':
+                    results.append(None)
+                    continue
+            results.append((language, count_lines_in_buffer(data, language) + (0, 0, 0, ())))
+        proc.stdin.close()
+    return results
+
+
+def _count_history_blobs(repo_root: str, pending: Dict[Tuple[str, str], str],
+                         jobs: int = 1, pool: str = 'process') -> Dict[Tuple[str, str], Optional[Tuple]]:
+    """统计 pending 中的 blob（(哈希, 语言) -> 文件名），jobs > 1 时分批并行"""
+    items = [key + (name,) for key, name in pending.items()]
+    chunks = [items[i:i + HISTORY_BLOB_CHUNK] for i in range(0, len(items), HISTORY_BLOB_CHUNK)]
+    if jobs <= 1 or len(chunks) < 2:
+        results = [_count_git_blobs(repo_root, chunk) for chunk in chunks]
+    else:
+        with _create_executor(jobs, pool) as executor:
+            results = list(executor.map(_count_git_blobs, [repo_root] * len(chunks), chunks))
+    counted = {}
+    for chunk, chunk_results in zip(chunks, results):
+        for (sha, language, _), result in zip(chunk, chunk_results):
+            counted[(sha, language)] = result
+    return counted
+
+
+def analyze_git_history(dir_path: str, ignore_patterns: List[str] = None, rev: str = 'HEAD',
+                        project_type: str = 'semi-detached', jobs: int = 1, pool: str = 'process',
+                        cache: 'ScanCache' = None) -> List[Dict]:
+    """
+    按提交统计代码规模的变化（第一父提交链，从旧到新）
     
-    collect(dir_stats)
-    return files
+    不在每个提交上重新统计整棵树：先读取每个提交变化的文件，只统计其中新出现的
+    blob（按 (blob 哈希, 语言) 去重，优先使用扫描缓存，其余分批并行统计），再
+    按提交顺序累加各语言的差值。返回每个提交的文件数、各类行数、各语言代码行数
+    和 COCOMO 估算。
+    
+    Raises:
+        ValueError: 目录不在 Git 仓库中或 git 命令执行失败
+    """
+    if ignore_patterns is None:
+        ignore_patterns = []
+    
+    found = find_git_dir(dir_path)
+    if found is None:
+        raise ValueError(f'不是 Git 仓库: {dir_path}')
+    repo_root = found[0]
+    prefix = os.path.relpath(os.path.abspath(dir_path), repo_root).replace(os.sep, '/')
+    prefix = '' if prefix == '.' else prefix + '/'
+    matcher = get_ignore_matcher(tuple(ignore_patterns))
+    
+    def path_language(path: str) -> Optional[str]:
+        """路径在分析范围内且未被排除时返回按文件名识别的语言"""
+        if not path.startswith(prefix):
+            return None
+        rel_path = path[len(prefix):]
+        parts = rel_path.split('/')
+        rel = ''
+        for part in parts:
+            rel = rel + '/' + part if rel else part
+            if matcher.match(part, rel):
+                return None
+        return detect_language(parts[-1], b'')
+    
+    # 第一遍：读取提交历史，收集需要统计的 blob
+    languages = {}  # 路径 -> 语言（None 表示不统计）
+    blob_counts = {}
+    pending = {}
+    commits = []
+    with profile_phase('git log'):
+        for sha, timestamp, changes in _iter_git_log(repo_root, rev, prefix.rstrip('/')):
+            kept = []
+            for path, old, new in changes:
+                language = languages.get(path, '')
+                if language == '':
+                    language = languages[path] = path_language(path)
+                if language is None:
+                    continue
+                if new is not None:
+                    key = (new, language)
+                    if key not in blob_counts and key not in pending:
+                        counts = cache.lookup_blob(new, language, analyzed=False) \
+                            if cache is not None and language != 'Unknown' else None
+                        if counts is not None:
+                            blob_counts[key] = (language, counts)
+                        else:
+                            pending[key] = os.path.basename(path)
+                kept.append((old, new, language))
+            commits.append((sha, timestamp, kept))
+    
+    with profile_phase('scan'):
+        counted = _count_history_blobs(repo_root, pending, jobs, pool)
+    if cache is not None:
+        for (sha, language), result in counted.items():
+            if result is not None and language != 'Unknown':
+                # 只有行数：--git 扫描命中这些记录时会重新统计圈复杂度与依赖
+                cache.store_blob(sha, language, result[1], analyzed=False)
+    blob_counts.update(counted)
+    
+    # 第二遍：按提交顺序累加各语言的差值
+    totals = {}  # 语言 -> [文件数, 总行数, 代码行, 注释行, 空行]
+    series = []
+    with profile_phase('aggregate'):
+        for sha, timestamp, kept in commits:
+            for old, new, language in kept:
+                for blob, sign in ((old, -1), (new, 1)):
+                    result = blob_counts.get((blob, language)) if blob is not None else None
+                    if result is None:
+                        continue
+                    row = totals.get(result[0])
+                    if row is None:
+                        row = totals[result[0]] = [0, 0, 0, 0, 0]
+                    row[0] += sign
+                    for i, value in enumerate(result[1][:4], 1):
+                        row[i] += sign * value
+            
+            sums = [sum(column) for column in zip(*totals.values())] or [0, 0, 0, 0, 0]
+            cocomo = calculate_cocomo(sums[2], project_type)
+            series.append({
+                'commit': sha,
+                'timestamp': timestamp,
+                'date': datetime.fromtimestamp(timestamp).isoformat(),
+                'file_count': sums[0],
+                'total_lines': sums[1],
+                'code_lines': sums[2],
+                'comment_lines': sums[3],
+                'blank_lines': sums[4],
+                'languages': {lang: row[2] for lang, row in sorted(totals.items(), key=lambda kv: -kv[1][2])
+                              if row[0] > 0},
+                'cocomo': {key: cocomo[key] for key in ('person_months', 'duration_months', 'cost_usd')},
+            })
+    
+    return series
 
 
-def calculate_cocomo(code_lines: int, project_type: str = 'semi-detached') -> Dict:
-    """计算 COCOMO 估算"""
-    if code_lines == 0:
-        return {
-            'kloc': 0,
-            'person_months': 0,
-            'duration_months': 0,
-            'team_size': 0,
-            'cost_usd': 0,
-            'cost_cny': 0,
-            'project_type': project_type,
-        }
+# ============================================================================
+# 异步扫描（高延迟文件系统）
+# ============================================================================
+def _list_directory(path: str, rel_dir: str, matcher: IgnoreMatcher, follow_symlinks: bool,
+                    ancestors: frozenset) -> List[Tuple[str, str, bool, frozenset]]:
+    """
+    列出一个目录（在工作线程中执行，包含该目录的全部文件系统调用）
     
-    kloc = code_lines / 1000
-    params = COCOMO_PARAMS.get(project_type, COCOMO_PARAMS['semi-detached'])
+    返回按名称排序的 (路径, 相对路径, 是否为目录, 子目录的祖先集合)，
+    已跳过被忽略的目录项和符号链接环。
+    """
+    items = []
+    for entry in _sorted_entries(path):
+        kind = _entry_kind(entry, rel_dir, matcher, follow_symlinks)
+        if kind is None:
+            continue
+        rel_path, is_dir = kind
+        
+        if is_dir:
+            child_key = _dir_key(entry.path, entry)
+            if child_key is not None and child_key in ancestors:
+                continue  # 符号链接环
+            items.append((entry.path, rel_path, True, ancestors | {child_key}))
+        else:
+            items.append((entry.path, rel_path, False, ancestors))
+    return items
+
+
+async def _scan_tree_async(dir_path: str, matcher: IgnoreMatcher, concurrency: int,
+                           cache: 'ScanCache', follow_symlinks: bool) -> Tuple[Dict, Dict]:
+    """
+    并发列目录、查缓存和统计文件，最多同时进行 concurrency 个文件系统操作
     
-    person_months = params['a'] * (kloc ** params['b'])
-    duration_months = params['c'] * (person_months ** params['d'])
-    team_size = person_months / duration_months if duration_months > 0 else 0
+    返回各目录的列举结果（目录路径 -> _list_directory 的结果）和文件统计结果
+    （路径 -> FileStats 或 None），由 _listing_events 按排序顺序组装。
+    """
+    loop = asyncio.get_running_loop()
+    scanner = _file_scanner()
+    listings = {}
+    stats = {}
+    running = {}
+    # 目录优先出队，尽早发现更多可并发的工作
+    queue = deque()
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        root_key = await loop.run_in_executor(executor, _dir_key, dir_path)
+        queue.append(('dir', dir_path, '', frozenset([root_key])))
+        
+        while queue or running:
+            while queue and len(running) < concurrency:
+                job = queue.popleft()
+                kind, path = job[0], job[1]
+                if kind == 'dir':
+                    future = loop.run_in_executor(executor, _list_directory, path, job[2],
+                                                  matcher, follow_symlinks, job[3])
+                elif kind == 'stat':
+                    future = loop.run_in_executor(executor, ScanCache.stat_key, path)
+                else:
+                    future = loop.run_in_executor(executor, scanner, path)
+                running[future] = job
+            
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                kind, path = running.pop(future)[:2]
+                result = future.result()
+                if kind == 'dir':
+                    listings[path] = result
+                    for child, rel_path, is_dir, ancestors in reversed(result):
+                        if is_dir:
+                            queue.appendleft(('dir', child, rel_path, ancestors))
+                        else:
+                            queue.append(('stat' if cache is not None else 'file', child))
+                elif kind == 'stat':
+                    # SQLite 连接只在事件循环线程中使用
+                    hit, cached = cache.lookup(path, result)
+                    if hit:
+                        stats[path] = cached
+                    else:
+                        queue.append(('file', path))
+                else:
+                    result = stats[path] = _scan_result(result)
+                    if cache is not None:
+                        cache.store(path, result)
     
-    return {
-        'kloc': round(kloc, 2),
-        'person_months': round(person_months, 1),
-        'duration_months': round(duration_months, 1),
-        'team_size': round(team_size, 1),
-        'cost_usd': int(person_months * COST_PER_PERSON_MONTH_USD),
-        'cost_cny': int(person_months * COST_PER_PERSON_MONTH_CNY),
-        'project_type': project_type,
-        'project_type_desc': params['desc'],
-    }
+    return listings, stats
 
 
-def calculate_health(dir_stats: DirStats, all_files: List[FileStats]) -> Dict:
-    """计算代码健康度指标"""
-    metrics = {}
+def _listing_events(dir_path: str, listings: Dict, stats: Dict):
+    """按排序顺序产出与 iter_walk 相同的遍历事件及文件统计结果（产出后即从 stats 移除）"""
+    stack = [(dir_path, iter(listings.pop(dir_path)))]
+    yield WALK_ENTER, dir_path, None
+    while stack:
+        path, items = stack[-1]
+        for child, _, is_dir, _ in items:
+            if is_dir:
+                stack.append((child, iter(listings.pop(child))))
+                yield WALK_ENTER, child, None
+                break
+            yield WALK_FILE, child, stats.pop(child)
+        else:
+            stack.pop()
+            yield WALK_EXIT, path, None
+
+
+def scan_directory_async(dir_path: str, ignore_patterns: List[str] = None,
+                         concurrency: int = 64, cache: 'ScanCache' = None,
+                         follow_symlinks: bool = True, top_n: int = 10) -> DirStats:
+    """
+    异步扫描目录，适用于 NFS/CIFS 等每次系统调用都有网络延迟的文件系统
     
-    # 注释率
-    if dir_stats.code_lines > 0:
-        ratio = dir_stats.comment_lines / dir_stats.code_lines
-        metrics['comment_ratio'] = {
-            'value': round(ratio * 100, 1),
-            'unit': '%',
-            'status': 'good' if 0.15 <= ratio <= 0.30 else 
-                      'warning' if 0.10 <= ratio <= 0.40 else 'bad',
-            'desc': '注释率 (建议 15-30%)',
-        }
+    由 asyncio 调度、线程池执行文件系统调用（列目录、stat、读文件），最多同时
+    进行 concurrency 个操作，目录列举与文件统计相互重叠。结果与 scan_directory
+    完全一致。
+    """
+    if ignore_patterns is None:
+        ignore_patterns = []
     
-    # 平均文件行数
-    if dir_stats.file_count > 0:
-        avg = dir_stats.total_lines / dir_stats.file_count
-        metrics['avg_file_lines'] = {
-            'value': int(avg),
-            'unit': '行',
-            'status': 'good' if 100 <= avg <= 500 else
-                      'warning' if 50 <= avg <= 800 else 'bad',
-            'desc': '平均文件行数 (建议 100-500)',
-        }
+    reset_count_memo()
+    matcher = get_ignore_matcher(tuple(ignore_patterns))
+    with profile_phase('scan (async)'):
+        listings, stats = asyncio.run(_scan_tree_async(
+            dir_path, matcher, max(1, concurrency), cache, follow_symlinks))
+    with profile_phase('build tree'):
+        return _build_dir_stats(_listing_events(dir_path, listings, stats), top_n)
+
+
+# ============================================================================
+# 性能剖析 (--profile)
+# ============================================================================
+# 开启 --profile 时的全局剖析器，未开启时为 None，各处钩子直接跳过
+PROFILER: Optional['Profiler'] = None
+
+# 单个文件处理过程中各步骤的耗时（每个线程独立累计）
+_FILE_STEPS = threading.local()
+
+
+class Profiler:
+    """
+    运行阶段剖析器
     
-    # 代码密度
-    if dir_stats.total_lines > 0:
-        density = dir_stats.code_lines / dir_stats.total_lines
-        metrics['code_density'] = {
-            'value': round(density * 100, 1),
-            'unit': '%',
-            'status': 'info',
-            'desc': '代码密度 (代码行/总行)',
+    主线程中的运行阶段（遍历、忽略匹配、扫描、汇总、渲染、保存等）记录墙钟时间、
+    调用次数和字节数，嵌套阶段只计自身耗时；逐文件的处理步骤（语言识别、读取、
+    哈希、行统计）由工作进程/线程测量后随结果返回，按步骤和语言累计，并保留最慢
+    的文件和目录。
+    """
+    
+    def __init__(self, top_n: int = 10):
+        self.top_n = top_n
+        self.phases = {}       # 阶段 -> [自身耗时, 调用次数, 字节数]
+        self.file_steps = {}   # 文件处理步骤 -> [累计耗时, 调用次数]
+        self.languages = {}    # 语言 -> [累计耗时, 文件数, 字节数]
+        self.dir_times = defaultdict(float)
+        self.slowest_files = []  # (耗时, 路径) 的最小堆
+        self.started = time.perf_counter()
+        self._stack = []  # 进行中的阶段：[名称, 嵌套阶段耗时]
+    
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        self._stack.append([name, 0.0])
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = self._stack.pop()[1]
+            if self._stack:
+                self._stack[-1][1] += elapsed
+            entry = self.phases.setdefault(name, [0.0, 0, 0])
+            entry[0] += elapsed - nested
+            entry[1] += 1
+    
+    def add_bytes(self, name: str, nbytes: int):
+        self.phases.setdefault(name, [0.0, 0, 0])[2] += nbytes
+    
+    def record_file(self, result) -> Optional[FileStats]:
+        """记录 profile_scan_file 的返回值，返回其中的 FileStats"""
+        stats, path, elapsed, steps = result
+        nbytes = stats.size if stats else 0
+        
+        steps['read'] = max(0.0, elapsed - sum(steps.values()))
+        for step, seconds in steps.items():
+            entry = self.file_steps.setdefault(step, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+        
+        entry = self.languages.setdefault(stats.language if stats else '(skipped)', [0.0, 0, 0])
+        entry[0] += elapsed
+        entry[1] += 1
+        entry[2] += nbytes
+        # 读取的字节数计入当前所在的扫描阶段
+        self.add_bytes(self._stack[-1][0] if self._stack else 'scan', nbytes)
+        
+        self.dir_times[os.path.dirname(path)] += elapsed
+        if len(self.slowest_files) < self.top_n:
+            heapq.heappush(self.slowest_files, (elapsed, path))
+        elif elapsed > self.slowest_files[0][0]:
+            heapq.heapreplace(self.slowest_files, (elapsed, path))
+        return stats
+    
+    def report(self) -> Dict:
+        """汇总为可写入 JSON 报告的字典"""
+        return {
+            'total_seconds': round(time.perf_counter() - self.started, 6),
+            'phases': {name: {'seconds': round(t, 6), 'calls': calls, 'bytes': nbytes}
+                       for name, (t, calls, nbytes) in self.phases.items()},
+            'file_steps': {name: {'seconds': round(t, 6), 'calls': calls}
+                           for name, (t, calls) in self.file_steps.items()},
+            'languages': {name: {'seconds': round(t, 6), 'files': files, 'bytes': nbytes}
+                          for name, (t, files, nbytes) in
+                          sorted(self.languages.items(), key=lambda kv: -kv[1][0])},
+            'slowest_files': [{'path': path, 'seconds': round(t, 6)}
+                              for t, path in sorted(self.slowest_files, reverse=True)],
+            'slowest_dirs': [{'path': path, 'seconds': round(t, 6)}
+                             for path, t in heapq.nlargest(self.top_n, self.dir_times.items(),
+                                                           key=lambda kv: kv[1])],
         }
+
+
+class _ProfiledMatcher:
+    """为忽略规则匹配计时的 IgnoreMatcher 包装"""
     
-    # 大文件警告
-    large_files = [f for f in all_files if f.code_lines > 800]
-    metrics['large_files'] = {
-        'value': len(large_files),
-        'unit': '个',
-        'status': 'warning' if large_files else 'good',
-        'desc': '大文件 (>800行代码)',
-        'files': [{'path': f.path, 'lines': f.code_lines} for f in large_files[:5]],
-    }
+    def __init__(self, matcher: IgnoreMatcher, profiler: Profiler):
+        self.matcher = matcher
+        self.profiler = profiler
     
-    # 低注释文件
-    low_comment_files = [f for f in all_files 
-                         if f.code_lines > 100 and 
-                         f.comment_lines / f.code_lines < 0.05 if f.code_lines > 0]
-    metrics['low_comment_files'] = {
-        'value': len(low_comment_files),
-        'unit': '个',
-        'status': 'warning' if low_comment_files else 'good',
-        'desc': '低注释文件 (<5%注释)',
-        'files': [{'path': f.path, 'ratio': round(f.comment_lines/f.code_lines*100, 1) if f.code_lines > 0 else 0} 
-                  for f in low_comment_files[:5]],
-    }
+    def match(self, name: str, rel_path: str = '') -> bool:
+        with self.profiler.phase('ignore'):
+            return self.matcher.match(name, rel_path)
+
+
+def profile_phase(name: str):
+    """未开启 --profile 时为空上下文"""
+    if PROFILER is None:
+        return contextlib.nullcontext()
+    return PROFILER.phase(name)
+
+
+def _profile_matcher(matcher: IgnoreMatcher):
+    if PROFILER is None:
+        return matcher
+    return _ProfiledMatcher(matcher, PROFILER)
+
+
+def _step_clock(steps: Optional[Dict[str, float]]) -> float:
+    """未在记录步骤耗时（steps 为 None）时不读取时钟"""
+    return time.perf_counter() if steps is not None else 0.0
+
+
+def _record_step(steps: Optional[Dict[str, float]], step: str, start: float) -> float:
+    """把 start 以来的耗时计入当前文件的 step 步骤，返回当前时间供下一步骤使用"""
+    if steps is None:
+        return 0.0
+    now = time.perf_counter()
+    steps[step] = steps.get(step, 0.0) + now - start
+    return now
+
+
+def enable_profiling(top_n: int = 10) -> Profiler:
+    global PROFILER
+    PROFILER = Profiler(top_n)
+    return PROFILER
+
+
+def profile_scan_file(file_path: str):
+    """scan_file 的计时版本，返回 (FileStats 或 None, 路径, 总耗时, 各步骤耗时)"""
+    steps = _FILE_STEPS.current = {}
+    start = time.perf_counter()
+    try:
+        stats = scan_file(file_path)
+    finally:
+        _FILE_STEPS.current = None
+    return stats, file_path, time.perf_counter() - start, steps
+
+
+def _file_scanner():
+    """当前使用的文件扫描函数，结果需经 _scan_result 处理"""
+    return scan_file if PROFILER is None else profile_scan_file
+
+
+def _scan_result(result) -> Optional[FileStats]:
+    if PROFILER is None:
+        return result
+    return PROFILER.record_file(result)
+
+
+def _init_worker(mmap_threshold: int, analyze_max_size: Optional[int]):
+    """工作进程初始化：spawn 启动方式下不继承运行时设置"""
+    set_mmap_threshold(mmap_threshold)
+    set_analyze_max_size(analyze_max_size)
+
+
+def print_profile(report: Dict):
+    """打印 --profile 的耗时分解"""
+    total = report['total_seconds'] or 1e-9
     
-    return metrics
+    print()
+    print(color("Profile", Colors.BOLD + Colors.CYAN))
+    print(color("=" * 80, Colors.DIM))
+    header = f"{'Phase':<24} {'Time(s)':>10} {'Share':>8} {'Calls':>10} {'Bytes':>12} {'MB/s':>10}"
+    print(color(header, Colors.BOLD))
+    print(color("-" * 80, Colors.DIM))
+    for name, p in sorted(report['phases'].items(), key=lambda kv: -kv[1]['seconds']):
+        rate = f"{p['bytes'] / 1024 / 1024 / p['seconds']:.1f}" if p['bytes'] and p['seconds'] else '-'
+        print(f"{name:<24} {p['seconds']:>10.3f} {p['seconds'] / total:>7.1%} {p['calls']:>10,} "
+              f"{format_size(p['bytes']) if p['bytes'] else '-':>12} {rate:>10}")
+    print(color("-" * 80, Colors.DIM))
+    print(color(f"{'Total (wall)':<24} {report['total_seconds']:>10.3f}", Colors.BOLD + Colors.GREEN))
+    
+    if report['file_steps']:
+        print()
+        print(color("Per-file steps (summed over workers)", Colors.BOLD))
+        for name, p in sorted(report['file_steps'].items(), key=lambda kv: -kv[1]['seconds']):
+            print(f"  {name:<22} {p['seconds']:>10.3f} {p['calls']:>10,}")
+    
+    if report['languages']:
+        print()
+        print(color(f"{'Language':<24} {'Time(s)':>10} {'Files':>10} {'Bytes':>12} {'MB/s':>10}", Colors.BOLD))
+        for name, p in report['languages'].items():
+            rate = f"{p['bytes'] / 1024 / 1024 / p['seconds']:.1f}" if p['bytes'] and p['seconds'] else '-'
+            print(f"{name:<24} {p['seconds']:>10.3f} {p['files']:>10,} {format_size(p['bytes']):>12} {rate:>10}")
+    
+    for title, key in [('Slowest files', 'slowest_files'), ('Slowest directories', 'slowest_dirs')]:
+        if report[key]:
+            print()
+            print(color(title, Colors.BOLD))
+            for item in report[key]:
+                print(f"  {item['seconds'] * 1000:>10.1f} ms  {item['path']}")
+    print(color("=" * 80, Colors.DIM))
+
+
+def start_profile_dump(mode: str):
+    """--profile cprofile|tracemalloc：在整个运行期间采集，返回采集器"""
+    if mode == 'cprofile':
+        import cProfile
+        collector = cProfile.Profile()
+        collector.enable()
+        return collector
+    if mode == 'tracemalloc':
+        import tracemalloc
+        tracemalloc.start(25)
+        return tracemalloc
+    return None
+
+
+def finish_profile_dump(mode: str, collector, output_dir: str) -> Optional[str]:
+    """停止采集，打印摘要并把原始数据写入输出目录，返回文件路径"""
+    if collector is None:
+        return None
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    
+    print()
+    if mode == 'cprofile':
+        import pstats
+        collector.disable()
+        path = os.path.join(output_dir, f"profile_{timestamp}.prof")
+        collector.dump_stats(path)
+        print(color("cProfile (top 15 by cumulative time)", Colors.BOLD))
+        pstats.Stats(collector, stream=sys.stdout).sort_stats('cumulative').print_stats(15)
+    else:
+        snapshot = collector.take_snapshot()
+        current, peak = collector.get_traced_memory()
+        collector.stop()
+        path = os.path.join(output_dir, f"profile_{timestamp}.tracemalloc")
+        snapshot.dump(path)
+        print(color(f"tracemalloc (current {format_size(current)}, peak {format_size(peak)})", Colors.BOLD))
+        for stat in snapshot.statistics('lineno')[:10]:
+            print(f"  {stat}")
+    print(color(f"Profile data saved to: {path}", Colors.GREEN))
+    return path
 
 
 # ============================================================================
 # 输出格式化
 # ============================================================================
+def iter_tree(node, prefix: str = "", is_last: bool = True):
+    """前序遍历目录树，产出 (节点, 前缀, 是否为最后一个子项)（显式栈，非递归）"""
+    stack = [(node, prefix, is_last)]
+    while stack:
+        node, prefix, is_last = stack.pop()
+        yield node, prefix, is_last
+        if isinstance(node, DirStats):
+            new_prefix = prefix + ("    " if is_last else "│   ")
+            children = list(node.iter_children())
+            last = len(children) - 1
+            for i in range(last, -1, -1):
+                stack.append((children[i], new_prefix, i == last))
+
+
+def iter_tree_text(node, prefix: str = "", is_last: bool = True):
+    """逐行产出目录树的纯文本（用于流式写出报告）"""
+    for node, prefix, is_last in iter_tree(node, prefix, is_last):
+        connector = "└── " if is_last else "├── "
+        if isinstance(node, DirStats):
+            # 目录
+            stats = f"[{node.file_count} files | {format_number(node.code_lines)} code | {format_size(node.total_size)}]"
+            yield f"{prefix}{connector}📁 {node.name}/ {stats}"
+        else:
+            # 文件
+            stats = f"[{node.code_lines}|{node.comment_lines}|{node.blank_lines}]"
+            yield f"{prefix}{connector}📄 {node.name} [{node.language}] {stats} {format_size(node.size)}"
+
+
 def generate_tree_text(node, prefix: str = "", is_last: bool = True) -> List[str]:
     """生成目录树的纯文本（用于保存到文件）"""
-    lines = []
-    connector = "└── " if is_last else "├── "
-    
-    if isinstance(node, DirStats):
-        # 目录
-        stats = f"[{node.file_count} files | {format_number(node.code_lines)} code | {format_size(node.total_size)}]"
-        lines.append(f"{prefix}{connector}📁 {node.name}/ {stats}")
-        
-        # 子项
-        new_prefix = prefix + ("    " if is_last else "│   ")
-        children = node.children
-        for i, child in enumerate(children):
-            lines.extend(generate_tree_text(child, new_prefix, i == len(children) - 1))
-    else:
-        # 文件
-        stats = f"[{node.code_lines}|{node.comment_lines}|{node.blank_lines}]"
-        lines.append(f"{prefix}{connector}📄 {node.name} [{node.language}] {stats} {format_size(node.size)}")
-    
-    return lines
+    return list(iter_tree_text(node, prefix, is_last))
 
 
 def print_tree(node, prefix: str = "", is_last: bool = True, show_details: bool = True):
     """打印目录树"""
-    connector = "└── " if is_last else "├── "
-    
-    if isinstance(node, DirStats):
-        # 目录
-        icon = "📁"
-        name = color(node.name + "/", Colors.BRIGHT_BLUE + Colors.BOLD)
-        stats = color(f"[{node.file_count} files | {format_number(node.code_lines)} code | {format_size(node.total_size)}]", Colors.DIM)
-        print(f"{prefix}{connector}{icon} {name} {stats}")
-        
-        # 子项
-        new_prefix = prefix + ("    " if is_last else "│   ")
-        children = node.children
-        for i, child in enumerate(children):
-            print_tree(child, new_prefix, i == len(children) - 1, show_details)
-    else:
-        # 文件
-        icon = "📄"
-        name = node.name
-        lang = color(f"[{node.language}]", Colors.CYAN)
-        if show_details:
-            stats = color(f"[{node.code_lines}|{node.comment_lines}|{node.blank_lines}]", Colors.DIM)
-            size = color(format_size(node.size), Colors.DIM)
-            print(f"{prefix}{connector}{icon} {name} {lang} {stats} {size}")
+    for node, prefix, is_last in iter_tree(node, prefix, is_last):
+        connector = "└── " if is_last else "├── "
+        if isinstance(node, DirStats):
+            # 目录
+            icon = "📁"
+            name = color(node.name + "/", Colors.BRIGHT_BLUE + Colors.BOLD)
+            stats = color(f"[{node.file_count} files | {format_number(node.code_lines)} code | {format_size(node.total_size)}]", Colors.DIM)
+            print(f"{prefix}{connector}{icon} {name} {stats}")
         else:
-            print(f"{prefix}{connector}{icon} {name} {lang}")
+            # 文件
+            icon = "📄"
+            name = node.name
+            lang = color(f"[{node.language}]", Colors.CYAN)
+            if show_details:
+                stats = color(f"[{node.code_lines}|{node.comment_lines}|{node.blank_lines}]", Colors.DIM)
+                size = color(format_size(node.size), Colors.DIM)
+                print(f"{prefix}{connector}{icon} {name} {lang} {stats} {size}")
+            else:
+                print(f"{prefix}{connector}{icon} {name} {lang}")
 
 
 def print_language_table(lang_stats: Dict[str, LanguageStats]):
@@ -878,10 +4471,12 @@ def print_health(health: Dict):
         line = f"  {icon:<8} {metric['desc']}: {metric['value']} {metric['unit']}"
         print(color(line, clr))
         
-        if key in ['large_files', 'low_comment_files'] and metric['value'] > 0:
+        if key in ['large_files', 'low_comment_files', 'complex_files'] and metric['value'] > 0:
             for f in metric.get('files', [])[:3]:
                 if 'lines' in f:
                     file_line = f"           - {os.path.basename(f['path'])} ({f['lines']} lines)"
+                elif 'max_complexity' in f:
+                    file_line = f"           - {os.path.basename(f['path'])} (CC {f['max_complexity']})"
                 else:
                     file_line = f"           - {os.path.basename(f['path'])} ({f['ratio']}%)"
                 print(color(file_line, Colors.DIM))
@@ -889,195 +4484,635 @@ def print_health(health: Dict):
     print(color("=" * 60, Colors.DIM))
 
 
-def print_top_files(all_files: List[FileStats], n: int = 10):
-    """打印 Top N 文件"""
+def print_top_files(top_files: List[FileStats], n: int = 10, key: str = 'code'):
+    """打印 Top N 文件（top_files 已按 key 排名，见 ScanSummary.top_files）"""
     print()
-    print(color(f"Top {n} Files (by code lines)", Colors.BOLD))
+    print(color(f"Top {n} Files (by {RANK_KEYS[key][1]})", Colors.BOLD))
     print(color("=" * 80, Colors.DIM))
     
-    sorted_files = sorted(all_files, key=lambda x: x.code_lines, reverse=True)[:n]
-    
-    for i, f in enumerate(sorted_files, 1):
+    for i, f in enumerate(top_files[:n], 1):
         ratio = f.comment_lines / f.code_lines * 100 if f.code_lines > 0 else 0
         print(f"  {i:2}. {os.path.basename(f.path)}")
         print(color(f"     {f.language} | {f.code_lines:,} 代码行 | {f.comment_lines:,} 注释行 ({ratio:.1f}%) | {format_size(f.size)}", Colors.DIM))
 
 
-def generate_json(dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: Dict) -> str:
-    """生成 JSON 输出"""
-    def node_to_dict(node):
-        if isinstance(node, FileStats):
-            return asdict(node)
-        elif isinstance(node, DirStats):
-            d = {
-                'path': node.path,
-                'name': node.name,
-                'type': 'directory',
-                'file_count': node.file_count,
-                'dir_count': node.dir_count,
-                'total_size': node.total_size,
-                'total_lines': node.total_lines,
-                'code_lines': node.code_lines,
-                'comment_lines': node.comment_lines,
-                'blank_lines': node.blank_lines,
-                'children': [node_to_dict(c) for c in node.children],
-            }
-            return d
+def print_duplicates(duplicates: Dict, n: int = 5):
+    """打印重复文件统计"""
+    print()
+    print(color("Duplicate Files (identical content)", Colors.BOLD + Colors.YELLOW))
+    print(color("=" * 80, Colors.DIM))
     
-    result = {
-        'tree': node_to_dict(dir_stats),
-        'by_language': {k: asdict(v) for k, v in lang_stats.items()},
-        'cocomo': cocomo,
-        'health': health,
-    }
+    if not duplicates['groups']:
+        print("  未发现重复文件")
+        print(color("=" * 80, Colors.DIM))
+        return
+    
+    print(f"  重复组数:   {duplicates['groups']:,}")
+    print(f"  多余副本:   {duplicates['files']:,} 个文件")
+    print(f"  可节省:     {format_size(duplicates['bytes_saved'])} / {duplicates['lines_saved']:,} 行")
+    print(color("-" * 80, Colors.DIM))
+    
+    for group in duplicates['top'][:n]:
+        print(f"  {group['count']} x {os.path.basename(group['paths'][0])} "
+              f"({format_size(group['size'])}, {group['lines']:,} 行)")
+        for path in group['paths'][:3]:
+            print(color(f"           - {path}", Colors.DIM))
+        if group['count'] > 3:
+            print(color(f"           ... 另有 {group['count'] - 3} 个", Colors.DIM))
+    
+    print(color("=" * 80, Colors.DIM))
+
+
+def print_dependencies(dependencies: Dict, n: int = 5):
+    """打印依赖关系图摘要"""
+    print()
+    print(color("Dependency Graph (import / #include)", Colors.BOLD + Colors.YELLOW))
+    print(color("=" * 80, Colors.DIM))
+    
+    if not dependencies['modules']:
+        print("  没有可分析依赖的模块")
+        print(color("=" * 80, Colors.DIM))
+        return
+    
+    cycles = dependencies['cycles']
+    print(f"  模块数:     {dependencies['modules']:,}")
+    print(f"  依赖数:     {dependencies['edges']:,} (外部依赖 {dependencies['unresolved']:,})")
+    cycle_text = f"{cycles['count']:,} 个，涉及 {cycles['modules']:,} 个模块"
+    print(f"  循环依赖:   {color(cycle_text, Colors.RED if cycles['count'] else Colors.GREEN)}")
+    print(color("-" * 80, Colors.DIM))
+    
+    for row in dependencies['top_fan_in'][:n]:
+        fan_out = f"(fan-out {row['fan_out']:,})"
+        print(f"  {row['fan_in']:>6,} <- {row['module']}  {color(fan_out, Colors.DIM)}")
+    for cycle in cycles['top'][:3]:
+        print(color(f"  ⟳ {cycle['size']} 个模块: {', '.join(cycle['modules'][:4])}"
+                    f"{' ...' if cycle['size'] > 4 else ''}", Colors.RED))
+    
+    print(color("=" * 80, Colors.DIM))
+
+
+def _delta_text(old: int, new: int, width: int, size: bool = False) -> str:
+    """格式化变化量（先按 width 对齐再着色: 增加为绿色，减少为红色）"""
+    delta = new - old
+    text = format_size(abs(delta)) if size else f"{abs(delta):,}"
+    if delta > 0:
+        return color(f"{'+' + text:>{width}}", Colors.GREEN)
+    if delta < 0:
+        return color(f"{'-' + text:>{width}}", Colors.RED)
+    return color(f"{'0':>{width}}", Colors.DIM)
+
+
+def print_snapshot_diff(diff: Dict, n: int = 20):
+    """打印两个快照的对比结果（按代码行变化量排序，目录只显示前 n 个）"""
+    print()
+    print(color("Snapshot Diff", Colors.BOLD + Colors.CYAN))
+    print(color("=" * 95, Colors.DIM))
+    print(f"  旧: {diff['old']['root']} ({diff['old']['created']})")
+    print(f"  新: {diff['new']['root']} ({diff['new']['created']})")
+    if diff['config_changed']:
+        print(color("  ⚠️ 两次扫描的排除规则或扫描设置不同，部分差异可能来自规则变化", Colors.YELLOW))
+    print(color("-" * 95, Colors.DIM))
+    
+    labels = {'file_count': 'Files', 'code_lines': 'Code', 'comment_lines': 'Comment',
+              'blank_lines': 'Blank', 'total_lines': 'Total', 'total_size': 'Size'}
+    print(color(f"  {'Metric':<18} {'Old':>14} {'New':>14} {'Change':>14}", Colors.BOLD))
+    for key, (old, new) in diff['totals'].items():
+        if key == 'total_size':
+            print(f"  {labels[key]:<18} {format_size(old):>14} {format_size(new):>14} {_delta_text(old, new, 14, True)}")
+        else:
+            print(f"  {labels[key]:<18} {old:>14,} {new:>14,} {_delta_text(old, new, 14)}")
+    
+    def by_code_change(item):
+        old, new = item[1]['code_lines']
+        return -abs(new - old), item[0]
+    
+    def print_rows(title: str, column: str, rows, name_width: int):
+        print()
+        print(color(title, Colors.BOLD + Colors.CYAN))
+        print(color("=" * 95, Colors.DIM))
+        if not rows:
+            print("  无变化")
+            print(color("=" * 95, Colors.DIM))
+            return
+        header = (f"{column:<{name_width}} {'ΔFiles':>8} {'Code':>12} {'ΔCode':>10} "
+                  f"{'ΔComment':>10} {'ΔBlank':>9} {'ΔSize':>10}")
+        print(color(header, Colors.BOLD))
+        print(color("-" * 95, Colors.DIM))
+        for name, delta in rows:
+            if len(name) > name_width:
+                name = "..." + name[-(name_width - 3):]
+            files_old, files_new = delta['file_count']
+            print(f"{name:<{name_width}} {_delta_text(files_old, files_new, 8)} {delta['code_lines'][1]:>12,} "
+                  f"{_delta_text(*delta['code_lines'], 10)} {_delta_text(*delta['comment_lines'], 10)} "
+                  f"{_delta_text(*delta['blank_lines'], 9)} {_delta_text(*delta['total_size'], 10, True)}")
+        print(color("=" * 95, Colors.DIM))
+    
+    print_rows("By Language", 'Language', sorted(diff['languages'].items(), key=by_code_change), 18)
+    directories = sorted(diff['directories'].items(), key=by_code_change)
+    title = "By Directory"
+    if len(directories) > n:
+        title += f" (top {n} of {len(directories)} by code change)"
+    print_rows(title, 'Directory', directories[:n], 30)
+
+
+def print_history(series: List[Dict], n: int = 20):
+    """打印提交历史的代码规模变化（等间隔抽取至多 n 个提交，总是包含首尾）"""
+    print()
+    print(color("History", Colors.BOLD + Colors.CYAN))
+    print(color("=" * 95, Colors.DIM))
+    if not series:
+        print("  没有提交")
+        print(color("=" * 95, Colors.DIM))
+        return
+    
+    if len(series) > n > 1:
+        step = (len(series) - 1) / (n - 1)
+        indexes = sorted({round(i * step) for i in range(n)})
+    else:
+        indexes = range(len(series))
+    
+    header = (f"{'Date':<20} {'Commit':<10} {'Files':>8} {'Code':>12} {'ΔCode':>10} "
+              f"{'Top Language':<18} {'PM':>8}")
+    print(color(header, Colors.BOLD))
+    print(color("-" * 95, Colors.DIM))
+    prev = None
+    for i in indexes:
+        point = series[i]
+        top = next(iter(point['languages']), '-')
+        delta = _delta_text(prev['code_lines'], point['code_lines'], 10) if prev else f"{'':>10}"
+        print(f"{point['date'][:19].replace('T', ' '):<20} {point['commit'][:8]:<10} {point['file_count']:>8,} "
+              f"{point['code_lines']:>12,} {delta} {top[:18]:<18} {point['cocomo']['person_months']:>8.1f}")
+        prev = point
+    print(color("=" * 95, Colors.DIM))
+    if len(series) > n:
+        print(color(f"  共 {len(series):,} 个提交，显示其中 {len(indexes)} 个", Colors.DIM))
+
+
+def write_history_json(out, series: List[Dict], meta: Dict):
+    """把提交历史写入 JSON 报告：每个提交一行，十万级提交也不必在内存中拼出整份文本"""
+    out.write('{\n  "generated_at": ' + json.dumps(datetime.now().isoformat()))
+    for key, value in meta.items():
+        out.write(f',\n  {json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}')
+    out.write(',\n  "series": [')
+    for i, point in enumerate(series):
+        out.write(('\n    ' if i == 0 else ',\n    ') + json.dumps(point, ensure_ascii=False))
+    out.write('\n  ]\n}\n' if series else ']\n}\n')
+
+
+_DIR_JSON_FIELDS = ('path', 'name', 'type', 'file_count', 'dir_count', 'total_size',
+                    'total_lines', 'code_lines', 'comment_lines', 'blank_lines')
+# 依赖记号汇总在报告的 dependencies 部分，不逐文件写出（JSON 报告与 --stream 共用）
+_FILE_JSON_FIELDS = tuple(f.name for f in fields(FileStats) if f.name != 'imports')
+
+
+def _write_json_tree(out, node, level: int = 0):
+    """
+    流式写出目录树（显式栈，非递归）
     
-    return json.dumps(result, indent=2, ensure_ascii=False)
-
-
-def generate_markdown(dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: Dict, all_files: List[FileStats] = None) -> str:
-    """生成 Markdown 输出"""
-    lines = []
-    lines.append(f"# 📊 代码统计报告: {dir_stats.name}")
-    lines.append("")
-    lines.append(f"> 生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    lines.append("")
-    lines.append("## 📋 概览")
-    lines.append("")
-    lines.append(f"| 指标 | 数值 |")
-    lines.append(f"|------|------|")
-    lines.append(f"| 文件数 | {dir_stats.file_count} |")
-    lines.append(f"| 代码行 | {dir_stats.code_lines:,} |")
-    lines.append(f"| 注释行 | {dir_stats.comment_lines:,} |")
-    lines.append(f"| 空行 | {dir_stats.blank_lines:,} |")
-    lines.append(f"| 总行数 | {dir_stats.total_lines:,} |")
-    lines.append(f"| 总大小 | {format_size(dir_stats.total_size)} |")
-    lines.append("")
+    格式与 json.dumps(indent=2) 逐字节一致，但不构造中间 dict，
+    也不受目录深度的递归限制。level 为节点所在的缩进层级。
+    """
+    write = out.write
+    dumps = json.dumps
+    stack = []  # [(子节点迭代器, 父节点层级)]
+    while True:
+        pad = '  ' * level
+        if isinstance(node, DirStats):
+            write('{')
+            for key in _DIR_JSON_FIELDS:
+                value = 'directory' if key == 'type' else getattr(node, key)
+                write(f'\n{pad}  "{key}": {dumps(value, ensure_ascii=False)},')
+            children = node.iter_children()
+            child = next(children, None)
+            if child is not None:
+                stack.append((children, level))
+                write(f'\n{pad}  "children": [\n{pad}    ')
+                node = child
+                level += 2
+                continue
+            write(f'\n{pad}  "children": []\n{pad}}}')
+        else:
+            write('{')
+            sep = ''
+            for key in _FILE_JSON_FIELDS:
+                write(f'{sep}\n{pad}  "{key}": {dumps(getattr(node, key), ensure_ascii=False)}')
+                sep = ','
+            write(f'\n{pad}}}')
+        
+        # 当前节点写完: 转到下一个兄弟节点，或逐层闭合父目录
+        while stack:
+            children, parent_level = stack[-1]
+            child = next(children, None)
+            ppad = '  ' * parent_level
+            if child is not None:
+                write(f',\n{ppad}    ')
+                node = child
+                level = parent_level + 2
+                break
+            stack.pop()
+            write(f'\n{ppad}  ]\n{ppad}}}')
+        else:
+            return
+
+
+def write_json(out, dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: Dict,
+               duplicates: Dict = None, profile: Dict = None, dependencies: Dict = None):
+    """把 JSON 报告流式写入文件对象 out"""
+    sections = [
+        ('by_language', {k: asdict(v) for k, v in lang_stats.items()}),
+        ('cocomo', cocomo),
+        ('health', health),
+    ]
+    if duplicates is not None:
+        sections.append(('duplicates', duplicates))
+    if dependencies is not None:
+        sections.append(('dependencies', dependencies))
+    if profile is not None:
+        sections.append(('profile', profile))
+    
+    out.write('{\n  "tree": ')
+    _write_json_tree(out, dir_stats, 1)
+    for key, value in sections:
+        text = json.dumps(value, indent=2, ensure_ascii=False).replace('\n', '\n  ')
+        out.write(f',\n  "{key}": {text}')
+    out.write('\n}')
+
+
+def generate_json(dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: Dict,
+                  duplicates: Dict = None, profile: Dict = None, dependencies: Dict = None) -> str:
+    """生成 JSON 输出"""
+    out = io.StringIO()
+    write_json(out, dir_stats, lang_stats, cocomo, health, duplicates, profile, dependencies)
+    return out.getvalue()
+
+
+def write_markdown(out, dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: Dict,
+                   top_files: List[FileStats] = None, duplicates: Dict = None):
+    """把 Markdown 报告流式写入文件对象 out（top_files 为已按代码行数排名的文件）"""
+    def line(text: str):
+        # 行之间以换行分隔（首行之前不写），与 "\n".join 的结果一致
+        out.write("\n")
+        out.write(text)
+    
+    out.write(f"# 📊 代码统计报告: {dir_stats.name}")
+    line("")
+    line(f"> 生成时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    line("")
+    line("## 📋 概览")
+    line("")
+    line(f"| 指标 | 数值 |")
+    line(f"|------|------|")
+    line(f"| 文件数 | {dir_stats.file_count} |")
+    line(f"| 代码行 | {dir_stats.code_lines:,} |")
+    line(f"| 注释行 | {dir_stats.comment_lines:,} |")
+    line(f"| 空行 | {dir_stats.blank_lines:,} |")
+    line(f"| 总行数 | {dir_stats.total_lines:,} |")
+    line(f"| 总大小 | {format_size(dir_stats.total_size)} |")
+    line("")
     
     # 目录树
-    lines.append("## 📂 目录结构")
-    lines.append("")
-    lines.append("> 📖 图例: `[代码行|注释行|空行]`")
-    lines.append("")
-    lines.append("```")
-    tree_lines = generate_tree_text(dir_stats)
-    lines.extend(tree_lines)
-    lines.append("```")
-    lines.append("")
+    line("## 📂 目录结构")
+    line("")
+    line("> 📖 图例: `[代码行|注释行|空行]`")
+    line("")
+    line("```")
+    for tree_line in iter_tree_text(dir_stats):
+        line(tree_line)
+    line("```")
+    line("")
     
     # 语言统计
-    lines.append("## 📊 语言统计")
-    lines.append("")
-    lines.append("| 语言 | 文件 | 代码行 | 注释行 | 空行 | 总大小 |")
-    lines.append("|------|------|--------|--------|------|--------|")
+    line("## 📊 语言统计")
+    line("")
+    line("| 语言 | 文件 | 代码行 | 注释行 | 空行 | 总大小 |")
+    line("|------|------|--------|--------|------|--------|")
     
     sorted_langs = sorted(lang_stats.values(), key=lambda x: x.code_lines, reverse=True)
     for ls in sorted_langs:
-        lines.append(f"| {ls.language} | {ls.file_count} | {ls.code_lines:,} | {ls.comment_lines:,} | {ls.blank_lines:,} | {format_size(ls.total_size)} |")
+        line(f"| {ls.language} | {ls.file_count} | {ls.code_lines:,} | {ls.comment_lines:,} | {ls.blank_lines:,} | {format_size(ls.total_size)} |")
     
     # 总计
-    lines.append(f"| **总计** | **{dir_stats.file_count}** | **{dir_stats.code_lines:,}** | **{dir_stats.comment_lines:,}** | **{dir_stats.blank_lines:,}** | **{format_size(dir_stats.total_size)}** |")
-    lines.append("")
+    line(f"| **总计** | **{dir_stats.file_count}** | **{dir_stats.code_lines:,}** | **{dir_stats.comment_lines:,}** | **{dir_stats.blank_lines:,}** | **{format_size(dir_stats.total_size)}** |")
+    line("")
     
     # COCOMO
-    lines.append("## 💰 开发成本估算 (COCOMO)")
-    lines.append("")
-    lines.append(f"| 指标 | 数值 |")
-    lines.append(f"|------|------|")
-    lines.append(f"| 代码规模 | {cocomo['kloc']:.2f} KLOC ({int(cocomo['kloc']*1000):,} 行) |")
-    lines.append(f"| 项目类型 | {cocomo['project_type_desc']} ({cocomo['project_type']}) |")
-    lines.append(f"| 预估工期 | {cocomo['duration_months']:.1f} 个月 |")
-    lines.append(f"| 建议团队 | {cocomo['team_size']:.1f} 人 |")
-    lines.append(f"| 总人月数 | {cocomo['person_months']:.1f} 人月 |")
-    lines.append(f"| 成本 (USD) | ${cocomo['cost_usd']:,} |")
-    lines.append(f"| 成本 (CNY) | ¥{cocomo['cost_cny']:,} |")
-    lines.append("")
+    line("## 💰 开发成本估算 (COCOMO)")
+    line("")
+    line(f"| 指标 | 数值 |")
+    line(f"|------|------|")
+    line(f"| 代码规模 | {cocomo['kloc']:.2f} KLOC ({int(cocomo['kloc']*1000):,} 行) |")
+    line(f"| 项目类型 | {cocomo['project_type_desc']} ({cocomo['project_type']}) |")
+    line(f"| 预估工期 | {cocomo['duration_months']:.1f} 个月 |")
+    line(f"| 建议团队 | {cocomo['team_size']:.1f} 人 |")
+    line(f"| 总人月数 | {cocomo['person_months']:.1f} 人月 |")
+    line(f"| 成本 (USD) | ${cocomo['cost_usd']:,} |")
+    line(f"| 成本 (CNY) | ¥{cocomo['cost_cny']:,} |")
+    line("")
     
     # 健康度
-    lines.append("## 🏥 代码健康度")
-    lines.append("")
-    lines.append("| 指标 | 数值 | 状态 |")
-    lines.append("|------|------|------|")
+    line("## 🏥 代码健康度")
+    line("")
+    line("| 指标 | 数值 | 状态 |")
+    line("|------|------|------|")
     
     status_emoji = {'good': '✅', 'warning': '⚠️', 'bad': '❌', 'info': 'ℹ️'}
     for key, metric in health.items():
         if key not in ['large_files', 'low_comment_files']:
             emoji = status_emoji.get(metric['status'], '')
-            lines.append(f"| {metric['desc']} | {metric['value']} {metric['unit']} | {emoji} |")
+            line(f"| {metric['desc']} | {metric['value']} {metric['unit']} | {emoji} |")
     
     # 大文件
     if health.get('large_files', {}).get('value', 0) > 0:
-        lines.append("")
-        lines.append(f"### ⚠️ 大文件警告 ({health['large_files']['value']} 个)")
-        lines.append("")
+        line("")
+        line(f"### ⚠️ 大文件警告 ({health['large_files']['value']} 个)")
+        line("")
         for f in health['large_files'].get('files', [])[:10]:
-            lines.append(f"- `{f['path']}` ({f['lines']} 行)")
+            line(f"- `{f['path']}` ({f['lines']} 行)")
     
-    lines.append("")
+    line("")
     
     # Top 10
-    if all_files:
-        lines.append("## 📈 Top 10 文件")
-        lines.append("")
-        lines.append("| 排名 | 文件 | 语言 | 代码行 | 注释率 |")
-        lines.append("|------|------|------|--------|--------|")
-        
-        sorted_files = sorted(all_files, key=lambda x: x.code_lines, reverse=True)[:10]
-        for i, f in enumerate(sorted_files, 1):
+    if top_files:
+        line("## 📈 Top 10 文件")
+        line("")
+        line("| 排名 | 文件 | 语言 | 代码行 | 注释率 |")
+        line("|------|------|------|--------|--------|")
+        
+        for i, f in enumerate(top_files[:10], 1):
             ratio = f.comment_lines / f.code_lines * 100 if f.code_lines > 0 else 0
-            lines.append(f"| {i} | `{os.path.basename(f.path)}` | {f.language} | {f.code_lines:,} | {ratio:.1f}% |")
+            line(f"| {i} | `{os.path.basename(f.path)}` | {f.language} | {f.code_lines:,} | {ratio:.1f}% |")
+        
+        line("")
+    
+    # 重复文件
+    if duplicates is not None:
+        line("## 📑 重复文件")
+        line("")
+        line(f"| 指标 | 数值 |")
+        line(f"|------|------|")
+        line(f"| 重复组数 | {duplicates['groups']:,} |")
+        line(f"| 多余副本 | {duplicates['files']:,} 个 |")
+        line(f"| 可节省大小 | {format_size(duplicates['bytes_saved'])} |")
+        line(f"| 可节省行数 | {duplicates['lines_saved']:,} |")
+        line("")
         
-        lines.append("")
+        if duplicates['top']:
+            line("| 副本数 | 文件 | 大小 | 行数 | 可节省 |")
+            line("|--------|------|------|------|--------|")
+            for group in duplicates['top']:
+                line(f"| {group['count']} | `{group['paths'][0]}` | {format_size(group['size'])} | "
+                 f"{group['lines']:,} | {format_size(group['bytes_saved'])} |")
+            line("")
+
+
+def generate_markdown(dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: Dict, top_files: List[FileStats] = None,
+                      duplicates: Dict = None) -> str:
+    """生成 Markdown 输出（top_files 为已按代码行数排名的文件）"""
+    out = io.StringIO()
+    write_markdown(out, dir_stats, lang_stats, cocomo, health, top_files, duplicates)
+    return out.getvalue()
+
+
+# HTML 报告中的目录树: 数据以紧凑 JSON 嵌入页面，由脚本按需展开并只渲染可见的行
+# （虚拟滚动），节点数再多页面也能立即打开
+HTML_TREE_EXPAND_ALL_MAX = 2000    # 节点数不超过此值时默认全部展开，否则只展开根目录
+
+
+def _write_html_tree_data(out, root: DirStats):
+    """
+    把目录树写成紧凑 JSON（前序排列的扁平数组，显式栈，非递归）
+    
+    目录: [名称, -1, 代码行, 注释行, 空行, 大小, 文件数, 子项数]
+    文件: [名称, 语言序号, 代码行, 注释行, 空行, 大小]
     
-    return "\n".join(lines)
+    名称中的 "<" 写成 \\u003c，文件名里的 "</script>" 不会提前结束数据块。
+    """
+    write = out.write
+    dumps = json.dumps
+    lang_ids = {}
+    write('{"nodes":[')
+    sep = ''
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        name = dumps(node.name, ensure_ascii=False).replace('<', '\\u003c')
+        if isinstance(node, DirStats):
+            children = list(node.iter_children())
+            write(f'{sep}[{name},-1,{node.code_lines},{node.comment_lines},{node.blank_lines},'
+                  f'{node.total_size},{node.file_count},{len(children)}]')
+            stack.extend(reversed(children))
+        else:
+            lang = lang_ids.setdefault(node.language, len(lang_ids))
+            write(f'{sep}[{name},{lang},{node.code_lines},{node.comment_lines},{node.blank_lines},{node.size}]')
+        sep = ',\n'
+    write('],\n"langs":')
+    write(dumps(list(lang_ids), ensure_ascii=False).replace('<', '\\u003c'))
+    write(f',\n"expand_all_max":{HTML_TREE_EXPAND_ALL_MAX}}}')
+
+
+_HTML_TREE_SCRIPT = """
+(function () {
+    var ROW_HEIGHT = 22, OVERSCAN = 20;
+    var data = JSON.parse(document.getElementById('tree-data').textContent);
+    var nodes = data.nodes, langs = data.langs, n = nodes.length;
+    var viewport = document.getElementById('tree-viewport');
+    var spacer = document.getElementById('tree-spacer');
+    var list = document.getElementById('tree-rows');
+    var status = document.getElementById('tree-status');
+    var searchBox = document.getElementById('tree-search');
+
+    // 由前序数组与子项数还原结构: depth / parent / end (子树之后的第一个位置)
+    var depth = new Int32Array(n), parent = new Int32Array(n), end = new Int32Array(n);
+    var stack = [];
+    for (var i = 0; i < n; i++) {
+        while (stack.length && stack[stack.length - 1][1] === 0) end[stack.pop()[0]] = i;
+        parent[i] = -1;
+        if (stack.length) {
+            var top = stack[stack.length - 1];
+            top[1]--;
+            parent[i] = top[0];
+            depth[i] = depth[top[0]] + 1;
+        }
+        if (nodes[i][1] < 0 && nodes[i][7] > 0) stack.push([i, nodes[i][7]]);
+        else end[i] = i + 1;
+    }
+    while (stack.length) end[stack.pop()[0]] = n;
+
+    var expanded = new Uint8Array(n);
+    var rows = [];          // 当前可见的节点序号
+    var matched = null;     // 搜索模式下命中的节点
+    var focused = -1;
+    var lowerNames = null;
+
+    function isDir(i) { return nodes[i][1] < 0; }
+
+    // 按展开状态重建可见行: 跳过折叠目录的整个子树，只与可见行数成正比
+    function rebuild() {
+        rows = [];
+        for (var i = 0; i < n; ) {
+            rows.push(i);
+            i = isDir(i) && !expanded[i] ? end[i] : i + 1;
+        }
+    }
+
+    function esc(s) {
+        return s.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+    }
+
+    function fmtSize(size) {
+        if (size < 1024) return size + ' B';
+        if (size < 1024 * 1024) return (size / 1024).toFixed(1) + ' KB';
+        if (size < 1024 * 1024 * 1024) return (size / (1024 * 1024)).toFixed(1) + ' MB';
+        return (size / (1024 * 1024 * 1024)).toFixed(1) + ' GB';
+    }
+
+    function fmtNum(num) { return String(num).replace(/\\B(?=(\\d{3})+(?!\\d))/g, ','); }
+
+    function pathOf(i) {
+        var parts = [];
+        for (; i >= 0; i = parent[i]) parts.push(nodes[i][0]);
+        return parts.reverse().join('/');
+    }
+
+    function rowHtml(i, r) {
+        var d = nodes[i], cls = 'tree-row', toggle = ' ', label, stats;
+        if (isDir(i)) {
+            cls += ' dir';
+            if (d[7]) toggle = matched || expanded[i] ? '▾' : '▸';
+            label = '📁 ' + esc(d[0]) + '/';
+            stats = '[' + d[6] + ' files | ' + fmtNum(d[2]) + ' code | ' + fmtSize(d[5]) + ']';
+        } else {
+            label = '📄 ' + esc(d[0]);
+            stats = '[' + esc(langs[d[1]]) + '] [' + d[2] + '|' + d[3] + '|' + d[4] + '] ' + fmtSize(d[5]);
+        }
+        if (matched && matched[i]) cls += ' match';
+        if (i === focused) cls += ' focused';
+        return '<div class="' + cls + '" data-row="' + r + '" title="' + esc(pathOf(i)) +
+            '" style="padding-left:' + (depth[i] * 18 + 4) + 'px"><span class="tree-toggle">' + toggle +
+            '</span><span class="tree-name">' + label + '</span> <span class="tree-stats">' + stats + '</span></div>';
+    }
 
+    // 虚拟滚动: 只为视口内（及上下各 OVERSCAN 行）的节点生成 DOM
+    function render() {
+        spacer.style.height = rows.length * ROW_HEIGHT + 'px';
+        var first = Math.max(0, Math.floor(viewport.scrollTop / ROW_HEIGHT) - OVERSCAN);
+        var last = Math.min(rows.length, Math.ceil((viewport.scrollTop + viewport.clientHeight) / ROW_HEIGHT) + OVERSCAN);
+        var html = [];
+        for (var r = first; r < last; r++) html.push(rowHtml(rows[r], r));
+        list.style.transform = 'translateY(' + first * ROW_HEIGHT + 'px)';
+        list.innerHTML = html.join('');
+    }
 
-def generate_html(dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: Dict, all_files: List[FileStats] = None) -> str:
-    """生成 HTML 报告"""
-    
-    # 语言统计表格行
-    lang_rows = ""
-    sorted_langs = sorted(lang_stats.values(), key=lambda x: x.code_lines, reverse=True)
-    for ls in sorted_langs:
-        lang_rows += f"""
-            <tr>
-                <td>{ls.language}</td>
-                <td>{ls.file_count}</td>
-                <td>{ls.code_lines:,}</td>
-                <td>{ls.comment_lines:,}</td>
-                <td>{ls.blank_lines:,}</td>
-                <td>{format_size(ls.total_size)}</td>
-            </tr>"""
-    
-    # Top 10 表格行
-    top_rows = ""
-    if all_files:
-        sorted_files = sorted(all_files, key=lambda x: x.code_lines, reverse=True)[:10]
-        for i, f in enumerate(sorted_files, 1):
-            ratio = f.comment_lines / f.code_lines * 100 if f.code_lines > 0 else 0
-            top_rows += f"""
-            <tr>
-                <td>{i}</td>
-                <td title="{f.path}">{os.path.basename(f.path)}</td>
-                <td>{f.language}</td>
-                <td>{f.code_lines:,}</td>
-                <td>{ratio:.1f}%</td>
-            </tr>"""
+    function showStatus(extra) {
+        status.textContent = n.toLocaleString() + ' 个节点，显示 ' + rows.length.toLocaleString() + ' 行' + (extra || '');
+    }
+
+    function refresh() {
+        rebuild();
+        render();
+        showStatus();
+    }
+
+    // 搜索: 显示命中的节点及其所有上级目录（不改变原有的展开状态）
+    function search(query) {
+        query = query.trim().toLowerCase();
+        focused = -1;
+        if (!query) {
+            matched = null;
+            refresh();
+            return;
+        }
+        if (!lowerNames) lowerNames = nodes.map(function (d) { return d[0].toLowerCase(); });
+        var show = new Uint8Array(n), count = 0;
+        matched = new Uint8Array(n);
+        for (var i = 0; i < n; i++) {
+            if (lowerNames[i].indexOf(query) < 0) continue;
+            matched[i] = 1;
+            count++;
+            for (var p = i; p >= 0 && !show[p]; p = parent[p]) show[p] = 1;
+        }
+        rows = [];
+        for (i = 0; i < n; i++) if (show[i]) rows.push(i);
+        viewport.scrollTop = 0;
+        render();
+        showStatus('，匹配 ' + count.toLocaleString() + ' 个');
+    }
+
+    // 点击搜索结果: 退出搜索，展开到该节点并滚动到视口中间
+    function reveal(i) {
+        for (var p = parent[i]; p >= 0; p = parent[p]) expanded[p] = 1;
+        matched = null;
+        searchBox.value = '';
+        focused = i;
+        rebuild();
+        viewport.scrollTop = Math.max(0, rows.indexOf(i) * ROW_HEIGHT - viewport.clientHeight / 2);
+        render();
+        showStatus();
+    }
+
+    list.addEventListener('click', function (e) {
+        var row = e.target.closest('.tree-row');
+        if (!row) return;
+        var i = rows[+row.getAttribute('data-row')];
+        if (matched) {
+            reveal(i);
+        } else if (isDir(i) && nodes[i][7]) {
+            expanded[i] ^= 1;
+            focused = i;
+            refresh();
+        }
+    });
+
+    var pending = false;
+    viewport.addEventListener('scroll', function () {
+        if (pending) return;
+        pending = true;
+        requestAnimationFrame(function () { pending = false; render(); });
+    });
+
+    var timer = null;
+    searchBox.addEventListener('input', function () {
+        clearTimeout(timer);
+        timer = setTimeout(function () { search(searchBox.value); }, 150);
+    });
+
+    document.getElementById('tree-expand').addEventListener('click', function () {
+        for (var i = 0; i < n; i++) if (isDir(i)) expanded[i] = 1;
+        searchBox.value = '';
+        matched = null;
+        refresh();
+    });
+
+    document.getElementById('tree-collapse').addEventListener('click', function () {
+        expanded.fill(0);
+        expanded[0] = 1;
+        searchBox.value = '';
+        matched = null;
+        viewport.scrollTop = 0;
+        refresh();
+    });
+
+    // 小项目默认全部展开（与文本目录树一致），大项目只展开根目录
+    if (n <= data.expand_all_max) {
+        for (var k = 0; k < n; k++) if (isDir(k)) expanded[k] = 1;
+    } else if (n) {
+        expanded[0] = 1;
+    }
+    refresh();
+})();
+"""
+
+
+def write_html(out, dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: Dict,
+               top_files: List[FileStats] = None, duplicates: Dict = None, dependencies: Dict = None):
+    """把 HTML 报告流式写入文件对象 out（top_files 为已按代码行数排名的文件）"""
+    write = out.write
     
     # 健康度状态
     def get_health_class(status):
         return {'good': 'good', 'warning': 'warning', 'bad': 'bad', 'info': 'info'}.get(status, '')
     
-    health_rows = ""
-    for key, metric in health.items():
-        if key not in ['large_files', 'low_comment_files']:
-            cls = get_health_class(metric['status'])
-            health_rows += f"""
-            <tr class="{cls}">
-                <td>{metric['desc']}</td>
-                <td>{metric['value']} {metric['unit']}</td>
-            </tr>"""
-    
-    html = f"""<!DOCTYPE html>
+    write(f"""<!DOCTYPE html>
 <html lang="zh-CN">
 <head>
     <meta charset="UTF-8">
@@ -1226,17 +5261,65 @@ def generate_html(dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: D
             border-radius: 8px;
             padding: 20px;
             margin-bottom: 20px;
-            overflow-x: auto;
         }}
         
-        .tree-content {{
+        .tree-toolbar {{
+            display: flex;
+            align-items: center;
+            gap: 10px;
+            margin-bottom: 10px;
+        }}
+        
+        .tree-toolbar input {{
+            flex: 1;
+            max-width: 400px;
+            padding: 6px 10px;
+            background: var(--bg-primary);
+            color: var(--text-primary);
+            border: 1px solid var(--border-color);
+            border-radius: 6px;
+        }}
+        
+        .tree-toolbar button {{
+            padding: 6px 12px;
+            background: var(--bg-tertiary);
+            color: var(--text-primary);
+            border: 1px solid var(--border-color);
+            border-radius: 6px;
+            cursor: pointer;
+        }}
+        
+        .tree-status {{
+            color: var(--text-secondary);
+            font-size: 13px;
+        }}
+        
+        .tree-viewport {{
+            height: 600px;
+            overflow: auto;
             font-family: 'SF Mono', 'Monaco', 'Consolas', monospace;
             font-size: 13px;
-            line-height: 1.8;
-            white-space: pre;
             color: var(--text-primary);
         }}
         
+        .tree-spacer {{
+            position: relative;
+        }}
+        
+        .tree-row {{
+            height: 22px;
+            line-height: 22px;
+            white-space: pre;
+            cursor: default;
+        }}
+        
+        .tree-row.dir {{ cursor: pointer; }}
+        .tree-row:hover {{ background: var(--bg-tertiary); }}
+        .tree-row.match .tree-name {{ color: var(--accent-yellow); }}
+        .tree-row.focused {{ background: rgba(88, 166, 255, 0.15); }}
+        .tree-toggle {{ display: inline-block; width: 16px; color: var(--text-secondary); }}
+        .tree-stats {{ color: var(--text-secondary); }}
+        
         footer {{
             text-align: center;
             color: var(--text-secondary);
@@ -1277,7 +5360,15 @@ def generate_html(dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: D
         <h2>📂 目录结构</h2>
         <p style="color: var(--text-secondary); margin-bottom: 10px;">📖 图例: <code>[代码行|注释行|空行]</code></p>
         <div class="tree-container">
-            <div class="tree-content">{chr(10).join(generate_tree_text(dir_stats))}</div>
+            <div class="tree-toolbar">
+                <input type="search" id="tree-search" placeholder="🔍 搜索文件或目录名">
+                <button type="button" id="tree-expand">全部展开</button>
+                <button type="button" id="tree-collapse">全部折叠</button>
+                <span class="tree-status" id="tree-status">加载中…</span>
+            </div>
+            <div class="tree-viewport" id="tree-viewport">
+                <div class="tree-spacer" id="tree-spacer"><div id="tree-rows"></div></div>
+            </div>
         </div>
         
         <h2>📊 语言统计</h2>
@@ -1293,7 +5384,20 @@ def generate_html(dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: D
                 </tr>
             </thead>
             <tbody>
-                {lang_rows}
+                """)
+    # 语言统计表格行
+    sorted_langs = sorted(lang_stats.values(), key=lambda x: x.code_lines, reverse=True)
+    for ls in sorted_langs:
+        write(f"""
+            <tr>
+                <td>{ls.language}</td>
+                <td>{ls.file_count}</td>
+                <td>{ls.code_lines:,}</td>
+                <td>{ls.comment_lines:,}</td>
+                <td>{ls.blank_lines:,}</td>
+                <td>{format_size(ls.total_size)}</td>
+            </tr>""")
+    write(f"""
                 <tr style="font-weight: bold; background: var(--bg-tertiary);">
                     <td>总计</td>
                     <td>{dir_stats.file_count}</td>
@@ -1344,7 +5448,16 @@ def generate_html(dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: D
                 </tr>
             </thead>
             <tbody>
-                {health_rows}
+                """)
+    for key, metric in health.items():
+        if key not in ['large_files', 'low_comment_files']:
+            cls = get_health_class(metric['status'])
+            write(f"""
+            <tr class="{cls}">
+                <td>{metric['desc']}</td>
+                <td>{metric['value']} {metric['unit']}</td>
+            </tr>""")
+    write("""
             </tbody>
         </table>
         
@@ -1360,19 +5473,154 @@ def generate_html(dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: D
                 </tr>
             </thead>
             <tbody>
-                {top_rows}
+                """)
+    # Top 10 表格行
+    if top_files:
+        for i, f in enumerate(top_files[:10], 1):
+            ratio = f.comment_lines / f.code_lines * 100 if f.code_lines > 0 else 0
+            write(f"""
+            <tr>
+                <td>{i}</td>
+                <td title="{f.path}">{os.path.basename(f.path)}</td>
+                <td>{f.language}</td>
+                <td>{f.code_lines:,}</td>
+                <td>{ratio:.1f}%</td>
+            </tr>""")
+    write("""
+            </tbody>
+        </table>
+        """)
+    # 重复文件
+    if duplicates is not None:
+        write(f"""
+        <h2>📑 重复文件</h2>
+        <p style="color: var(--text-secondary); margin-bottom: 10px;">
+            {duplicates['groups']:,} 组重复，{duplicates['files']:,} 个多余副本，
+            可节省 {format_size(duplicates['bytes_saved'])} / {duplicates['lines_saved']:,} 行
+        </p>
+        <table>
+            <thead>
+                <tr>
+                    <th>副本数</th>
+                    <th>文件</th>
+                    <th>大小</th>
+                    <th>行数</th>
+                    <th>可节省</th>
+                </tr>
+            </thead>
+            <tbody>
+                """)
+        for group in duplicates['top']:
+            write(f"""
+            <tr>
+                <td>{group['count']}</td>
+                <td title="{html_escape(chr(10).join(group['paths']))}">{html_escape(group['paths'][0])}</td>
+                <td>{format_size(group['size'])}</td>
+                <td>{group['lines']:,}</td>
+                <td>{format_size(group['bytes_saved'])}</td>
+            </tr>""")
+        write("""
             </tbody>
         </table>
-        
+        """)
+    # 依赖关系
+    if dependencies is not None:
+        cycles = dependencies['cycles']
+        write(f"""
+        <h2>🕸️ 依赖关系</h2>
+        <p style="color: var(--text-secondary); margin-bottom: 10px;">
+            {dependencies['modules']:,} 个模块，{dependencies['edges']:,} 条依赖，
+            {cycles['count']:,} 个循环依赖（涉及 {cycles['modules']:,} 个模块），
+            {dependencies['unresolved']:,} 个外部依赖
+        </p>
+        <table>
+            <thead>
+                <tr>
+                    <th>被依赖最多的模块</th>
+                    <th>Fan-in</th>
+                    <th>Fan-out</th>
+                </tr>
+            </thead>
+            <tbody>
+                """)
+        for row in dependencies['top_fan_in']:
+            write(f"""
+            <tr>
+                <td>{html_escape(row['module'])}</td>
+                <td>{row['fan_in']:,}</td>
+                <td>{row['fan_out']:,}</td>
+            </tr>""")
+        write("""
+            </tbody>
+        </table>
+        <table>
+            <thead>
+                <tr>
+                    <th>目录</th>
+                    <th>模块数</th>
+                    <th>内部依赖</th>
+                    <th>Fan-in (目录)</th>
+                    <th>Fan-out (目录)</th>
+                </tr>
+            </thead>
+            <tbody>
+                """)
+        for row in dependencies['directories'][:10]:
+            write(f"""
+            <tr>
+                <td>{html_escape(row['path'])}</td>
+                <td>{row['modules']:,}</td>
+                <td>{row['internal_edges']:,}</td>
+                <td>{row['fan_in']:,}</td>
+                <td>{row['fan_out']:,}</td>
+            </tr>""")
+        write("""
+            </tbody>
+        </table>
+        """)
+        if cycles['top']:
+            write("""
+        <table>
+            <thead>
+                <tr>
+                    <th>循环规模</th>
+                    <th>涉及模块</th>
+                </tr>
+            </thead>
+            <tbody>
+                """)
+            for cycle in cycles['top']:
+                more = ' …' if cycle['size'] > len(cycle['modules']) else ''
+                write(f"""
+            <tr>
+                <td>{cycle['size']:,}</td>
+                <td>{html_escape(', '.join(cycle['modules']))}{more}</td>
+            </tr>""")
+            write("""
+            </tbody>
+        </table>
+        """)
+    write(f"""
         <footer>
             <p>Generated by <strong>CodeMetrics v{__version__}</strong> | 
             <a href="https://github.com/codemetrics" style="color: var(--accent-blue);">GitHub</a></p>
         </footer>
     </div>
+    <script type="application/json" id="tree-data">""")
+    # 目录树数据放在页面末尾: 前面的概览和表格先显示，数据解析完再渲染目录树
+    _write_html_tree_data(out, dir_stats)
+    write(f"""</script>
+    <script>{_HTML_TREE_SCRIPT}</script>
 </body>
-</html>"""
-    
-    return html
+</html>""")
+
+
+def generate_html(dir_stats: DirStats, lang_stats: Dict, cocomo: Dict, health: Dict, top_files: List[FileStats] = None,
+                  duplicates: Dict = None, dependencies: Dict = None) -> str:
+    """生成 HTML 报告（top_files 为已按代码行数排名的文件）"""
+    out = io.StringIO()
+    write_html(out, dir_stats, lang_stats, cocomo, health, top_files, duplicates, dependencies)
+    return out.getvalue()
 
 
 def get_script_dir() -> str:
@@ -1438,54 +5686,171 @@ def save_default_config(target_path: str):
     print("   项目配置会覆盖全局配置中的相同项")
 
 
-def save_outputs(dir_stats: DirStats, lang_stats: Dict, 
-                 cocomo: Dict, health: Dict, all_files: List[FileStats], project_name: str):
-    """保存报告到脚本同级目录下的 项目名_output 目录"""
-    
+def get_output_dir(project_name: str) -> str:
+    """获取脚本同级目录下的 项目名_output 目录"""
     script_dir = get_script_dir()
     # 使用项目名命名输出目录
     safe_name = project_name.replace('/', '_').replace('\\', '_')
-    output_dir = os.path.join(script_dir, f"{safe_name}_output")
+    return os.path.join(script_dir, f"{safe_name}_output")
+
+
+# 报告格式: 配置名 -> (显示名, 扩展名, 写出函数)
+REPORT_FORMATS = {
+    'json': ('JSON', '.json', write_json),
+    'markdown': ('Markdown', '.md', write_markdown),
+    'html': ('HTML', '.html', write_html),
+    'snapshot': ('Snapshot', '.snap', write_snapshot),
+}
+
+# JSON 压缩方式 -> 追加的扩展名
+JSON_COMPRESSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def resolve_json_compression(name: Optional[str]) -> Optional[str]:
+    """校验 JSON 压缩方式；当前 Python 不带 compression.zstd 时 zstd 退回 gzip"""
+    if not name:
+        return None
+    if name not in JSON_COMPRESSIONS:
+        raise ValueError(f"未知的 JSON 压缩方式: {name} (可选: {', '.join(JSON_COMPRESSIONS)})")
+    if name == 'zstd' and zstd is None:
+        print(color("⚠️ 当前 Python 不支持 zstd (需要 3.14+)，JSON 报告改用 gzip 压缩", Colors.YELLOW),
+              file=sys.stderr)
+        return 'gzip'
+    return name
+
+
+def _open_report(path: str, compression: Optional[str] = None, binary: bool = False):
+    """打开报告文件（默认文本方式），compression 为 gzip/zstd 时边写边压缩"""
+    if binary:
+        return open(path, 'wb')
+    if compression == 'gzip':
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+    if compression == 'zstd':
+        return zstd.open(path, 'wt', encoding='utf-8')
+    return open(path, 'w', encoding='utf-8')
+
+
+def _write_report(path: str, phase: str, writer, *args, compression: Optional[str] = None,
+                  binary: bool = False):
+    """
+    把报告流式写入文件（渲染与写盘合并计入 --profile 的 phase 阶段）
+    
+    writer 为 REPORT_FORMATS 中的写出函数，
+    报告内容边生成边写入，内存中不保留整份报告。
+    """
+    with profile_phase(phase):
+        with _open_report(path, compression, binary) as f:
+            writer(f, *args)
+    if PROFILER is not None:
+        PROFILER.add_bytes(phase, os.path.getsize(path))
+
+
+def _link_latest(path: str, latest_path: str):
+    """
+    原子地让 latest_path 指向 path
+    
+    先在同一目录下建临时硬链接（文件系统不支持时退回相对符号链接，再不行才复制），
+    再用 os.replace 覆盖旧的 latest 文件: 不复制报告内容，读者也不会看到缺失或写了一半的文件。
+    """
+    # 已指向同一文件时 rename 什么也不做，临时链接会残留
+    if os.path.exists(latest_path) and os.path.samefile(path, latest_path):
+        return
+    tmp_path = f"{latest_path}.tmp{os.getpid()}"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(path, tmp_path)
+    except OSError:
+        try:
+            os.symlink(os.path.basename(path), tmp_path)
+        except OSError:
+            shutil.copy2(path, tmp_path)
+    os.replace(tmp_path, latest_path)
+
+
+def save_outputs(dir_stats: DirStats, lang_stats: Dict, 
+                 cocomo: Dict, health: Dict, top_files: List[FileStats], project_name: str,
+                 duplicates: Dict = None, formats: List[str] = None,
+                 json_compression: Optional[str] = None, parallel: bool = True,
+                 snapshot_meta: Dict = None, timestamped: bool = True,
+                 dependencies: Dict = None):
+    """
+    保存报告到脚本同级目录下的 项目名_output 目录
+    
+    只生成 formats 中列出的格式（默认全部；"terminal" 等非文件格式忽略），
+    多种格式时在线程中并行生成。json_compression 为 gzip/zstd 时 JSON 报告边写边压缩。
+    snapshot_meta 为写入二进制快照的附加信息（配置指纹、扫描耗时等）。
+    latest.* 通过硬链接 + 原子替换指向本次报告，不复制文件内容；timestamped=False
+    时（--watch 刷新）不生成带时间戳的报告，直接写临时文件后原子替换 latest.*。
+    dependencies（依赖关系图）写入 JSON 和 HTML 报告。
+    
+    开启 --profile 时 JSON 报告附带 profile 部分（截至开始保存报告时的耗时分解），
+    且各格式依次生成（阶段计时栈不支持多线程）。
+    """
+    if formats is None:
+        formats = list(REPORT_FORMATS)
+    
+    output_dir = get_output_dir(project_name)
     
     # 创建输出目录
     os.makedirs(output_dir, exist_ok=True)
     
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
-    saved_files = []
-    
-    # JSON
-    json_path = os.path.join(output_dir, f"report_{timestamp}.json")
-    json_content = generate_json(dir_stats, lang_stats, cocomo, health)
-    with open(json_path, 'w', encoding='utf-8') as f:
-        f.write(json_content)
-    saved_files.append(('JSON', json_path))
-    
-    # Markdown
-    md_path = os.path.join(output_dir, f"report_{timestamp}.md")
-    md_content = generate_markdown(dir_stats, lang_stats, cocomo, health, all_files)
-    with open(md_path, 'w', encoding='utf-8') as f:
-        f.write(md_content)
-    saved_files.append(('Markdown', md_path))
-    
-    # HTML
-    html_path = os.path.join(output_dir, f"report_{timestamp}.html")
-    html_content = generate_html(dir_stats, lang_stats, cocomo, health, all_files)
-    with open(html_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
-    saved_files.append(('HTML', html_path))
+    jobs = []
+    for fmt in REPORT_FORMATS:
+        if fmt not in formats:
+            continue
+        label, ext, writer = REPORT_FORMATS[fmt]
+        options = {}
+        if fmt == 'json':
+            profile = PROFILER.report() if PROFILER is not None else None
+            args = (dir_stats, lang_stats, cocomo, health, duplicates, profile, dependencies)
+            options['compression'] = json_compression
+            ext += JSON_COMPRESSIONS.get(json_compression, '')
+        elif fmt == 'snapshot':
+            args = (dir_stats, snapshot_meta)
+            options['binary'] = True
+        elif fmt == 'html':
+            args = (dir_stats, lang_stats, cocomo, health, top_files, duplicates, dependencies)
+        else:
+            args = (dir_stats, lang_stats, cocomo, health, top_files, duplicates)
+        if timestamped:
+            path = os.path.join(output_dir, f"report_{timestamp}{ext}")
+        else:
+            path = os.path.join(output_dir, f"latest{ext}.tmp{os.getpid()}")
+        jobs.append((label, path, ext, f"render {fmt}", writer, args, options))
+    
+    if parallel and len(jobs) > 1 and PROFILER is None:
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            futures = [executor.submit(_write_report, path, phase, writer, *args, **options)
+                       for _, path, _, phase, writer, args, options in jobs]
+            for future in futures:
+                future.result()
+    else:
+        for _, path, _, phase, writer, args, options in jobs:
+            _write_report(path, phase, writer, *args, **options)
     
     # 创建 latest 文件
-    import shutil
-    for fmt, path in saved_files:
-        ext = os.path.splitext(path)[1]
-        latest_path = os.path.join(output_dir, f"latest{ext}")
-        try:
-            if os.path.exists(latest_path):
-                os.remove(latest_path)
-            shutil.copy2(path, latest_path)
-        except:
-            pass
+    saved_files = []
+    with profile_phase('write'):
+        for label, path, ext, _, _, _, _ in jobs:
+            latest_path = os.path.join(output_dir, f"latest{ext}")
+            try:
+                if timestamped:
+                    saved_files.append((label, path))
+                    _link_latest(path, latest_path)
+                else:
+                    saved_files.append((label, latest_path))
+                    os.replace(path, latest_path)
+                # 压缩方式变化后，移除另一种扩展名的旧 latest.json*
+                if ext.startswith('.json'):
+                    for other in ('', *JSON_COMPRESSIONS.values()):
+                        stale = os.path.join(output_dir, f"latest.json{other}")
+                        if f".json{other}" != ext and os.path.lexists(stale):
+                            os.remove(stale)
+            except OSError:
+                pass
     
     return output_dir, saved_files
 
@@ -1513,8 +5878,32 @@ def print_help_and_examples():
 
 {color('📋 可选参数:', Colors.BOLD)}
   -n, --top N            Top N 文件数量 (默认: 10)
+  --top-by KEY           Top N 排序键: code (默认) / size / comment-ratio / blank-ratio
   -e, --exclude PATTERN  额外排除的文件模式 (逗号分隔)
+  -j, --jobs N           并行扫描任务数 (默认: CPU 核数)
+  --pool TYPE            并行方式: process (默认) / thread
+  --io-concurrency N     异步扫描: 最多同时进行 N 个文件系统操作
+                         (适用于 NFS/CIFS 等高延迟的网络文件系统)
   --no-save              不保存报告（默认会自动保存）
+  --compress-json [METHOD]
+                         JSON 报告边写边压缩: gzip (默认) / zstd
+                         (zstd 需要 Python 3.14+，否则退回 gzip)
+  --no-cache             不使用增量扫描缓存（缓存保存在输出目录下）
+  --no-follow-symlinks   跳过符号链接（默认跟随，并自动跳过链接环）
+  --analyze              计算圈复杂度并生成依赖关系图 (默认关闭，解析开销远高于
+                         行数统计；超过 scan.analyze_max_kb 的文件跳过)
+  --git                  只扫描 Git 已跟踪的文件 (直接读取 .git/index，
+                         相同内容按 blob 哈希只统计一次)
+  --stream [FILE]        流式模式: 逐文件输出 NDJSON，内存占用与文件数无关
+                         (默认写入输出目录，FILE 为 - 时输出到标准输出)
+  --history [REV]        历史模式: 沿 REV (默认 HEAD) 的第一父提交链按提交统计
+                         各语言代码行数与 COCOMO 估算，只统计每个提交变化的 blob
+  --history-points N     历史模式终端显示的提交数，等间隔抽取 (默认: 20)
+  --watch                监视模式: 首次扫描后订阅文件变化 (inotify，不可用时轮询)，
+                         只重新统计变化的文件，防抖后刷新 latest.* 报告
+  --profile [MODE]       输出各阶段耗时/调用次数/字节数、按语言分解及最慢的文件
+                         和目录，并写入 JSON 报告；MODE 为 cprofile 或 tracemalloc
+                         时额外把 cProfile/tracemalloc 数据保存到输出目录
   --no-color             禁用颜色输出
   -v, --version          显示版本号
   -h, --help             显示帮助信息
@@ -1536,6 +5925,27 @@ def print_help_and_examples():
   {color('# 显示 Top 20 文件', Colors.GREEN)}
   codemetrics /path/to/project -p embedded -n 20
 
+  {color('# 使用 8 个进程并行扫描大型代码库', Colors.GREEN)}
+  codemetrics /path/to/linux -p embedded -j 8
+
+  {color('# 扫描 NFS 挂载的构建目录，同时进行 64 个文件系统操作', Colors.GREEN)}
+  codemetrics /mnt/nfs/build -p embedded --io-concurrency 64
+
+  {color('# 查看扫描耗时分布，并保存 cProfile 数据', Colors.GREEN)}
+  codemetrics /path/to/project -p embedded --profile cprofile
+
+  {color('# 流式扫描超大目录，NDJSON 输出到标准输出', Colors.GREEN)}
+  codemetrics /path/to/artifacts -p organic --stream - > files.ndjson
+
+  {color('# 分析提交历史，输出每个提交的代码行数与成本估算', Colors.GREEN)}
+  codemetrics /path/to/repo -p embedded --history
+
+  {color('# 持续监视项目，文件保存后自动刷新报告', Colors.GREEN)}
+  codemetrics /path/to/project -p embedded --watch
+
+  {color('# 对比两次扫描保存的快照 (不重新扫描)', Colors.GREEN)}
+  codemetrics diff old.snap new.snap [-n 20] [--json]
+
 {color('⚙️  配置文件:', Colors.BOLD)}
   {script_dir}/config.json
   (编辑此文件可自定义忽略规则)
@@ -1554,12 +5964,222 @@ def print_help_and_examples():
     print(help_text)
 
 
+def run_stream_mode(args, target_path: str, project_name: str,
+                    ignore_patterns: List[str], project_type: str):
+    """
+    流式模式：逐文件写出 NDJSON，终端只显示汇总（不显示目录树）
+    
+    NDJSON 默认写入输出目录下的 report_<时间>.ndjson；指定 '-' 或使用 --no-save
+    时写到标准输出，此时终端汇总改为输出到标准错误。
+    """
+    to_stdout = args.stream == '-' or (not args.stream and args.no_save)
+    if to_stdout:
+        ndjson_path = None
+        out = sys.stdout
+    else:
+        ndjson_path = args.stream
+        if not ndjson_path:
+            output_dir = get_output_dir(project_name)
+            os.makedirs(output_dir, exist_ok=True)
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            ndjson_path = os.path.join(output_dir, f"report_{timestamp}.ndjson")
+        out = open(ndjson_path, 'w', encoding='utf-8')
+    
+    with contextlib.redirect_stdout(sys.stderr if to_stdout else sys.stdout):
+        start_time = time.time()
+        print(color(f"\n🔍 正在流式扫描: {target_path}", Colors.BOLD))
+        
+        try:
+            with profile_phase('scan (stream)'):
+                dir_stats, lang_stats, tracker, top_files = stream_scan(
+                    target_path, out, ignore_patterns, args.jobs, args.pool,
+                    follow_symlinks=not args.no_follow_symlinks, top_n=args.top, top_by=args.top_by,
+                )
+            with profile_phase('analysis'):
+                cocomo = calculate_cocomo(dir_stats.code_lines, project_type)
+                health = calculate_health(dir_stats, tracker)
+            write_ndjson(out, {'type': 'summary', 'cocomo': cocomo, 'health': health})
+        finally:
+            if not to_stdout:
+                out.close()
+        
+        scan_time = time.time() - start_time
+        print(color(f"✅ 扫描完成 ({scan_time:.2f}s)\n", Colors.GREEN))
+        
+        print_language_table(lang_stats)
+        print_cocomo(cocomo)
+        print_health(health)
+        print_top_files(top_files, args.top, args.top_by)
+        if PROFILER is not None:
+            print_profile(PROFILER.report())
+        
+        if ndjson_path:
+            print()
+            print(color(f"NDJSON saved to: {ndjson_path}", Colors.GREEN))
+        print()
+
+
+def run_watch_mode(args, dir_stats: DirStats, watcher, target_path: str, project_name: str,
+                   ignore_patterns: List[str], project_type: str, config: Dict,
+                   json_compression: Optional[str] = None):
+    """
+    监视模式：在首次全量扫描的结果上订阅文件变化，只重新统计变化的文件
+    
+    watcher 须在首次扫描开始前创建（见 main），扫描期间发生的变化留在其事件中，
+    第一次刷新时一并处理，不会遗漏。
+    事件合并到静默 debounce_seconds 秒后才刷新一次：更新目录树与语言汇总、重写
+    latest.* 报告（不再生成带时间戳的报告），终端只输出一行变化摘要。目录与语言
+    汇总按变化的文件增量更新；Top N、健康度和文件索引在保存报告时由全部文件重建，
+    每次刷新 O(文件数)，与重写报告同阶（见 DirIndex）。依赖关系图由
+    各文件已提取的依赖记号重建，只有变化的文件重新解析。等待事件时
+    阻塞在 inotify（或轮询的 sleep）上，没有变化时几乎不占用 CPU。
+    """
+    watch_config = config.get('watch', {})
+    debounce = float(watch_config.get('debounce_seconds', 1.0))
+    follow_symlinks = not args.no_follow_symlinks
+    matcher = get_ignore_matcher(tuple(ignore_patterns))
+    output_config = config.get('output', {})
+    top_n = max(args.top, ScanSummary.TOP_N)
+    
+    live = LiveScan(dir_stats, matcher, follow_symlinks)
+    print(color(f"👀 正在监视 {target_path} ({watcher.name})，按 Ctrl+C 退出", Colors.CYAN))
+    
+    try:
+        while True:
+            changed = watcher.wait(None)
+            if changed == set():
+                continue
+            # 防抖：持续有事件时继续合并，直到静默 debounce 秒
+            while changed is not None:
+                more = watcher.wait(debounce)
+                if not more:
+                    changed = None if more is None else changed
+                    break
+                changed |= more
+            
+            start_time = time.time()
+            old_code = live.root.code_lines
+            count = live.apply(changed) if changed is not None else None
+            if count is None:
+                # inotify 事件队列溢出，变化可能丢失: 重新全量扫描
+                dir_stats = scan_directory(target_path, ignore_patterns, args.jobs, args.pool,
+                                           follow_symlinks=follow_symlinks, top_n=top_n)
+                live = LiveScan(dir_stats, matcher, follow_symlinks)
+                what = "重新扫描"
+            elif count == 0:
+                continue
+            else:
+                what = f"{count:,} 个文件变化"
+            
+            root = live.root
+            if not args.no_save:
+                summary = scan_summary(root)
+                cocomo = calculate_cocomo(root.code_lines, project_type)
+                health = calculate_health(root, summary.health)
+                save_outputs(
+                    root, live.languages, cocomo, health, summary.top_files(ScanSummary.TOP_N),
+                    project_name, find_duplicates(summary.files), output_config.get('formats'),
+                    json_compression, output_config.get('parallel', True),
+                    {'fingerprint': config_fingerprint(config, ignore_patterns),
+                     'project_type': project_type},
+                    timestamped=False,
+                    dependencies=build_dependency_graph(root.path, summary.files, summary.imports)
+                    if ANALYZE_MAX_SIZE is not None else None
+                )
+            delta = root.code_lines - old_code
+            print(f"{color(datetime.now().strftime('%H:%M:%S'), Colors.DIM)}  {what}  "
+                  f"代码 {root.code_lines:,} ({color(f'{delta:+,}', Colors.GREEN if delta >= 0 else Colors.RED)})  "
+                  f"文件 {root.file_count:,}  {color(f'({time.time() - start_time:.2f}s)', Colors.DIM)}")
+    except KeyboardInterrupt:
+        print()
+    finally:
+        watcher.close()
+
+
+def run_history_mode(args, target_path: str, project_name: str, ignore_patterns: List[str],
+                     project_type: str, config: Dict, json_compression: Optional[str] = None):
+    """
+    历史模式：统计第一父提交链上每个提交的代码规模，输出时间序列
+    
+    终端显示抽样的提交；未指定 --no-save 时完整序列写入输出目录下的
+    history_<时间>.json（并链接为 latest_history.json）。
+    """
+    print(color(f"\n🕰️ 正在分析提交历史: {target_path} ({args.history})", Colors.BOLD))
+    start_time = time.time()
+    cache = None
+    if not args.no_cache:
+        cache = open_scan_cache(get_output_dir(project_name), config, ignore_patterns)
+    try:
+        series = analyze_git_history(target_path, ignore_patterns, args.history, project_type,
+                                     args.jobs, args.pool, cache)
+    except ValueError as e:
+        print(color(f"❌ 错误: {e}", Colors.RED), file=sys.stderr)
+        sys.exit(1)
+    finally:
+        # 历史模式只使用 blob 缓存，不能据此淘汰文件条目
+        if cache is not None:
+            cache.close(complete=False)
+    print(color(f"✅ 分析完成 ({time.time() - start_time:.2f}s)，共 {len(series):,} 个提交", Colors.GREEN))
+    
+    print_history(series, args.history_points)
+    
+    if not args.no_save:
+        output_dir = get_output_dir(project_name)
+        os.makedirs(output_dir, exist_ok=True)
+        ext = '.json' + JSON_COMPRESSIONS.get(json_compression, '')
+        path = os.path.join(output_dir, f"history_{datetime.now().strftime('%Y%m%d_%H%M%S')}{ext}")
+        meta = {'root': target_path, 'rev': args.history, 'project_type': project_type,
+                'commit_count': len(series)}
+        _write_report(path, 'render history', write_history_json, series, meta,
+                      compression=json_compression)
+        try:
+            _link_latest(path, os.path.join(output_dir, f"latest_history{ext}"))
+        except OSError:
+            pass
+        print()
+        print(color(f"History saved to: {path}", Colors.GREEN))
+    print()
+
+
+def run_diff(argv: List[str]) -> int:
+    """codemetrics diff old.snap new.snap: 对比两个快照，不重新扫描"""
+    parser = argparse.ArgumentParser(prog='codemetrics diff',
+                                     description='对比两个 CodeMetrics 快照 (.snap) 的目录与语言统计')
+    parser.add_argument('old', help='旧快照文件')
+    parser.add_argument('new', help='新快照文件')
+    parser.add_argument('--top', '-n', type=int, default=20, help='显示变化最大的 N 个目录 (默认: 20)')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出完整对比结果')
+    parser.add_argument('--no-color', action='store_true', help='禁用颜色输出')
+    args = parser.parse_args(argv)
+    
+    global USE_COLORS
+    if args.no_color:
+        USE_COLORS = False
+    
+    try:
+        with Snapshot(args.old) as old, Snapshot(args.new) as new:
+            diff = diff_snapshots(old, new)
+    except (OSError, ValueError) as e:
+        print(color(f"❌ 错误: {e}", Colors.RED), file=sys.stderr)
+        return 1
+    
+    if args.json:
+        print(json.dumps(diff, indent=2, ensure_ascii=False))
+    else:
+        print_snapshot_diff(diff, args.top)
+    return 0
+
+
 def main():
     # 如果没有参数，显示帮助
     if len(sys.argv) == 1:
         print_help_and_examples()
         sys.exit(0)
     
+    # 子命令: codemetrics diff old.snap new.snap（分析名为 diff 的目录请写成 ./diff）
+    if sys.argv[1:2] == ['diff']:
+        sys.exit(run_diff(sys.argv[2:]))
+    
     parser = argparse.ArgumentParser(
         description='CodeMetrics - 代码度量分析工具',
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -1571,8 +6191,35 @@ def main():
                         default=None, help='COCOMO 项目类型 (必需)')
     parser.add_argument('--no-save', action='store_true', help='不保存报告（默认会保存）')
     parser.add_argument('--top', '-n', type=int, default=10, help='Top N 文件数量 (默认: 10)')
+    parser.add_argument('--top-by', choices=list(RANK_KEYS), default='code',
+                        help='Top N 文件的排序键 (默认: code)')
     parser.add_argument('--exclude', '-e', type=str, default='', help='额外排除的模式 (逗号分隔)')
+    parser.add_argument('--no-cache', action='store_true', help='不使用增量扫描缓存')
+    parser.add_argument('--analyze', action='store_true',
+                        help='计算圈复杂度并生成依赖关系图 (明显慢于只统计行数)')
+    parser.add_argument('--git', action='store_true', help='只扫描 Git 已跟踪的文件 (直接读取 .git/index)')
+    parser.add_argument('--stream', nargs='?', const='', default=None, metavar='FILE',
+                        help='流式模式: 逐文件输出 NDJSON (FILE 为 - 时输出到标准输出)')
+    parser.add_argument('--history', nargs='?', const='HEAD', default=None, metavar='REV',
+                        help='历史模式: 按提交统计代码规模的变化 (默认 HEAD 的第一父提交链)')
+    parser.add_argument('--history-points', type=int, default=20, metavar='N',
+                        help='历史模式终端显示的提交数，等间隔抽取 (默认: 20，完整序列见报告)')
+    parser.add_argument('--watch', action='store_true',
+                        help='监视模式: 首次扫描后只重新统计变化的文件并刷新 latest.* 报告')
+    parser.add_argument('--no-follow-symlinks', action='store_true', help='跳过符号链接（默认跟随并检测链接环）')
     parser.add_argument('--no-color', action='store_true', help='禁用颜色输出')
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                        help='并行扫描任务数 (默认: CPU 核数)')
+    parser.add_argument('--pool', choices=['process', 'thread'], default='process',
+                        help='并行方式: process (进程池) / thread (线程池)')
+    parser.add_argument('--io-concurrency', type=int, default=0, metavar='N',
+                        help='异步扫描: 最多同时进行 N 个文件系统操作 (适用于 NFS/CIFS 等网络文件系统)')
+    parser.add_argument('--profile', nargs='?', const='phases', default=None,
+                        choices=['phases', 'cprofile', 'tracemalloc'], metavar='MODE',
+                        help='输出各阶段耗时分解；MODE 为 cprofile/tracemalloc 时额外保存剖析数据')
+    parser.add_argument('--compress-json', nargs='?', const='gzip', default=None,
+                        choices=list(JSON_COMPRESSIONS), metavar='METHOD',
+                        help='压缩 JSON 报告: gzip (默认) / zstd (需要 Python 3.14+，否则退回 gzip)')
     parser.add_argument('--version', '-v', action='store_true', help='显示版本号')
     parser.add_argument('--help', '-h', action='store_true', help='显示帮助信息')
     
@@ -1625,8 +6272,29 @@ def main():
         print("示例: codemetrics /path/to/project -p embedded")
         sys.exit(1)
     
+    if args.watch and (args.git or args.stream is not None):
+        print(color("❌ 错误: --watch 不能与 --git / --stream 同时使用", Colors.RED), file=sys.stderr)
+        sys.exit(1)
+    if args.history is not None and (args.watch or args.git or args.stream is not None):
+        print(color("❌ 错误: --history 不能与 --watch / --git / --stream 同时使用", Colors.RED), file=sys.stderr)
+        sys.exit(1)
+    
     # 加载全局配置文件
     config = load_config()
+    scan_config = config.setdefault('scan', {})
+    set_mmap_threshold(int(scan_config.get('mmap_threshold_mb', 32) * 1024 * 1024))
+    if args.analyze:
+        scan_config['analyze'] = True  # 计入配置指纹，缓存的结果随之失效
+    set_analyze_max_size(int(scan_config.get('analyze_max_kb', 512) * 1024)
+                         if scan_config.get('analyze', False) else None)
+    
+    # 报告输出设置
+    output_config = config.get('output', {})
+    try:
+        json_compression = resolve_json_compression(args.compress_json or output_config.get('json_compression'))
+    except ValueError as e:
+        print(color(f"❌ 错误: {e}", Colors.RED), file=sys.stderr)
+        sys.exit(1)
     
     # 获取排除规则
     ignore_patterns = config.get('exclude', {}).get('patterns', [])
@@ -1639,53 +6307,133 @@ def main():
     # 项目类型 (必需参数，已在上面检查)
     project_type = args.project_type
     
+    # 性能剖析
+    project_name = os.path.basename(target_path)
+    profile_collector = None
+    if args.profile:
+        enable_profiling(args.top)
+        profile_collector = start_profile_dump(args.profile)
+    
+    # 历史模式
+    if args.history is not None:
+        run_history_mode(args, target_path, project_name, ignore_patterns, project_type, config,
+                         json_compression)
+        finish_profile_dump(args.profile, profile_collector, get_output_dir(project_name))
+        return
+    
+    # 流式模式
+    if args.stream is not None:
+        run_stream_mode(args, target_path, project_name, ignore_patterns, project_type)
+        finish_profile_dump(args.profile, profile_collector, get_output_dir(project_name))
+        return
+    
+    # --watch 先安装监视再首次扫描，扫描期间的变化不会遗漏
+    watcher = None
+    if args.watch:
+        watcher = create_watcher(target_path, get_ignore_matcher(tuple(ignore_patterns)),
+                                 not args.no_follow_symlinks,
+                                 float(config.get('watch', {}).get('poll_interval_seconds', 5.0)))
+    
     # 开始扫描
     start_time = time.time()
     
     print(color(f"\n🔍 正在扫描: {target_path}", Colors.BOLD))
     
-    dir_stats = scan_directory(target_path, ignore_patterns)
-    lang_stats = collect_by_language(dir_stats)
-    all_files = collect_all_files(dir_stats)
-    cocomo = calculate_cocomo(dir_stats.code_lines, project_type)
-    health = calculate_health(dir_stats, all_files)
+    # 增量扫描缓存位于输出目录，与是否保存报告无关（--no-save 时同样使用）
+    cache = None
+    if not args.no_cache:
+        cache = open_scan_cache(get_output_dir(project_name), config, ignore_patterns)
+    
+    # 排名堆同时满足终端 Top N 和报告中的 Top 10
+    top_n = max(args.top, ScanSummary.TOP_N)
+    scanned = False
+    try:
+        if args.git:
+            try:
+                dir_stats = scan_git_tree(target_path, ignore_patterns, args.jobs, args.pool, cache, top_n)
+            except ValueError as e:
+                print(color(f"❌ 错误: {e}", Colors.RED), file=sys.stderr)
+                sys.exit(1)
+        elif args.io_concurrency > 0:
+            dir_stats = scan_directory_async(target_path, ignore_patterns, args.io_concurrency, cache,
+                                             follow_symlinks=not args.no_follow_symlinks, top_n=top_n)
+        else:
+            dir_stats = scan_directory(target_path, ignore_patterns, args.jobs, args.pool, cache,
+                                       follow_symlinks=not args.no_follow_symlinks, top_n=top_n)
+        scanned = True
+    finally:
+        # 中断或出错时也保留已写入的缓存条目
+        if cache is not None:
+            cache.close(complete=scanned)
+    # 语言统计、文件索引、Top N 与健康度计数已在扫描时同一遍累计
+    summary = scan_summary(dir_stats)
+    lang_stats = summary.languages
+    with profile_phase('analysis'):
+        top_files = summary.top_files(ScanSummary.TOP_N)
+        cocomo = calculate_cocomo(dir_stats.code_lines, project_type)
+        health = calculate_health(dir_stats, summary.health)
+        duplicates = find_duplicates(summary.files)
+        dependencies = build_dependency_graph(dir_stats.path, summary.files, summary.imports) \
+            if ANALYZE_MAX_SIZE is not None else None
     
     scan_time = time.time() - start_time
     
     # 默认保存报告（除非指定 --no-save）
     if not args.no_save:
-        project_name = os.path.basename(target_path)
         output_dir, saved_files = save_outputs(
-            dir_stats, lang_stats, cocomo, health, all_files, project_name
+            dir_stats, lang_stats, cocomo, health, top_files, project_name, duplicates,
+            output_config.get('formats'), json_compression, output_config.get('parallel', True),
+            {'fingerprint': config_fingerprint(config, ignore_patterns), 'scan_seconds': round(scan_time, 3),
+             'project_type': project_type},
+            dependencies=dependencies
         )
     
     # 终端输出 - 显示完整报告
-    print(color(f"✅ 扫描完成 ({scan_time:.2f}s)\n", Colors.GREEN))
-    
-    # 1. 目录树
-    print(color("📂 目录结构", Colors.BOLD))
-    print(color("📖 图例: [代码行|注释行|空行]", Colors.DIM))
-    print(color("─" * 80, Colors.DIM))
-    print_tree(dir_stats, show_details=True)
-    
-    # 2. 语言统计表
-    print_language_table(lang_stats)
-    
-    # 3. COCOMO 成本估算
-    print_cocomo(cocomo)
-    
-    # 4. 健康度指标
-    print_health(health)
+    print(color(f"✅ 扫描完成 ({scan_time:.2f}s)", Colors.GREEN))
+    if cache is not None:
+        print(color(f"   缓存命中 {cache.hits:,}/{cache.hits + cache.misses:,} 个文件", Colors.DIM))
+    print()
     
-    # 5. Top N 文件
-    print_top_files(all_files, args.top)
+    with profile_phase('print'):
+        # 1. 目录树
+        print(color("📂 目录结构", Colors.BOLD))
+        print(color("📖 图例: [代码行|注释行|空行]", Colors.DIM))
+        print(color("─" * 80, Colors.DIM))
+        print_tree(dir_stats, show_details=True)
+        
+        # 2. 语言统计表
+        print_language_table(lang_stats)
+        
+        # 3. COCOMO 成本估算
+        print_cocomo(cocomo)
+        
+        # 4. 健康度指标
+        print_health(health)
+        
+        # 5. Top N 文件
+        print_top_files(summary.top_files(args.top, args.top_by), args.top, args.top_by)
+        
+        # 6. 重复文件
+        print_duplicates(duplicates)
+        
+        # 7. 依赖关系图（开启 --analyze 时）
+        if dependencies is not None:
+            print_dependencies(dependencies)
     
     # 显示保存位置
     if not args.no_save:
         print()
         print(color(f"Report saved to: {output_dir}", Colors.GREEN))
     
+    if PROFILER is not None:
+        print_profile(PROFILER.report())
+        finish_profile_dump(args.profile, profile_collector, get_output_dir(project_name))
+    
     print()
+    
+    if args.watch:
+        run_watch_mode(args, dir_stats, watcher, target_path, project_name, ignore_patterns, project_type,
+                       config, json_compression)
 
 
 if __name__ == '__main__':
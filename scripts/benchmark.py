@@ -0,0 +1,761 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CodeMetrics 性能基准测试
+
+用法:
+    python3 scripts/benchmark.py ignore [--names N] [--repeat R]
+    python3 scripts/benchmark.py count [--lines N] [--repeat R] [--dir PATH] [--include PATH]
+    python3 scripts/benchmark.py analyze [--dir PATH] [--repeat R]
+    python3 scripts/benchmark.py io [--dir PATH] [--latency MS] [--concurrency N]
+    python3 scripts/benchmark.py suite [--files N] [--depth D] [--output FILE] [--baseline FILE]
+    python3 scripts/benchmark.py store [--files N]
+"""
+
+import os
+import sys
+import argparse
+import builtins
+import contextlib
+import fnmatch
+import io
+import json
+import math
+import platform
+import random
+import shutil
+import sysconfig
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import codemetrics  # noqa: E402
+
+
+# ============================================================================
+# 忽略规则匹配
+# ============================================================================
+def legacy_should_ignore(path, ignore_patterns):
+    """旧版 should_ignore：每次调用重建规则列表并逐条 fnmatch"""
+    name = os.path.basename(path)
+    all_patterns = list(codemetrics.DEFAULT_IGNORE_PATTERNS) + ignore_patterns
+    for pattern in all_patterns:
+        if fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+
+
+def make_entry_names(count: int, seed: int = 42):
+    """生成模拟目录条目名（源文件、被忽略文件、目录名混合）"""
+    rng = random.Random(seed)
+    exts = ['.c', '.h', '.py', '.js', '.go', '.rs', '.md', '.o', '.png', '.min.js', '.json', '']
+    dirs = ['src', 'include', 'node_modules', 'build', 'tests', 'docs', 'vendor', 'lib']
+    names = []
+    for i in range(count):
+        if rng.random() < 0.1:
+            names.append(rng.choice(dirs))
+        else:
+            names.append(f"file_{i}{rng.choice(exts)}")
+    return names
+
+
+def bench_ignore(args):
+    """对比旧版逐条 fnmatch 与预编译匹配器的吞吐量"""
+    patterns = codemetrics.load_config().get('exclude', {}).get('patterns', [])
+    names = make_entry_names(args.names)
+
+    def run(func):
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for name in names:
+                func(name)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    legacy_time = run(lambda name: legacy_should_ignore(name, patterns))
+    wrapper_time = run(lambda name: codemetrics.should_ignore(name, patterns))
+    matcher = codemetrics.get_ignore_matcher(tuple(patterns))
+    matcher_time = run(lambda name: matcher.match(name, name))
+
+    # 非路径规则的匹配结果必须与旧实现一致
+    mismatches = [n for n in names if legacy_should_ignore(n, patterns) != matcher.match(n)]
+
+    print(f"条目数: {len(names):,}  规则数: {len(patterns) + len(codemetrics.DEFAULT_IGNORE_PATTERNS)}")
+    print(f"{'实现':<24} {'耗时(s)':>10} {'条目/秒':>14} {'加速比':>8}")
+    for label, elapsed in [('legacy fnmatch loop', legacy_time),
+                           ('should_ignore()', wrapper_time),
+                           ('IgnoreMatcher.match()', matcher_time)]:
+        print(f"{label:<24} {elapsed:>10.4f} {len(names) / elapsed:>14,.0f} {legacy_time / elapsed:>7.1f}x")
+    print(f"结果不一致: {len(mismatches)}")
+    return 1 if mismatches else 0
+
+
+# ============================================================================
+# 行分类
+# ============================================================================
+def legacy_count_lines_in_buffer(data: bytes, language: str):
+    """旧版逐行状态机实现（行为基准）"""
+    style = codemetrics.COMMENT_STYLES.get(language, codemetrics.DEFAULT_COMMENT_STYLE)
+    
+    total = 0
+    code = 0
+    comment = 0
+    blank = 0
+    in_block_comment = False
+    
+    text = data.decode('utf-8', errors='ignore')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = text.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    
+    for line in lines:
+        total += 1
+        stripped = line.strip()
+        
+        # 空行
+        if not stripped:
+            blank += 1
+            continue
+        
+        # 块注释处理
+        if in_block_comment:
+            comment += 1
+            if style['block_end'] and style['block_end'] in stripped:
+                in_block_comment = False
+            continue
+        
+        # 检查块注释开始
+        if style['block_start'] and style['block_start'] in stripped:
+            # 检查是否同行结束
+            if style['block_end'] and style['block_end'] in stripped:
+                # 同行开始和结束，如 /* comment */
+                idx_start = stripped.find(style['block_start'])
+                idx_end = stripped.find(style['block_end'])
+                if idx_end > idx_start:
+                    # 检查块注释外是否有代码
+                    before = stripped[:idx_start].strip()
+                    after = stripped[idx_end + len(style['block_end']):].strip()
+                    if before or after:
+                        code += 1
+                    else:
+                        comment += 1
+                    continue
+            else:
+                in_block_comment = True
+                # 检查块注释开始前是否有代码
+                idx = stripped.find(style['block_start'])
+                if stripped[:idx].strip():
+                    code += 1
+                else:
+                    comment += 1
+                continue
+        
+        # 行注释
+        if style['line'] and stripped.startswith(style['line']):
+            comment += 1
+            continue
+        
+        # 代码行
+        code += 1
+    
+    return total, code, comment, blank
+
+
+def make_c_source(lines: int, seed: int = 42) -> bytes:
+    """生成模拟 C 源文件（代码、行注释、块注释、空行混合）"""
+    rng = random.Random(seed)
+    snippets = [
+        b'    int value = compute(a, b);',
+        b'    if (value > 0) {',
+        b'    }',
+        b'    // single line comment',
+        b'/* one-line block comment */',
+        b'',
+        b'static const char *name = "x/*y*/z";',
+        b'    return value * 2; /* trailing */',
+    ]
+    out = []
+    while len(out) < lines:
+        if rng.random() < 0.03:
+            out.append(b'/*')
+            out.extend(b' * block comment body' for _ in range(rng.randint(1, 6)))
+            out.append(b' */')
+        else:
+            out.append(rng.choice(snippets))
+    return b'\n'.join(out[:lines]) + b'\n'
+
+
+def real_c_headers(include_dir: str = None) -> bytes:
+    """真实的 C 源码：当前 Python 的 C API 头文件（文档注释密集），找不到时为空"""
+    include_dir = include_dir or sysconfig.get_paths().get('include') or ''
+    chunks = []
+    for dir_path, _, names in sorted(os.walk(include_dir)):
+        for name in sorted(names):
+            if name.endswith('.h'):
+                with open(os.path.join(dir_path, name), 'rb') as f:
+                    chunks.append(f.read())
+    return b''.join(chunks)
+
+
+def bench_count(args):
+    """
+    对比旧版逐行状态机与批量行分类器的吞吐量，并校验结果一致
+
+    除合成的 C 源文件外，另测 suite 使用的 C / Python / Shell 源文件和真实的 C
+    头文件：批量统计只在包含块注释起始符的行上逐行修正，这类行较多的内容（如
+    文档注释密集的头文件）改用单遍逐行判断，加速比取决于这类行的比例。
+    """
+    rng = random.Random(42)
+    datasets = [('C (dense /* */)', 'C', make_c_source(args.lines))]
+    datasets += [(f'{language} (suite)', language, make_source(language, args.lines, rng))
+                 for language in ('C', 'Python', 'Shell')]
+    headers = real_c_headers(args.include)
+    if headers:
+        datasets.append(('C (Python headers)', 'C', headers))
+
+    def run(func, data, language):
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            result = func(data, language)
+            best = min(best, time.perf_counter() - start)
+        return best, result
+
+    mismatches = 0
+    print(f"行数: {args.lines:,}")
+    print(f"{'数据':<20} {'MB':>6} {'旧版(s)':>10} {'新版(s)':>10} {'MB/秒':>8} {'加速比':>8}")
+    for label, language, data in datasets:
+        legacy_time, legacy_result = run(legacy_count_lines_in_buffer, data, language)
+        new_time, new_result = run(codemetrics.count_lines_in_buffer, data, language)
+        if legacy_result != new_result:
+            mismatches += 1
+        mb = len(data) / 1024 / 1024
+        print(f"{label:<20} {mb:>6.1f} {legacy_time:>10.4f} {new_time:>10.4f} "
+              f"{mb / new_time:>8.1f} {legacy_time / new_time:>7.1f}x")
+
+    if args.dir:
+        files = codemetrics.collect_all_files(
+            codemetrics.scan_directory(args.dir, jobs=1))
+        checked = 0
+        for f in files:
+            try:
+                with open(f.path, 'rb') as fp:
+                    content = fp.read()
+            except OSError:
+                continue
+            checked += 1
+            if (legacy_count_lines_in_buffer(content, f.language)
+                    != codemetrics.count_lines_in_buffer(content, f.language)):
+                mismatches += 1
+                print(f"  不一致: {f.path}")
+        print(f"目录校验: {checked} 个文件")
+    print(f"结果不一致: {mismatches}")
+    return 1 if mismatches else 0
+
+
+# ============================================================================
+# 圈复杂度与依赖提取
+# ============================================================================
+# (语言, 源码, 期望的各函数圈复杂度)
+COMPLEXITY_GOLDEN = [
+    ('Python', b'def f(a):\n    if a and b:\n        return [x for x in a if x]\n'
+               b'    def g():\n        while a:\n            pass\n', [5, 2]),
+    ('C', b'int f(int a) { if (a && b) return 1; while (x) {} return 0; }\n'
+          b'struct s { int a; };\nint g(void) { return h(1, 2) ? 1 : 0; }\n', [4, 2]),
+    ('Go', b'func f() {\n\tfor _, v := range list(x) {\n\t\tif err := g(v); err != nil {\n'
+           b'\t\t}\n\t}\n}\n', [3]),
+    # 作为参数传入的回调各自记为函数
+    ('JavaScript', b"app.get('/', (req, res) => { if (a) { b() } })\n", [2]),
+    ('JavaScript', b"function top() {\n  describe('x', function () {\n"
+                   b"    it('y', function () { if (q) {} })\n  })\n}\n", [1, 1, 2]),
+    ('JavaScript', b'foo(bar(), {x: 1});\nclass A { m(a) { return a || b; } }\n', [2]),
+]
+
+
+def bench_analyze(args):
+    """
+    校验圈复杂度的已知结果，并对比 analyze_source 与行数统计的耗时
+
+    分析默认关闭（--analyze 开启），这里给出开启后每种语言的额外开销。
+    """
+    mismatches = 0
+    for language, source, expected in COMPLEXITY_GOLDEN:
+        text = source.decode('utf-8')
+        if language == 'Python':
+            functions = codemetrics._python_analysis(text)[0]
+        else:
+            functions = codemetrics._c_family_complexity(text, language)
+        if functions != expected:
+            mismatches += 1
+            print(f"  不一致 ({language}): {functions} != {expected}: {text[:40]!r}")
+    print(f"已知结果: {len(COMPLEXITY_GOLDEN)} 例")
+
+    def run(func, datas, language):
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            for data in datas:
+                func(data, language)
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    # 按语言汇总目录中真实源文件的耗时（合成内容没有函数，不具代表性）
+    sources = defaultdict(list)
+    for f in codemetrics.collect_all_files(codemetrics.scan_directory(args.dir, jobs=1)):
+        if f.language in codemetrics.DEPENDENCY_KINDS or f.language in codemetrics.COMPLEXITY_LANGUAGES:
+            try:
+                with open(f.path, 'rb') as fp:
+                    sources[f.language].append(fp.read())
+            except OSError:
+                continue
+
+    saved = codemetrics.ANALYZE_MAX_SIZE
+    codemetrics.set_analyze_max_size(sys.maxsize)
+    try:
+        print(f"目录: {args.dir}")
+        print(f"{'语言':<14} {'文件':>6} {'MB':>6} {'行统计(s)':>10} {'分析(s)':>10} {'倍数':>8}")
+        for language, datas in sorted(sources.items(), key=lambda kv: -sum(map(len, kv[1]))):
+            count_time = run(codemetrics.count_lines_in_buffer, datas, language)
+            analyze_time = run(codemetrics.analyze_source, datas, language)
+            mb = sum(map(len, datas)) / 1024 / 1024
+            print(f"{language:<14} {len(datas):>6} {mb:>6.1f} {count_time:>10.4f} "
+                  f"{analyze_time:>10.4f} {analyze_time / count_time:>7.1f}x")
+    finally:
+        codemetrics.set_analyze_max_size(saved)
+    print(f"结果不一致: {mismatches}")
+    return 1 if mismatches else 0
+
+
+# ============================================================================
+# 高延迟文件系统
+# ============================================================================
+@contextlib.contextmanager
+def slow_filesystem(latency: float):
+    """模拟网络文件系统：os.scandir / os.stat / open 每次调用前等待 latency 秒"""
+    originals = {'scandir': os.scandir, 'stat': os.stat}
+    real_open = builtins.open
+    
+    def delayed(func):
+        def wrapper(*args, **kwargs):
+            time.sleep(latency)
+            return func(*args, **kwargs)
+        return wrapper
+    
+    os.scandir = delayed(originals['scandir'])
+    os.stat = delayed(originals['stat'])
+    codemetrics.open = delayed(real_open)
+    try:
+        yield
+    finally:
+        os.scandir = originals['scandir']
+        os.stat = originals['stat']
+        del codemetrics.open
+
+
+def snapshot(dir_stats):
+    """扫描结果中可比较的部分"""
+    return [(f.path, f.language, f.size, f.total_lines, f.code_lines, f.comment_lines, f.blank_lines)
+            for f in codemetrics.collect_all_files(dir_stats)]
+
+
+def bench_io(args):
+    """在模拟的高延迟文件系统上对比串行、线程池与异步扫描"""
+    patterns = codemetrics.load_config().get('exclude', {}).get('patterns', [])
+    expected = snapshot(codemetrics.scan_directory(args.dir, patterns))
+    
+    runs = [
+        ('serial', lambda: codemetrics.scan_directory(args.dir, patterns, jobs=1)),
+        (f'thread pool (-j {args.concurrency})',
+         lambda: codemetrics.scan_directory(args.dir, patterns, jobs=args.concurrency, pool='thread')),
+        (f'async (--io-concurrency {args.concurrency})',
+         lambda: codemetrics.scan_directory_async(args.dir, patterns, args.concurrency)),
+    ]
+    
+    print(f"目录: {args.dir}  文件数: {len(expected):,}  每次系统调用延迟: {args.latency} ms")
+    print(f"{'实现':<32} {'耗时(s)':>10} {'文件/秒':>10} {'加速比':>8}")
+    mismatches = 0
+    baseline = None
+    with slow_filesystem(args.latency / 1000):
+        for label, run in runs:
+            start = time.perf_counter()
+            result = snapshot(run())
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            if result != expected:
+                mismatches += 1
+                label += ' (结果不一致)'
+            print(f"{label:<32} {elapsed:>10.3f} {len(expected) / elapsed:>10,.0f} {baseline / elapsed:>7.1f}x")
+    print(f"结果不一致: {mismatches}")
+    return 1 if mismatches else 0
+
+
+# ============================================================================
+# 合成仓库与全流程基准
+# ============================================================================
+DEFAULT_LANGUAGE_MIX = 'C:30,C/C++ Header:10,Python:25,JavaScript:15,Go:10,Shell:5,Rust:5'
+
+# 被忽略文件：一部分落在忽略目录中，一部分按扩展名忽略
+IGNORED_DIRS = ['node_modules', 'build', '__pycache__']
+IGNORED_EXTS = ['.o', '.pyc', '.png', '.so']
+
+
+def parse_language_mix(spec: str) -> List[Tuple[str, str, float]]:
+    """解析 "语言:权重,..." 为 [(语言, 扩展名, 权重)]"""
+    ext_by_language = {}
+    for ext, language in codemetrics.LANGUAGE_EXTENSIONS.items():
+        ext_by_language.setdefault(language, ext)
+    mix = []
+    for item in spec.split(','):
+        language, _, weight = item.strip().rpartition(':')
+        if language not in ext_by_language:
+            raise ValueError(f"未知语言: {language}")
+        mix.append((language, ext_by_language[language], float(weight)))
+    return mix
+
+
+def make_source(language: str, lines: int, rng: random.Random) -> bytes:
+    """按语言的注释风格生成源文件（代码、行注释、块注释、空行混合）"""
+    style = codemetrics.COMMENT_STYLES.get(language, codemetrics.DEFAULT_COMMENT_STYLE)
+    line_token = style['line'] or style['block_start']
+    out = []
+    while len(out) < lines:
+        r = rng.random()
+        if r < 0.15:
+            out.append('')
+        elif r < 0.30 and line_token:
+            out.append(f"{line_token} comment {len(out)}")
+        elif r < 0.33 and style['block_start']:
+            out.append(style['block_start'])
+            out.extend(f"   block comment body {i}" for i in range(rng.randint(1, 5)))
+            out.append(style['block_end'])
+        else:
+            out.append(f"    value_{len(out)} = compute({rng.randint(0, 999)}, value_{len(out) // 2})")
+    return ('\n'.join(out[:lines]) + '\n').encode('utf-8')
+
+
+def generate_repo(root: str, files: int = 2000, depth: int = 4, fanout: int = 4,
+                  language_mix: str = DEFAULT_LANGUAGE_MIX, median_lines: int = 120,
+                  size_sigma: float = 1.0, binary_ratio: float = 0.02,
+                  ignored_ratio: float = 0.10, seed: int = 42) -> Dict:
+    """
+    生成确定性的合成代码仓库
+    
+    Args:
+        root: 目标目录（需为空或不存在）
+        files: 文件总数
+        depth: 目录最大深度
+        fanout: 每层子目录数
+        language_mix: 语言权重，如 "C:50,Python:50"
+        median_lines: 源文件行数中位数（对数正态分布）
+        size_sigma: 对数正态分布的 sigma，越大越长尾
+        binary_ratio: 二进制文件比例
+        ignored_ratio: 应被忽略的文件比例
+        seed: 随机种子，相同参数生成完全相同的目录树
+    
+    Returns:
+        生成参数与统计信息
+    """
+    rng = random.Random(seed)
+    mix = parse_language_mix(language_mix)
+    languages = [m[0] for m in mix]
+    weights = [m[2] for m in mix]
+    ext_of = {m[0]: m[1] for m in mix}
+    
+    dirs = ['']
+    level = ['']
+    for d in range(depth):
+        level = [os.path.join(parent, f"dir{d}_{i}") for parent in level for i in range(fanout)]
+        dirs.extend(level)
+    
+    source_files = binary_files = ignored_files = total_bytes = 0
+    for i in range(files):
+        rel_dir = rng.choice(dirs)
+        r = rng.random()
+        if r < ignored_ratio:
+            if rng.random() < 0.5:
+                rel_dir = os.path.join(rel_dir, rng.choice(IGNORED_DIRS))
+                name = f"gen_{i}{ext_of[rng.choice(languages)]}"
+            else:
+                name = f"obj_{i}{rng.choice(IGNORED_EXTS)}"
+            content = rng.getrandbits(8 * 256).to_bytes(256, 'little')
+            ignored_files += 1
+        elif r < ignored_ratio + binary_ratio:
+            name = f"blob_{i}.dat"
+            content = b'\x00' + rng.getrandbits(8 * 4096).to_bytes(4096, 'little')
+            binary_files += 1
+        else:
+            language = rng.choices(languages, weights)[0]
+            name = f"src_{i}{ext_of[language]}"
+            lines = max(1, int(median_lines * math.exp(rng.gauss(0, size_sigma))))
+            content = make_source(language, lines, rng)
+            source_files += 1
+        path = os.path.join(root, rel_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as fp:
+            fp.write(content)
+        total_bytes += len(content)
+    
+    return {
+        'files': files, 'depth': depth, 'fanout': fanout, 'language_mix': language_mix,
+        'median_lines': median_lines, 'size_sigma': size_sigma, 'binary_ratio': binary_ratio,
+        'ignored_ratio': ignored_ratio, 'seed': seed,
+        'source_files': source_files, 'binary_files': binary_files,
+        'ignored_files': ignored_files, 'total_bytes': total_bytes,
+    }
+
+
+def measure(func, repeat: int, setup=None) -> Dict:
+    """重复执行 func，返回最优/平均耗时（秒）"""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'best': min(times), 'mean': sum(times) / len(times), 'runs': repeat}
+
+
+def run_suite(root: str, repeat: int, jobs: int) -> Dict[str, Dict]:
+    """分别测量扫描流程各阶段的耗时"""
+    patterns = codemetrics.load_config().get('exclude', {}).get('patterns', [])
+    results = {}
+    
+    results['scan_directory'] = measure(
+        lambda: codemetrics.scan_directory(root, patterns), repeat)
+    if jobs > 1:
+        results[f'scan_directory[jobs={jobs}]'] = measure(
+            lambda: codemetrics.scan_directory(root, patterns, jobs=jobs), repeat)
+    
+    dir_stats = codemetrics.scan_directory(root, patterns)
+    all_files = codemetrics.collect_all_files(dir_stats)
+    
+    def count_all():
+        for f in all_files:
+            codemetrics.count_lines(f.path, f.language)
+    results['count_lines'] = measure(count_all, repeat)
+    
+    names = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        for name in dirnames + filenames:
+            names.append(os.path.normpath(os.path.join(rel_dir, name)))
+    
+    def ignore_all():
+        for rel_path in names:
+            codemetrics.should_ignore(rel_path, patterns)
+    results['should_ignore'] = measure(ignore_all, repeat)
+    
+    results['collect_by_language'] = measure(lambda: codemetrics.collect_by_language(dir_stats), repeat)
+    results['collect_all_files'] = measure(lambda: codemetrics.collect_all_files(dir_stats), repeat)
+    
+    summary = codemetrics.scan_summary(dir_stats)
+    results['top_files'] = measure(lambda: summary.top_files(codemetrics.ScanSummary.TOP_N), repeat)
+    
+    lang_stats = codemetrics.collect_by_language(dir_stats)
+    top_files = summary.top_files(codemetrics.ScanSummary.TOP_N)
+    cocomo = codemetrics.calculate_cocomo(dir_stats.code_lines)
+    health = codemetrics.calculate_health(dir_stats, summary.health)
+    duplicates = codemetrics.find_duplicates(all_files)
+    results['calculate_health'] = measure(lambda: codemetrics.calculate_health(dir_stats, summary.health), repeat)
+    results['find_duplicates'] = measure(lambda: codemetrics.find_duplicates(all_files), repeat)
+    
+    results['generate_json'] = measure(
+        lambda: codemetrics.generate_json(dir_stats, lang_stats, cocomo, health, duplicates), repeat)
+    results['generate_markdown'] = measure(
+        lambda: codemetrics.generate_markdown(dir_stats, lang_stats, cocomo, health, top_files, duplicates), repeat)
+    results['generate_html'] = measure(
+        lambda: codemetrics.generate_html(dir_stats, lang_stats, cocomo, health, top_files, duplicates), repeat)
+    
+    def print_terminal():
+        with contextlib.redirect_stdout(io.StringIO()):
+            codemetrics.print_tree(dir_stats)
+            codemetrics.print_language_table(lang_stats)
+            codemetrics.print_top_files(top_files)
+    results['terminal_report'] = measure(print_terminal, repeat)
+    return results
+
+
+def compare_with_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float,
+                          min_time: float = 0.005) -> List[str]:
+    """打印与基线的对比，返回超出容差的阶段名（耗时低于 min_time 的阶段噪声太大，不判定回归）"""
+    regressions = []
+    print()
+    print(f"{'阶段':<28} {'基线(s)':>10} {'当前(s)':>10} {'变化':>8}")
+    for name, current in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]['best']
+        after = current['best']
+        change = (after - before) / before if before > 0 else 0.0
+        mark = ''
+        if change > tolerance and after >= min_time:
+            regressions.append(name)
+            mark = '  ⚠ 回归'
+        print(f"{name:<28} {before:>10.4f} {after:>10.4f} {change:>+7.1%}{mark}")
+    return regressions
+
+
+def bench_suite(args):
+    """在合成仓库上测量扫描全流程，输出 JSON 并可与基线对比"""
+    root = args.dir or tempfile.mkdtemp(prefix='codemetrics_bench_')
+    try:
+        if os.listdir(root):
+            print(f"使用已有目录: {root}")
+            repo = {'dir': root}
+        else:
+            repo = generate_repo(root, args.files, args.depth, args.fanout, args.languages,
+                                 args.median_lines, args.size_sigma, args.binary_ratio,
+                                 args.ignored_ratio, args.seed)
+        
+        results = run_suite(root, args.repeat, args.jobs)
+    finally:
+        if not args.dir:
+            shutil.rmtree(root, ignore_errors=True)
+    
+    print(f"{'阶段':<28} {'最优(s)':>10} {'平均(s)':>10}")
+    for name, r in results.items():
+        print(f"{name:<28} {r['best']:>10.4f} {r['mean']:>10.4f}")
+    
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repo': repo,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, indent=2, ensure_ascii=False)
+        print(f"结果已保存: {args.output}")
+    
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as fp:
+            baseline = json.load(fp)
+        if baseline.get('repo') != repo:
+            print("⚠ 基线的合成仓库参数与本次不同，对比结果仅供参考")
+        regressions = compare_with_baseline(results, baseline['results'], args.tolerance, args.min_time)
+        if regressions:
+            print(f"性能回归 (> {args.tolerance:.0%}): {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+# ============================================================================
+# 文件存储内存占用
+# ============================================================================
+def make_file_stats(count: int, seed: int = 42):
+    """生成模拟扫描结果（路径分布在多层目录中）"""
+    rng = random.Random(seed)
+    languages = ['C', 'C/C++ Header', 'Python', 'JavaScript', 'Go']
+    for i in range(count):
+        directory = f"/src/project/module_{i % 97}/sub_{i % 13}/"
+        name = f"file_{i}.c"
+        code = rng.randint(0, 2000)
+        yield codemetrics.FileStats(
+            directory + name, name, rng.choice(languages), code * 30,
+            code + 200, code, 150, 50, digest='%040x' % rng.getrandbits(160))
+
+
+def bench_store(args):
+    """对比每个文件一个 FileStats 对象与列式 FileTable 的内存占用"""
+    def measure_memory(build):
+        tracemalloc.start()
+        start = time.perf_counter()
+        store = build()
+        elapsed = time.perf_counter() - start
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return store, current, elapsed
+    
+    def build_table():
+        table = codemetrics.FileTable()
+        for f in make_file_stats(args.files):
+            table.append(f)
+        return table
+    
+    objects, object_bytes, object_time = measure_memory(lambda: list(make_file_stats(args.files)))
+    table, table_bytes, table_time = measure_memory(build_table)
+    
+    mismatches = sum(1 for a, b in zip(objects, table) if a != b) + abs(len(objects) - len(table))
+    print(f"文件数: {args.files:,}")
+    print(f"{'存储':<24} {'内存':>12} {'字节/文件':>10} {'构建(s)':>10}")
+    for label, nbytes, elapsed in [('list[FileStats]', object_bytes, object_time),
+                                   ('FileTable', table_bytes, table_time)]:
+        print(f"{label:<24} {codemetrics.format_size(nbytes):>12} {nbytes / args.files:>10.0f} {elapsed:>10.3f}")
+    print(f"内存节省: {object_bytes / table_bytes:.1f}x")
+    print(f"结果不一致: {mismatches}")
+    return 1 if mismatches else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CodeMetrics 性能基准测试')
+    sub = parser.add_subparsers(dest='command')
+
+    p = sub.add_parser('ignore', help='忽略规则匹配微基准')
+    p.add_argument('--names', type=int, default=20000, help='条目数量 (默认: 20000)')
+    p.add_argument('--repeat', type=int, default=3, help='重复次数，取最优 (默认: 3)')
+    p.set_defaults(func=bench_ignore)
+
+    p = sub.add_parser('count', help='行分类微基准')
+    p.add_argument('--lines', type=int, default=500000, help='生成的 C 源文件行数 (默认: 500000)')
+    p.add_argument('--repeat', type=int, default=3, help='重复次数，取最优 (默认: 3)')
+    p.add_argument('--dir', help='额外校验该目录下所有文件的统计结果与旧实现一致')
+    p.add_argument('--include', help='真实 C 头文件所在目录 (默认: 当前 Python 的 include 目录)')
+    p.set_defaults(func=bench_count)
+
+    p = sub.add_parser('analyze', help='圈复杂度校验与分析开销')
+    p.add_argument('--dir', default=os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                   help='测量该目录下的源文件 (默认: 仓库根目录)')
+    p.add_argument('--repeat', type=int, default=3, help='重复次数，取最优 (默认: 3)')
+    p.set_defaults(func=bench_analyze)
+
+    p = sub.add_parser('io', help='模拟高延迟文件系统下的扫描吞吐量')
+    p.add_argument('--dir', default=os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                   help='要扫描的目录 (默认: 仓库根目录)')
+    p.add_argument('--latency', type=float, default=2.0, help='每次系统调用的延迟，毫秒 (默认: 2)')
+    p.add_argument('--concurrency', type=int, default=64, help='并发数 (默认: 64)')
+    p.set_defaults(func=bench_io)
+
+    p = sub.add_parser('suite', help='在合成仓库上分阶段测量扫描全流程')
+    p.add_argument('--files', type=int, default=2000, help='文件总数 (默认: 2000)')
+    p.add_argument('--depth', type=int, default=4, help='目录最大深度 (默认: 4)')
+    p.add_argument('--fanout', type=int, default=4, help='每层子目录数 (默认: 4)')
+    p.add_argument('--languages', default=DEFAULT_LANGUAGE_MIX,
+                   help=f'语言权重 (默认: {DEFAULT_LANGUAGE_MIX})')
+    p.add_argument('--median-lines', type=int, default=120, help='源文件行数中位数 (默认: 120)')
+    p.add_argument('--size-sigma', type=float, default=1.0, help='文件大小对数正态分布的 sigma (默认: 1.0)')
+    p.add_argument('--binary-ratio', type=float, default=0.02, help='二进制文件比例 (默认: 0.02)')
+    p.add_argument('--ignored-ratio', type=float, default=0.10, help='应被忽略的文件比例 (默认: 0.10)')
+    p.add_argument('--seed', type=int, default=42, help='随机种子 (默认: 42)')
+    p.add_argument('--repeat', type=int, default=3, help='重复次数，取最优 (默认: 3)')
+    p.add_argument('--jobs', type=int, default=1, help='额外测量 jobs>1 的并行扫描 (默认: 1，不测)')
+    p.add_argument('--dir', help='生成到该目录并保留；目录非空时直接测量其中的文件')
+    p.add_argument('--output', '-o', help='将结果写入 JSON 文件')
+    p.add_argument('--baseline', help='与之前保存的 JSON 结果对比')
+    p.add_argument('--tolerance', type=float, default=0.10,
+                   help='相对基线允许的变慢比例，超出时返回非零 (默认: 0.10)')
+    p.add_argument('--min-time', type=float, default=0.005,
+                   help='耗时低于该值(秒)的阶段不判定回归 (默认: 0.005)')
+    p.set_defaults(func=bench_suite)
+
+    p = sub.add_parser('store', help='文件统计存储的内存占用')
+    p.add_argument('--files', type=int, default=200000, help='文件数量 (默认: 200000)')
+    p.set_defaults(func=bench_store)
+
+    args = parser.parse_args()
+    if not hasattr(args, 'func'):
+        parser.print_help()
+        return 1
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())